@@ -0,0 +1,5 @@
+from app import app as flask_app  # noqa: F401 -- registers the web routes on the connexion app's Flask app
+from rcg.app_prep import connex_app
+from rcg.web.asgi import make_asgi_app
+
+app = make_asgi_app(connex_app)
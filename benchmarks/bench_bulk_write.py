@@ -0,0 +1,62 @@
+"""
+Rows/sec for a 10k-row chart backfill, writing to a scratch copy of the chart table:
+
+- "values string": one formatted INSERT ... VALUES ("..."), how charts used to be written
+- executemany: bulk_insert's default
+- load_data: LOAD DATA LOCAL INFILE (only if MYSQL_LOCAL_INFILE is set and the server allows it)
+
+    python benchmarks/bench_bulk_write.py -n 10000
+"""
+import argparse
+import time
+
+from rcg.config.env import load_env
+from rcg.src.bulk import bulk_config, bulk_insert
+from rcg.src.db import db_query
+from rcg.src.track import CHART_COLUMNS
+
+TABLE = "bench_chart"
+
+
+def make_rows(n):
+    return [
+        (f"Song {i} (feat. O'Neil)", f"song{i:018d}", f"Artist {i % 300}", f"artist{i % 300:016d}",
+         f"2023-{1 + i // 3100 % 12:02d}-{1 + i // 100 % 28:02d}", "37i9dQZF1DX0XUsuxWHRQd")
+        for i in range(n)
+    ]
+
+
+def values_string(rows):
+    q = f"INSERT INTO {TABLE} ({', '.join(CHART_COLUMNS)}) VALUES "
+    q += ",\n\t".join("(" + ", ".join(f'"{v}"' for v in r) + ")" for r in rows) + ";"
+    db_query(q, commit=True)
+
+
+def executemany(rows):
+    bulk_insert(TABLE, CHART_COLUMNS, rows, method="executemany")
+
+
+def load_data(rows):
+    bulk_insert(TABLE, CHART_COLUMNS, rows, method="load_data")
+
+
+if __name__ == "__main__":
+    load_env()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=10000)
+    args = parser.parse_args()
+    rows = make_rows(args.n)
+    methods = [("values string", values_string), ("executemany", executemany)]
+    if bulk_config()["local_infile"]:
+        methods.append(("load_data", load_data))
+    db_query(f"CREATE TABLE IF NOT EXISTS {TABLE} LIKE chart", commit=True)
+    try:
+        for name, method in methods:
+            db_query(f"TRUNCATE TABLE {TABLE}", commit=True)
+            start = time.perf_counter()
+            method(rows)
+            seconds = time.perf_counter() - start
+            written = db_query(f"SELECT COUNT(*) FROM {TABLE}")[0][0]
+            print(f"{name:>14}: {written} rows in {seconds:.2f}s, {written / seconds:,.0f} rows/sec")
+    finally:
+        db_query(f"DROP TABLE {TABLE}", commit=True)
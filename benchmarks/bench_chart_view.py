@@ -0,0 +1,66 @@
+"""
+Compares the single-query load_chart_view against the three-query path the home route used to take
+(make_tally + load_chart + get_chart_stats).
+
+Runs against whatever db the environment points at, with the chart cache bypassed:
+
+    python benchmarks/bench_chart_view.py 2022-12-31 -n 20
+"""
+import argparse
+import statistics
+import time
+
+import rcg.src as src
+from rcg.config.env import load_env
+from rcg.src import get_chart_stats, load_chart, load_chart_view, make_tally
+from rcg.src.cache import chart_cache
+
+
+def count_queries(func, chart_date):
+    """Round trips func makes, counted by wrapping the db_query the loaders call."""
+    calls = []
+    original = src.db_query
+
+    def counting_query(*args, **kwargs):
+        calls.append(args[0])
+        return original(*args, **kwargs)
+
+    src.db_query = counting_query
+    try:
+        func(chart_date)
+    finally:
+        src.db_query = original
+    return len(calls)
+
+
+def three_queries(chart_date):
+    make_tally.__wrapped__(chart_date)
+    load_chart.__wrapped__(chart_date)
+    get_chart_stats.__wrapped__(chart_date)
+
+
+def one_query(chart_date):
+    chart_cache.clear()
+    load_chart_view(chart_date)
+
+
+def bench(func, chart_date, n):
+    func(chart_date)  # warm the pool
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        func(chart_date)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.mean(timings), statistics.median(timings)
+
+
+if __name__ == "__main__":
+    load_env()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("chart_date")
+    parser.add_argument("-n", type=int, default=20)
+    args = parser.parse_args()
+    for name, func in [("three queries", three_queries), ("load_chart_view", one_query)]:
+        round_trips = count_queries(func, args.chart_date)
+        mean, median = bench(func, args.chart_date, args.n)
+        print(f"{name:>16}: {round_trips} round trip(s), mean {mean:.1f}ms, median {median:.1f}ms")
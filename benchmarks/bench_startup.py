@@ -0,0 +1,75 @@
+"""
+How long a fresh worker takes to import the app, and whether it touches the db doing so.
+
+Each run is a new interpreter (as a gunicorn worker would be without preload) in which any db connection
+raises, so a query at import time fails the run. Exits 1 if the median import takes longer than the
+budget (STARTUP_BUDGET_SECONDS, default 1.5). tests/test_startup.py only checks that the heavy imports
+stay lazy, since wall-clock budgets are flaky on loaded CI machines.
+
+    python benchmarks/bench_startup.py -n 5 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP = """
+import time
+start = time.perf_counter()
+import rcg.src.db
+
+def no_db(*args, **kwargs):
+    raise RuntimeError("db connection at startup")
+
+rcg.src.db.make_sql_connection = no_db
+from app import app
+imported = time.perf_counter() - start
+response = app.test_client().get("/testo")
+assert response.status_code == 200, response.status_code
+print(imported, time.perf_counter() - start - imported)
+"""
+
+
+def run_once():
+    """
+    OUTPUT:
+        (import seconds, first request seconds, {module: cumulative import microseconds})
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    imported, first_request = (float(v) for v in result.stdout.split()[-2:])
+    modules = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                modules[module.strip()] = int(cumulative)
+    return imported, first_request, modules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level packages to list")
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET_SECONDS", 1.5)))
+    args = parser.parse_args()
+    runs = [run_once() for _ in range(args.n)]
+    median = statistics.median(r[0] for r in runs)
+    print(f"import: median {median:.3f}s, max {max(r[0] for r in runs):.3f}s over {args.n} runs")
+    print(f"first request: median {statistics.median(r[1] for r in runs) * 1000:.1f}ms")
+    packages = {}
+    for module, cumulative in runs[-1][2].items():
+        if "." not in module:
+            packages[module] = cumulative
+    for module, cumulative in sorted(packages.items(), key=lambda m: -m[1])[:args.top]:
+        print(f"{cumulative / 1e6:8.3f}s  {module}")
+    if median > args.budget:
+        print(f"over budget: {median:.3f}s > {args.budget}s")
+        sys.exit(1)
@@ -1,2 +1,9 @@
+import os
+
 workers = 4
 bind = "0.0.0.0:5000"
+
+# SERVER_MODE=asgi serves asgi:app under uvicorn workers (see rcg/web/asgi.py) instead of app:app
+if os.getenv("SERVER_MODE") == "asgi":
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
@@ -5,26 +5,29 @@ with warnings.catch_warnings():
     warnings.simplefilter("ignore", category=DeprecationWarning)
     import connexion
 
-from dotenv import find_dotenv, load_dotenv
 from flask import Flask
 
+from .config.env import load_env
 from .src.dates import get_date
 
 
-def init_app() -> Flask:
+def init_connexion_app() -> connexion.FlaskApp:
     """
-    Construct core Flask application with embedded Dash app.
+    Construct the connexion app: an ASGI app (see asgi.py) wrapping the core Flask application.
     """
-    load_dotenv()
-    env = ".env.local" if os.getenv("LOCAL", False) else ".env.remote"
-    env_file = find_dotenv(env)
-    load_dotenv(env_file, override=True)
+    load_env()
     dir_ = os.path.abspath(os.path.dirname(__file__))
     connex_app = connexion.App(__name__, specification_dir=dir_)
-    app = connex_app.app
+    # no db work here, so workers boot even if the db is slow; LATEST_CHART_DATE is looked up on first use
     os.environ['TODAY'] = get_date()
-    os.environ['LATEST_CHART_DATE'] = get_date(default_is_today=False)
-    return app
+    return connex_app
+
+
+def init_app() -> Flask:
+    """
+    Construct core Flask application with embedded Dash app.
+    """
+    return init_connexion_app().app
 
 
 def augment_app(app: Flask) -> Flask:
@@ -34,5 +37,5 @@ def augment_app(app: Flask) -> Flask:
         return app
 
 
-app = init_app()
-app = augment_app(app)
+connex_app = init_connexion_app()
+app = augment_app(connex_app.app)
@@ -0,0 +1,166 @@
+"""
+Command line tools, run as `python -m rcg.cli <command>`. Use -l/--local for the local db.
+"""
+import os
+
+import click
+
+from .config.env import load_env
+
+
+@click.group()
+@click.option("-l", "--local", is_flag=True)
+def tools(local):
+    if local:
+        os.environ['LOCAL'] = "True"
+    load_env()
+    print(f"** Tools USING {'LOCAL' if os.getenv('LOCAL') else 'REMOTE'} **")
+    return
+
+
+@tools.command()
+@click.option("--dedupe", is_flag=True, help="drop duplicate rows that block new unique keys")
+def migrate(dedupe):
+    """
+    Applies schema changes (safe to re-run).
+    """
+    from .src.schema import ensure_schema
+    ensure_schema(dedupe)
+    click.echo("schema up to date")
+    return
+
+
+@tools.command()
+@click.option("-c", "--chart-id", default=None, help="default: every chart")
+def rollup(chart_id):
+    """
+    Rebuilds the chart_gender_daily rollup from the chart history (e.g. after editing genders by hand).
+    """
+    from .src.rollup import rebuild_gender_rollup
+    click.echo(f"{rebuild_gender_rollup(chart_id)} rollup rows written")
+    return
+
+
+@tools.command()
+@click.argument("spotify_id")
+@click.argument("gender")
+def gender(spotify_id, gender):
+    """
+    Sets an artist's GENDER and recomputes the rollup of every date the artist charted.
+    """
+    from .src.adding import set_artist_gender
+    refreshed = set_artist_gender(spotify_id, gender)
+    click.echo(f"{spotify_id} gender is now {gender}, "
+               f"{sum(len(d) for d in refreshed.values())} chart dates recomputed")
+    return
+
+
+@tools.command()
+@click.option("-c", "--chart-id", default=None, help="default: every chart")
+def deltas(chart_id):
+    """
+    Rebuilds the chart_delta table (day-over-day adds and removals) from the chart history.
+    """
+    from .src.deltas import rebuild_chart_deltas
+    click.echo(f"{rebuild_chart_deltas(chart_id)} delta rows written")
+    return
+
+
+@tools.command()
+@click.option("-c", "--chart-id", default=None, help="default: every chart")
+def postings(chart_id):
+    """
+    Rebuilds the artist_posting index (artist -> chart dates and songs) from the chart history.
+    """
+    from .src.postings import rebuild_artist_postings
+    click.echo(f"{rebuild_artist_postings(chart_id)} postings written")
+    return
+
+
+@tools.command()
+@click.option("-p", "--playlist", "playlists", multiple=True, help="playlist id/URI/URL, repeatable (default: configured playlists)")
+@click.option("-w", "--workers", type=int, default=None)
+def ingest(playlists, workers):
+    """
+    Ingests today's version of each playlist.
+    """
+    from .src.dates import get_date
+    from .src.scheduler import ingest_playlists
+    os.environ.setdefault('TODAY', get_date())
+    for report in ingest_playlists(list(playlists) or None, workers):
+        click.echo(
+            f"{report.chart_id} {report.chart_date}: {report.tracks} tracks, "
+            f"fetch {report.fetch_seconds}s, write {report.write_seconds}s"
+            + (f", ERROR {report.error}" if report.error else ""))
+    return
+
+
+@tools.command()
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("-c", "--chart-id", default=None, help="default: each dump's own playlist id")
+@click.option("-w", "--workers", type=int, default=None)
+@click.option("-b", "--batch-size", type=int, default=None)
+def backfill(directory, chart_id, workers, batch_size):
+    """
+    Loads dated playlist JSON dumps (e.g. 2023-01-01.json) from DIRECTORY.
+    """
+    from .src.backfill import backfill as run_backfill
+    for k, v in run_backfill(directory, chart_id, workers, batch_size).items():
+        click.echo(f"{k}: {round(v, 3)}")
+    return
+
+
+@tools.command()
+@click.option("-o", "--out", "out_dir", default="site", type=click.Path(file_okay=False), help="default: ./site")
+@click.option("-w", "--workers", type=int, default=None)
+@click.option("-f", "--force", is_flag=True, help="re-render every page, not just the changed ones")
+def export(out_dir, workers, force):
+    """
+    Renders the site's pages to static files (see rcg/web/export.py).
+    """
+    from .web.export import export_site
+    result = export_site(out_dir, workers, force)
+    click.echo(f"{result.rendered} pages rendered, {result.skipped} unchanged, "
+               f"{len(result.failed)} failed in {round(result.seconds, 1)}s")
+    for url, error in result.failed:
+        click.echo(f"  {url}: {error}")
+    return
+
+
+@tools.group()
+def snapshot():
+    """
+    The local read-only snapshot used when SNAPSHOT_PATH is set (see rcg/src/snapshot.py).
+    """
+    return
+
+
+@snapshot.command()
+@click.option("-p", "--path", default=None, help="default: SNAPSHOT_PATH, or .cache/snapshot.sqlite3")
+def refresh(path):
+    """
+    Rebuilds the snapshot from MySQL.
+    """
+    from .src.snapshot import build_snapshot
+    for table, count in build_snapshot(path).items():
+        click.echo(f"{table}: {count} rows")
+    return
+
+
+@snapshot.command()
+@click.option("-p", "--path", default=None, help="default: SNAPSHOT_PATH, or .cache/snapshot.sqlite3")
+def status(path):
+    """
+    Compares the snapshot with MySQL; exits 1 if it's stale.
+    """
+    from .src.snapshot import snapshot_status
+    result = snapshot_status(path)
+    for field, value in result._asdict().items():
+        click.echo(f"{field}: {value}")
+    if result.stale:
+        raise SystemExit(1)
+    return
+
+
+if __name__ == "__main__":
+    tools()
@@ -7,3 +7,11 @@ COLORS = {
 GENDERS = ['Male', 'Female', 'Non-Binary']
 
 RAP_CAVIAR_PATH = "https://open.spotify.com/playlist/37i9dQZF1DX0XUsuxWHRQd"
+
+RAP_CAVIAR_ID = "37i9dQZF1DX0XUsuxWHRQd"
+
+# playlists ingested by /update/XXYYXX/all and `python -m rcg.cli ingest`, name -> spotify playlist id
+# RCG_PLAYLISTS (comma-separated ids) overrides the list
+PLAYLISTS = {
+    "Rap Caviar": RAP_CAVIAR_ID
+}
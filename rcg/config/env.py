@@ -0,0 +1,14 @@
+import os
+
+from dotenv import find_dotenv, load_dotenv
+
+
+def load_env() -> None:
+    """
+    Loads .env, then .env.local if LOCAL is set or .env.remote otherwise.
+    """
+    load_dotenv()
+    env = ".env.local" if os.getenv("LOCAL", False) else ".env.remote"
+    env_file = find_dotenv(env)
+    load_dotenv(env_file, override=True)
+    return
@@ -1,4 +1,3 @@
-import os
 import re
 from typing import Dict, Union
 
@@ -9,7 +8,7 @@ from flask import Flask
 from plotly.graph_objects import Bar, Figure
 
 from rcg.src import get_chart_stats
-from rcg.src.dates import verify_date
+from rcg.src.dates import latest_chart_date, verify_date
 
 from ..config.config import COLORS
 
@@ -44,12 +43,12 @@ def init_callbacks(dash_app):
     )
     def reload_graphs(chart_date: Union[str, None]):
         if chart_date is None:
-            chart_date = os.getenv("LATEST_CHART_DATE", "BAD DATE")
+            chart_date = latest_chart_date()
         chart_date = re.sub(r"^\?", "", chart_date)
         try:
             verify_date(chart_date)
         except AssertionError:
-            chart_date = os.getenv("LATEST_CHART_DATE", "BAD DATE")
+            chart_date = latest_chart_date()
         return bar_grapher_generator(chart_date)
 
 
@@ -0,0 +1,84 @@
+from typing import Union
+
+from dash import callback, html, register_page
+from dash.dcc import DatePickerRange, Graph, RadioItems
+from dash.dependencies import Input, Output
+from plotly.graph_objects import Bar, Figure
+
+from rcg.config.config import COLORS, GENDERS
+from rcg.src.dates import get_date, latest_chart_date
+from rcg.src.trend import RESOLUTIONS, get_trend
+
+register_page(__name__)
+
+
+def layout(**kwargs):
+    """
+    Built per request, and without queries: dash also calls it to validate callbacks before the first
+    request. The default dates (the 90 days up to the latest chart) are filled in by update_trend.
+    """
+    return html.Div([
+        html.Div([
+            DatePickerRange(
+                id="trend-dates",
+                display_format="YYYY-MM-DD"
+            ),
+            RadioItems(
+                id="trend-resolution",
+                options=list(RESOLUTIONS),
+                value="daily",
+                inline=True
+            ),
+            RadioItems(
+                id="trend-measure",
+                options=["Normalized", "Total"],
+                value="Normalized",
+                inline=True
+            )
+        ], className="trend-controls"),
+        Graph(id="trend-graph", config={'displayModeBar': False})
+    ])
+
+
+@callback(
+    Output("trend-graph", "figure"),
+    Input("trend-dates", "start_date"),
+    Input("trend-dates", "end_date"),
+    Input("trend-resolution", "value"),
+    Input("trend-measure", "value")
+)
+def update_trend(
+        start_date: Union[str, None],
+        end_date: Union[str, None],
+        resolution: str,
+        measure: str
+) -> Figure:
+    end_date = (end_date or latest_chart_date())[:10]
+    start_date = (start_date or get_date(end_date, 90))[:10]
+    trend = get_trend(start_date, end_date, resolution)
+    dates = [p["date"] for p in trend["points"]]
+    fig = Figure([
+        Bar(
+            x=dates,
+            y=[p[g.lower()[0]][measure] for p in trend["points"]],
+            name=g,
+            marker_color=COLORS[g]
+        ) for g in GENDERS
+    ])
+    fig.update_layout(
+        barmode='stack',
+        title={
+            'text': "% of Artist Credits" if measure == "Normalized" else "Artist Credits per Chart",
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': {'color': 'white', 'family': 'Arial'}
+        },
+        yaxis_range=[0, 100] if measure == "Normalized" else None,
+        margin=dict(t=70, r=20, l=20, b=30),
+        paper_bgcolor="black",
+        plot_bgcolor="black",
+        legend=dict(font=dict(color='white')),
+        yaxis=dict(color='white', ticksuffix="  "),
+        xaxis=dict(color='white', type='date')
+    )
+    return fig
@@ -1,16 +1,33 @@
 import os
+from collections import Counter, namedtuple
 from itertools import zip_longest
-from typing import Any, Dict, List, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Tuple
 
-import spotipy
-
-from .adding import parse_spotify_chart, parse_spotify_track
+from ..config.config import RAP_CAVIAR_ID
+from .adding import parse_spotify_track
+from .cache import cache_kind, cached_by_date, chart_cache
 from .dates import verify_date
 from .db import db_query
-from .track import Appearance, Chart, Track, make_track_from_appearances
+from .groups import group_index
+from .track import Appearance, Chart, ColumnarChart, Track, parse_chart_id
+
+if TYPE_CHECKING:
+    import spotipy
+
+# everything parse_spotify_track reads, plus the link to the next page
+PLAYLIST_FIELDS = "items(track(name,id,artists(name,id))),next"
 
+ChartView: tuple[Chart, List[Tuple[Any]], Dict[str, Dict[str, float]]] = namedtuple(
+    "ChartView", [
+        "chart",
+        "tally",
+        "stats"
+    ]
+)
 
-def make_tally(chart_date: str) -> List[List[Tuple[Any]]]:
+
+@cached_by_date("tally")
+def make_tally(chart_date: str, chart_id: str = RAP_CAVIAR_ID) -> List[List[Tuple[Any]]]:
     verify_date(chart_date)
     q = """
     SELECT
@@ -22,13 +39,21 @@ def make_tally(chart_date: str) -> List[List[Tuple[Any]]]:
         song ON chart.song_spotify_id = song.song_spotify_id
     INNER JOIN
         artist ON song.artist_spotify_id = artist.spotify_id
-    WHERE chart.chart_date = '{}'
+    WHERE chart.chart_date = %s
+    AND chart.chart_id = %s
     GROUP BY
         artist.artist_name,
         artist.gender,
         artist.spotify_id;
-    """.format(chart_date)
-    tally = db_query(q)
+    """
+    tally = db_query(q, params=(chart_date, parse_chart_id(chart_id)))
+    return format_tally(tally)
+
+
+def format_tally(tally: List[Tuple[Any]]) -> List[List[Tuple[Any]]]:
+    """
+    Splits (artist_name, gender, appearances) rows into male/female/non-binary columns for the template.
+    """
     tally_formatted = [_ for _ in zip_longest(
         [t for t in tally if t[1] == 'm'],
         [t for t in tally if t[1] == 'f'],
@@ -37,12 +62,8 @@ def make_tally(chart_date: str) -> List[List[Tuple[Any]]]:
     return tally_formatted
 
 
-def load_chart(chart_date: str) -> Chart:
-    """
-    Loads a chart from the db and parses it into a Chart object.
-    """
-    verify_date(chart_date)
-    q = """
+# params: chart_date, chart_id
+CHART_QUERY = """
     SELECT
         chart.song_spotify_id,
         chart.song_name,
@@ -52,31 +73,39 @@ def load_chart(chart_date: str) -> Chart:
     FROM chart
     INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
     LEFT JOIN artist ON song.artist_spotify_id=artist.spotify_id
-    WHERE chart_date="{}"
-    """.format(chart_date)
-    q = db_query(q)
+    WHERE chart_date=%s
+    AND chart.chart_id=%s
+    """
+
+
+@cached_by_date("chart")
+def load_chart(chart_date: str, chart_id: str = RAP_CAVIAR_ID) -> Chart:
+    """
+    Loads a chart from the db and parses it into a Chart object.
+    """
+    verify_date(chart_date)
+    q = db_query(CHART_QUERY, params=(chart_date, parse_chart_id(chart_id)))
     appearances = [Appearance._make(result) for result in q]
-    chart_tracks = []
-    for i in set([a.song_spotify_id for a in appearances]):
-        track = make_track_from_appearances([a for a in appearances if a.song_spotify_id == i])
-        chart_tracks.append(track)
-    return Chart(chart_date, chart_tracks)
+    return make_chart_from_appearances(chart_date, appearances, chart_id)
+
+
+def make_chart_from_appearances(chart_date: str, appearances: List[Appearance], chart_id: str = RAP_CAVIAR_ID) -> Chart:
+    return ColumnarChart.from_appearances(chart_date, appearances, chart_id=chart_id)
 
 
-def get_chart_stats(chart_date: str) -> Dict[str, Dict[str, float]]:
+@cached_by_date("stats")
+def get_chart_stats(chart_date: str, chart_id: str = RAP_CAVIAR_ID) -> Dict[str, Dict[str, float]]:
+    """
+    Reads the date's rows of the chart_gender_daily rollup (a primary key lookup).
+    """
     verify_date(chart_date)
-    q = """
-        SELECT
-            gender,
-            COUNT(*) AS total,
-            COUNT(*) / SUM(COUNT(*)) OVER () * 100 AS percentage
-        FROM chart
-        INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
-        LEFT JOIN artist ON song.artist_spotify_id=artist.spotify_id
-        WHERE chart_date="{}"
-        GROUP BY gender
-        """.format(chart_date)
-    count_data = db_query(q)
+    count_data = db_query(
+        "SELECT gender, credits, percentage FROM chart_gender_daily WHERE chart_id=%s AND chart_date=%s",
+        params=(parse_chart_id(chart_id), chart_date))
+    return format_chart_stats(count_data)
+
+
+def format_chart_stats(count_data: List[Tuple[Any]]) -> Dict[str, Dict[str, float]]:
     count_dict = {}
     for gender in ['Male', 'Female', 'Non-Binary']:
         count_dict.update(format_count_data(count_data, gender))
@@ -101,10 +130,84 @@ def format_count_data(count_data, gender):
         }
 
 
-def load_spotipy() -> spotipy.Spotify:
+# params: chart_date, chart_id
+CHART_VIEW_QUERY = """
+    SELECT
+        chart.song_spotify_id,
+        chart.song_name,
+        artist.spotify_id,
+        artist.artist_name,
+        song.primary,
+        artist.gender
+    FROM chart
+    INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
+    LEFT JOIN artist ON song.artist_spotify_id=artist.spotify_id
+    WHERE chart_date=%s
+    AND chart.chart_id=%s
+    """
+
+
+def load_chart_view(chart_date: str, chart_id: str = RAP_CAVIAR_ID) -> ChartView:
+    """
+    Loads everything the chart page needs with one query: the Chart, the tally (as make_tally) and the
+    stats (as get_chart_stats).
+
+    Fills the chart_cache entries for all three, so later calls to the individual loaders are free.
+
+    INPUTS:
+        chart_date (str)
+        chart_id (str)
+
+    OUTPUT:
+        view (ChartView): chart, tally, stats
+    """
+    verify_date(chart_date)
+    chart_id = parse_chart_id(chart_id)
+    cached = [chart_cache.get(chart_date, cache_kind(kind, chart_id)) for kind in ChartView._fields]
+    if all(c is not None for c in cached):
+        return ChartView(*cached)
+    rows = db_query(CHART_VIEW_QUERY, params=(chart_date, chart_id))
+    return _cache_chart_view(make_chart_view(chart_date, rows, chart_id))
+
+
+def _cache_chart_view(view: ChartView) -> ChartView:
+    if view.chart.tracks:
+        for kind, value in view._asdict().items():
+            chart_cache.set(view.chart.chart_date, cache_kind(kind, view.chart.chart_id), value)
+    return view
+
+
+def make_chart_view(chart_date: str, rows: List[Tuple[Any]], chart_id: str = RAP_CAVIAR_ID) -> ChartView:
+    """
+    Derives a ChartView from chart/song/artist join rows of
+    (song_spotify_id, song_name, artist_spotify_id, artist_name, primary, gender).
+
+    Matches the separate queries: the tally only counts artists in the artist table, the stats count
+    every credit (missing artists included) toward the percentages.
+    """
+    appearances = [Appearance._make(r[:5]) for r in rows]
+    chart = make_chart_from_appearances(chart_date, appearances, chart_id)
+
+    artist_counts = Counter(
+        (r[3], r[5], r[2]) for r in rows if r[2] is not None
+    )
+    tally = format_tally([(name, gender, n) for (name, gender, _), n in artist_counts.items()])
+
+    gender_counts = Counter(r[5] for r in rows)
+    count_data = [
+        (gender, n, n / len(rows) * 100) for gender, n in gender_counts.items()
+    ]
+    stats = format_chart_stats(count_data)
+    return ChartView(chart, tally, stats)
+
+
+def load_spotipy() -> "spotipy.Spotify":
     """
     Instantiates Spotipy object w credentials.
+
+    spotipy (and the redis client it pulls in) is imported here, so only ingest pays for it.
     """
+    import spotipy
     spotify_cred_manager = spotipy.oauth2.SpotifyClientCredentials(
         os.environ['SPOTIFY_ID'],
         os.environ['SPOTIFY_SECRET']
@@ -113,6 +216,35 @@ def load_spotipy() -> spotipy.Spotify:
     return sp
 
 
+def iter_playlist_tracks(
+        sp: "spotipy.Spotify",
+        chart_id: str,
+        page_size: int = 100,
+        expand_groups: bool = True
+) -> Iterator[Track]:
+    """
+    Yields the tracks of a playlist as parsed Tracks, one page at a time.
+
+    Only PLAYLIST_FIELDS are requested, and the next page isn't fetched until the current one has been
+    consumed. Items without a track (removed or local files) are skipped.
+
+    INPUTS:
+        sp (spotipy.Spotify)
+        chart_id (str)
+        page_size (int): tracks per request, 100 max
+        expand_groups (bool): False skips group members, so no db is needed (see parse_spotify_track)
+
+    OUTPUT:
+        tracks (Iterator[Track])
+    """
+    page = sp.playlist_items(chart_id, fields=PLAYLIST_FIELDS, limit=page_size, additional_types=("track",))
+    while page:
+        for item in page['items']:
+            if item.get('track') and item['track'].get('id'):
+                yield parse_spotify_track(item, expand_groups)
+        page = sp.next(page) if page.get('next') else None
+
+
 def load_spotify_chart(chart_id: str = 'spotify:playlist:37i9dQZF1DX0XUsuxWHRQd') -> Chart:
     """
     Loads playlist from Spotify at the proivded chart_id. Defaut is for Rap Caviar.
@@ -126,8 +258,8 @@ def load_spotify_chart(chart_id: str = 'spotify:playlist:37i9dQZF1DX0XUsuxWHRQd'
         chart (Chart)
     """
     sp = load_spotipy()
-    rc = sp.playlist(chart_id)
-    chart = parse_spotify_chart(os.getenv("TODAY"), rc)
+    group_index.refresh(force=True)
+    chart = Chart(os.getenv("TODAY"), iter_playlist_tracks(sp, chart_id), chart_id)
     return chart
 
 
@@ -1,28 +1,58 @@
 """Code for adding charts to the database."""
 import os
-from typing import Any, Dict, List
-
-from .dates import get_most_recent_chart_date, DATE_FORMAT
-from .db import db_query
-from .gender import lookup_gender
-from .track import Appearance, Artist, Chart, Track, create_artist
+from typing import Any, Dict, Iterable, List, Set, Tuple, Union
+
+from pymysql.connections import Connection
+
+from ..config.config import RAP_CAVIAR_ID
+from .bulk import bulk_insert
+from .cache import chart_cache
+from .db import db_query, db_query_in, transaction
+from .deltas import refresh_chart_deltas
+from .gender import lookup_gender, resolve_genders
+from .groups import group_index
+from .postings import refresh_artist_postings
+from .rollup import refresh_gender_rollup
+from .schema import require_schema
+from .shared_cache import get_shared_cache
+from .track import (CHART_COLUMNS, Appearance, Artist, Chart, Track,
+                    create_artist)
+from .trend import trend_index
+
+ARTIST_COLUMNS = [
+    "spotify_id",
+    "artist_name",
+    "last_fm_gender",
+    "wikipedia_gender",
+    "gender"
+]
+
+SONG_COLUMNS = [
+    "song_spotify_id",
+    "song_name",
+    "artist_spotify_id",
+    "artist_name",
+    "primary"
+]
 
 
 # for reading from spotipy
-def parse_spotify_track(track: Dict[Any, Any]) -> Track:
+def parse_spotify_track(track: Dict[Any, Any], expand_groups: bool = True) -> Track:
     """
     Creates [Artist] for every artist.
-    Adds any group artists in the db.
+    Adds any group artists in the db (unless expand_groups is False, which needs no db).
 
     Input:
         track (dict): spotify track from chart
+        expand_groups (bool)
 
     Output:
         track_output (Track): input track parsed into Track class
     """
     assert 'track' in track and 'artists' in track['track']
     artists = [create_artist(a['name'], a['id'], i == 0) for i, a in enumerate(track['track']['artists'])]
-    artists = get_group_artists(artists)
+    if expand_groups:
+        artists = get_group_artists(artists)
     return Track(
         track['track']['name'],
         track['track']['id'],
@@ -30,7 +60,12 @@ def parse_spotify_track(track: Dict[Any, Any]) -> Track:
     )
 
 
-def parse_spotify_chart(chart_date: str, raw_chart: Dict[Any, Any]) -> Chart:
+def parse_spotify_chart(
+        chart_date: str,
+        raw_chart: Dict[Any, Any],
+        chart_id: Union[str, None] = None,
+        expand_groups: bool = True
+) -> Chart:
     """
     Converts a spotify chart (dict) into a Chart.
 
@@ -38,20 +73,37 @@ def parse_spotify_chart(chart_date: str, raw_chart: Dict[Any, Any]) -> Chart:
         chart_date (str) - should be current date, but leaving it variable for qc and testing.
             (load_rap_caviar() automatically uses current date)
         raw_chart (dict) - spotify chart
+        chart_id (str) - defaults to the playlist's own id, or Rap Caviar if it doesn't have one
+        expand_groups (bool) - False skips group members (see expand_chart_groups), so no db is needed
 
     OUTPUT:
         parsed_chart (Chart)
     """
     assert 'tracks' in raw_chart
-    tracks = [parse_spotify_track(t) for t in raw_chart['tracks']['items']]
-    parsed_chart = Chart(chart_date, tracks)
+    if expand_groups:
+        group_index.refresh(force=True)
+    tracks = [parse_spotify_track(t, expand_groups) for t in raw_chart['tracks']['items']]
+    parsed_chart = Chart(chart_date, tracks, chart_id or raw_chart.get('id', RAP_CAVIAR_ID))
     return parsed_chart
 
 
+def expand_chart_groups(chart: Chart) -> Chart:
+    """
+    Adds group members to a chart parsed with expand_groups=False.
+    """
+    return Chart(
+        chart.chart_date,
+        [Track(t.song_name, t.song_spotify_id, get_group_artists(t.artists)) for t in chart.tracks],
+        chart.chart_id
+    )
+
+
 def get_group_artists(artists: List[Artist]) -> List[Artist]:
     """
     If artists is a group, get group artists.
 
+    Members come from group_index, so this makes no queries unless group_table has changed.
+
     INPUT:
         artists (list) - list of artists from a Track -- can be a tuple?
 
@@ -61,168 +113,256 @@ def get_group_artists(artists: List[Artist]) -> List[Artist]:
     new_artists = []
     for a in artists:
         new_artists.append(a)
-        group_artists = db_query(
-            f'''
-            SELECT artist_name,artist_spotify_id
-            FROM group_table
-            WHERE group_spotify_id='{a.spotify_id}'
-            ''')
-        if group_artists:
-            new_artists += ([create_artist(a[0], a[1]) for a in group_artists])
+        new_artists += [create_artist(name, spotify_id) for name, spotify_id in group_index.members(a.spotify_id)]
     return new_artists
 
 
 def add_chart_to_db(chart: Chart) -> None:
-    # verify chart does not already exist
-    verification = db_query(f"SELECT count(*) FROM chart WHERE chart_date='{chart.chart_date}'")[0][0]
-    if verification == 0:
-        charting_query = chart.make_charting_query()
-        db_query(charting_query, commit=True)
-    else:
-        print(f"Chart at date {chart.chart_date} already contains {str(verification)} items, not updating charts.")
-    for data_type in ['artists', 'appearances']:
-        verify_data(chart, data_type)
-
-    verify = db_query(f"SELECT count(*) FROM chart WHERE chart_date='{chart.chart_date}'")[0][0]
-    assert verify == len(chart.tracks), str(verify)
-    new_chart_date = get_most_recent_chart_date().strftime(DATE_FORMAT)
-    os.environ['LATEST_CHART_DATE'] = new_chart_date
+    """
+    Writes a chart, plus any artists and song appearances the db doesn't have yet.
+
+    Gender lookups (slow, external) happen first. Then every insert runs in one transaction on one
+    connection, under an advisory lock per chart_id so concurrent updates of a playlist take turns.
+    Artists and appearances are INSERT IGNORE against the unique keys from ensure_schema(). A chart
+    whose (chart_id, chart_date) already has rows is left as it is, even if the playlist has changed
+    since, so re-adding a chart writes nothing and two versions of a day are never merged. The date's
+    chart_gender_daily, chart_delta and artist_posting rows are recomputed in the same transaction,
+    along with the rows of all three on every earlier date a new appearance's song or a new artist
+    charted on (see charted_dates).
+    """
+    require_schema()
+    missing_artists = find_missing_artists(chart)
+    artist_rows = make_artist_rows(missing_artists)
+    appearances = chart.appearances()
+    with transaction(lock_name=f"rcg_ingest:{chart.chart_id}") as conn:
+        new_artists = bulk_insert("artist", ARTIST_COLUMNS, artist_rows, conn=conn, commit=False, ignore=True)
+        # read under the lock, so these are exactly the appearances this transaction adds
+        missing_appearances = find_missing_appearances_in(appearances, conn=conn)
+        new_appearances = bulk_insert(
+            "song", SONG_COLUMNS, [make_appearance_row(a) for a in missing_appearances],
+            conn=conn, commit=False, ignore=True)
+        stored = db_query(
+            "SELECT COUNT(*) FROM chart WHERE chart_id=%s AND chart_date=%s",
+            conn, close=False, params=(chart.chart_id, chart.chart_date))[0][0]
+        new_rows = 0
+        if not stored:
+            new_rows = bulk_insert("chart", CHART_COLUMNS, chart.charting_rows(), conn=conn, commit=False)
+            # raised inside the transaction, so a partial chart is rolled back
+            assert new_rows == len(chart.tracks), \
+                f"wrote {new_rows} of {len(chart.tracks)} tracks of {chart.chart_id} at {chart.chart_date}"
+        refreshed = charted_dates(
+            [a.song_spotify_id for a in missing_appearances], [r[0] for r in artist_rows], conn
+        ) if new_artists or new_appearances else {}
+        if new_rows:
+            refreshed.setdefault(chart.chart_id, set()).add(chart.chart_date)
+        for refreshed_chart_id, chart_dates in refreshed.items():
+            refresh_gender_rollup(refreshed_chart_id, chart_dates, conn)
+            refresh_chart_deltas(refreshed_chart_id, sorted(chart_dates), conn)
+            refresh_artist_postings(refreshed_chart_id, chart_dates, conn)
+    if new_appearances:
+        print(f"added {new_appearances} appearances to song table")
+    if stored:
+        print(f"Chart {chart.chart_id} at date {chart.chart_date} already contains {stored} items, "
+              f"not updating charts.")
+    refreshed.setdefault(chart.chart_id, set()).add(chart.chart_date)
+    invalidate_charts(refreshed)
+    if chart.chart_id == RAP_CAVIAR_ID:
+        os.environ['LATEST_CHART_DATE'] = max(os.getenv('LATEST_CHART_DATE', ''), chart.chart_date)
     return
 
 
-def verify_data(
-        chart: Chart,
-        data_type: str
-) -> None:
-    assert data_type in ['artists', 'appearances']
-    missing = globals()[f"find_missing_{data_type}"](chart)
-    if missing:
-        globals()[f'add_multiple_{data_type}'](missing)
-    missing_check = globals()[f"find_missing_{data_type}"](chart)
-    assert len(missing_check) == 0, missing_check
+def charted_dates(
+        song_spotify_ids: Iterable[str] = (),
+        artist_spotify_ids: Iterable[str] = (),
+        conn: Union[Connection, None] = None
+) -> Dict[str, Set[str]]:
+    """
+    The charts a change to some songs' credits or some artists' rows shows up in: every date on which
+    one of the songs, or a song crediting one of the artists, charted.
+
+    OUTPUT:
+        dates (dict): chart_id -> chart dates
+    """
+    rows: List[Any] = []
+    song_ids, artist_ids = sorted(set(song_spotify_ids)), sorted(set(artist_spotify_ids))
+    if song_ids:
+        rows += db_query_in(
+            "SELECT DISTINCT chart_id, chart_date FROM chart WHERE song_spotify_id IN {}", song_ids, conn=conn)
+    if artist_ids:
+        rows += db_query_in(
+            """
+            SELECT DISTINCT chart.chart_id, chart.chart_date
+            FROM chart
+            INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
+            WHERE song.artist_spotify_id IN {}
+            """, artist_ids, conn=conn)
+    dates: Dict[str, Set[str]] = {}
+    for chart_id, chart_date in rows:
+        dates.setdefault(chart_id, set()).add(chart_date)
+    return dates
+
+
+def invalidate_charts(dates: Dict[str, Iterable[str]]) -> None:
+    """
+    Drops this process's cached data for some charts (chart_id -> dates) and bumps the shared data
+    version, after their rows change.
+    """
+    for chart_id, chart_dates in dates.items():
+        for chart_date in chart_dates:
+            chart_cache.invalidate(chart_date)
+        trend_index.invalidate(chart_id)
+    get_shared_cache().bump_data_version()
     return
 
 
+def set_artist_gender(spotify_id: str, gender: str) -> Dict[str, Set[str]]:
+    """
+    Corrects an artist's gender, and recomputes the chart_gender_daily rows of every date the artist
+    charted, in one transaction.
+
+    A gender changed any other way (by hand, or tools.py) leaves the rollup stale until
+    `python -m rcg.cli rollup` rebuilds it.
+
+    OUTPUT:
+        dates (dict): chart_id -> chart dates whose rollup was recomputed
+    """
+    with transaction() as conn:
+        assert db_query("SELECT 1 FROM artist WHERE spotify_id=%s", conn, close=False, params=(spotify_id,)), \
+            f"no artist {spotify_id}"
+        db_query("UPDATE artist SET gender=%s WHERE spotify_id=%s", conn, close=False, params=(gender, spotify_id))
+        refreshed = charted_dates(artist_spotify_ids=[spotify_id], conn=conn)
+        for chart_id, chart_dates in refreshed.items():
+            refresh_gender_rollup(chart_id, chart_dates, conn)
+    invalidate_charts(refreshed)
+    return refreshed
+
+
 def find_missing_artists(chart: Chart) -> List[Artist]:
     """
+    Only the chart's artist ids are sent to the db, and only the ones found come back.
+
     INPUT:
         chart (Chart)
     OUTPUT:
-        missing_artists (List[Artist])
+        missing_artists (List[Artist]): one per missing spotify_id
     """
-    all_artist_ids = db_query("""
-        SELECT DISTINCT spotify_id from artist
-        """)
+    return find_missing_artists_in(chart.artists())
 
-    return [
-        a for a in chart.artists() if a.spotify_id not in
-        [i[0] for i in all_artist_ids]
-    ]
+
+def find_missing_artists_in(artists: Iterable[Artist], batch_size: int = 500) -> List[Artist]:
+    """
+    find_missing_artists for any collection of artists (e.g. several charts at once), looked up
+    batch_size ids per query.
+    """
+    candidates = {a.spotify_id: a for a in artists}
+    if not candidates:
+        return []
+    found = db_query_in("SELECT spotify_id FROM artist WHERE spotify_id IN {}", list(candidates), batch_size)
+    found_ids = set(i[0] for i in found)
+    return [a for spotify_id, a in candidates.items() if spotify_id not in found_ids]
 
 
-def make_artist_query(artist: Artist) -> str:
+def make_artist_row(artist: Artist, genders: Union[Tuple[str, str, str], None] = None) -> Tuple[str, ...]:
     """
     INPUT:
         artist (Artist)
+        genders (tuple, optional): (lfm_gender, wikipedia_gender, gender), looked up if not provided
 
     OUTPUT:
-        query (str): partial sql string for adding artist to db
+        row (tuple): values for ARTIST_COLUMNS
     """
     print(f"adding {artist.name} to artists")
-    lfm_gender, wikipedia_gender, gender = lookup_gender(artist.name)
-    query = '(' + ", ".join(
-            f'"{p}"' for p in
-            [
-                artist.spotify_id,
-                artist.name, lfm_gender,
-                wikipedia_gender,
-                gender]
-    ) + ")"
-    return query
+    lfm_gender, wikipedia_gender, gender = genders or lookup_gender(artist.name)
+    return (artist.spotify_id, artist.name, lfm_gender, wikipedia_gender, gender)
+
+
+def make_artist_rows(artists: List[Artist]) -> List[Tuple[str, ...]]:
+    """
+    One row per spotify_id, with genders for all artists looked up concurrently (see resolve_genders).
+    """
+    artists = list({a.spotify_id: a for a in artists}.values())
+    if not artists:
+        return []
+    genders = resolve_genders(artists)
+    return [make_artist_row(a, g) for a, g in zip(artists, genders)]
 
 
 def add_multiple_artists(artists: List[Artist]) -> None:
     """
-    Creates a full query to add multiple artists to the database.
-    Checks all artist ids in db against artists to add to verify all have been added.
+    Adds multiple artists to the database in one bulk insert, one row per spotify_id.
 
     INPUT:
         artists (List[Artist])
     """
-    query = """
-        INSERT INTO
-            artist (
-                spotify_id,
-                artist_name,
-                last_fm_gender,
-                wikipedia_gender,
-                gender
-            )
-        VALUES """
-    artist_queries = ",\n\t".join(set([make_artist_query(a) for a in artists]))
-    query = query + artist_queries + ";"
-    db_query(query, commit=True)
+    bulk_insert("artist", ARTIST_COLUMNS, make_artist_rows(artists), ignore=True)
     return
 
 
 def find_missing_appearances(chart: Chart) -> List[Appearance]:
     """
+    Only the chart's (song, artist) pairs are sent to the db, and only the ones found come back.
+
     INPUT:
         chart (Chart)
     OUTPUT:
         missing_appearances (List[Appearance])
     """
-    all_appearances = db_query("""
+    return find_missing_appearances_in(chart.appearances())
+
+
+def find_missing_appearances_in(
+        appearances: List[Appearance],
+        batch_size: int = 500,
+        conn: Union[Connection, None] = None
+) -> List[Appearance]:
+    """
+    find_missing_appearances for any list of appearances (e.g. several charts at once), looked up
+    batch_size pairs per query (on conn, if given).
+    """
+    if not appearances:
+        return []
+    found = db_query_in(
+        """
         SELECT DISTINCT song.song_spotify_id, song.artist_spotify_id
         FROM song
-    """)
+        WHERE (song.song_spotify_id, song.artist_spotify_id) IN {}
+        """,
+        list(set((a.song_spotify_id, a.artist_spotify_id) for a in appearances)),
+        batch_size,
+        conn
+    )
+    found_pairs = set(tuple(f) for f in found)
     return [
-        a for a in chart.appearances()
-        if (a.song_spotify_id, a.artist_spotify_id) not in all_appearances
+        a for a in appearances
+        if (a.song_spotify_id, a.artist_spotify_id) not in found_pairs
     ]
 
 
-def make_appearance_query(appearance: Appearance) -> str:
+def make_appearance_row(appearance: Appearance) -> Tuple[str, ...]:
     """
     INPUT:
         appearance (Appearance)
 
     OUTPUT:
-        query (str): partial sql string for adding appearance to song table
-    """
-    print(f"adding {appearance.song_name}, {appearance.artist_name} to song table")
-    query = '(' + ", ".join(
-            f'"{appearance.__getattribute__(p)}"'
-            for p in
-            [
-                "song_spotify_id",
-                "song_name",
-                "artist_spotify_id",
-                "artist_name",
-                "primary"
-            ]) + ")"
-    return query
+        row (tuple): values for SONG_COLUMNS (primary is stored as text, "True"/"False")
+    """
+    return (
+        appearance.song_spotify_id,
+        appearance.song_name,
+        appearance.artist_spotify_id,
+        appearance.artist_name,
+        str(appearance.primary)
+    )
 
 
 def add_multiple_appearances(appearances: List[Appearance]) -> None:
     """
-    Creates a full query to add multiple appearances to the database.
-    Checks song table to verify all have been added.
+    Adds multiple appearances to the song table in one bulk insert.
 
     INPUT:
         appearances (List[Appearance])
     """
-    query = """
-        INSERT INTO
-            song (
-                song_spotify_id,
-                song_name,
-                artist_spotify_id,
-                artist_name,
-                `primary`
-            )
-        VALUES """
-    appearance_queries = ",\n\t".join([make_appearance_query(a) for a in appearances])
-    query = query + appearance_queries + ";"
-    db_query(query, commit=True)
+    for a in appearances:
+        print(f"adding {a.song_name}, {a.artist_name} to song table")
+    bulk_insert("song", SONG_COLUMNS, [make_appearance_row(a) for a in appearances], ignore=True)
     return
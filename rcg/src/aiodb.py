@@ -0,0 +1,65 @@
+"""
+Async counterpart of db_query, on aiomysql, for the ASGI app (rcg/asgi.py).
+
+One pool per event loop: a uvicorn worker runs a single loop, so its requests share one pool and a
+query waiting on mysql doesn't hold up the worker's other requests.
+"""
+import asyncio
+import os
+from typing import TYPE_CHECKING, Any, Dict, Sequence, Union
+
+from .db import pool_config
+
+if TYPE_CHECKING:
+    from aiomysql import Pool
+
+_POOLS: Dict[asyncio.AbstractEventLoop, "Pool"] = {}
+
+
+async def get_async_pool() -> "Pool":
+    """
+    Returns the running loop's pool, creating it on first use with the sizes from pool_config().
+    """
+    # imported here so aiomysql is only loaded in ASGI mode
+    import aiomysql
+    loop = asyncio.get_running_loop()
+    if loop not in _POOLS:
+        config = pool_config()
+        pool = await aiomysql.create_pool(
+            user=os.environ["MYSQL_USER"],
+            password=os.getenv("MYSQL_PW", ""),
+            host=os.environ["MYSQL_URL"],
+            db=os.environ["MYSQL_DB"],
+            port=3306,
+            minsize=0,
+            maxsize=config["pool_size"] + config["max_overflow"],
+            pool_recycle=config["pool_recycle"],
+            autocommit=True
+        )
+        # another request may have created one while this one was connecting
+        _POOLS.setdefault(loop, pool)
+        if _POOLS[loop] is not pool:
+            pool.close()
+    return _POOLS[loop]
+
+
+async def async_db_query(q: str, params: Union[Sequence[Any], None] = None) -> Any:
+    """
+    Runs a read query on a pooled connection and returns all rows, as db_query does.
+    """
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(q, params)
+            return await cur.fetchall()
+
+
+async def close_async_pool() -> None:
+    """
+    Closes the running loop's pool (at ASGI lifespan shutdown).
+    """
+    pool = _POOLS.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        pool.close()
+        await pool.wait_closed()
+    return
@@ -0,0 +1,200 @@
+"""Bulk loading of past charts from saved playlist JSON."""
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Union
+
+from pymysql.connections import Connection
+
+from ..config.config import RAP_CAVIAR_ID
+from .adding import (ARTIST_COLUMNS, SONG_COLUMNS, charted_dates,
+                     expand_chart_groups, find_missing_appearances_in,
+                     find_missing_artists_in, invalidate_charts,
+                     make_appearance_row, make_artist_rows,
+                     parse_spotify_chart)
+from .bulk import bulk_insert
+from .dates import DATE_FORMAT, get_most_recent_chart_date
+from .db import db_query_in, transaction
+from .deltas import refresh_chart_deltas
+from .groups import group_index
+from .postings import refresh_artist_postings
+from .rollup import refresh_gender_rollup
+from .track import CHART_COLUMNS, Chart
+
+DUMP_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def find_dumps(directory: str) -> List[Tuple[str, str]]:
+    """
+    Finds playlist dumps in a directory: .json files with a YYYY-MM-DD date in their name.
+
+    Several dumps can share a date (e.g. one per playlist); each dump's chart_id is only known once
+    it's parsed.
+
+    OUTPUT:
+        dumps (list): (chart_date, path), in file name order
+    """
+    dumps = []
+    for file_name in sorted(os.listdir(directory)):
+        match = DUMP_DATE.search(file_name)
+        if file_name.endswith(".json") and match:
+            dumps.append((match.group(0), os.path.join(directory, file_name)))
+    return dumps
+
+
+def parse_dump(chart_date: str, path: str, chart_id: Union[str, None] = None) -> Chart:
+    """
+    Parses one dump without touching the db (group members are added later, in the parent process).
+
+    Accepts a full playlist object (as sp.playlist returns) or a bare page of playlist items.
+    Items without a track are dropped.
+    """
+    with open(path) as f:
+        raw_chart = json.load(f)
+    if 'tracks' not in raw_chart:
+        raw_chart = {'tracks': raw_chart}
+    raw_chart['tracks']['items'] = [
+        i for i in raw_chart['tracks']['items'] if i.get('track') and i['track'].get('id')
+    ]
+    return parse_spotify_chart(chart_date, raw_chart, chart_id, expand_groups=False)
+
+
+def backfill(
+        directory: str,
+        chart_id: Union[str, None] = None,
+        max_workers: Union[int, None] = None,
+        batch_size: Union[int, None] = None
+) -> Dict[str, float]:
+    """
+    Loads every dump in a directory into the db.
+
+    Dumps are parsed in a process pool. Dates already in the chart table are skipped. Artists and
+    appearances missing from the db are found and added once for the whole batch, then all chart rows
+    are bulk inserted and the derived tables refreshed, all in one transaction.
+
+    INPUTS:
+        directory (str)
+        chart_id (str): default is each dump's own playlist id, or Rap Caviar
+        max_workers (int): parsing processes, default is one per cpu
+        batch_size (int): rows per executemany call, default BULK_BATCH_SIZE
+
+    OUTPUT:
+        timings (dict): seconds per step, plus counts of charts and rows written
+    """
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    dumps = find_dumps(directory)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        charts = list(executor.map(
+            parse_dump, [d for d, _ in dumps], [p for _, p in dumps], [chart_id] * len(dumps)))
+    group_index.refresh(force=True)
+    charts = [expand_chart_groups(c) for c in charts]
+    charts = _drop_existing(_drop_duplicates(charts, [p for _, p in dumps]))
+    timings['parse'] = time.perf_counter() - start
+
+    # gender lookups (slow, external) before the transaction, as in add_chart_to_db
+    start = time.perf_counter()
+    missing_artists = find_missing_artists_in(a for c in charts for a in c.artists())
+    artist_rows = make_artist_rows(missing_artists)
+    timings['artists'] = time.perf_counter() - start
+
+    # one transaction: a backfill that fails part way leaves no charts without their derived rows
+    # (which _drop_existing would then skip for good on a re-run)
+    with transaction() as conn:
+        start = time.perf_counter()
+        bulk_insert("artist", ARTIST_COLUMNS, artist_rows, conn=conn, commit=False, ignore=True)
+        appearances = list({
+            (a.song_spotify_id, a.artist_spotify_id): a for c in charts for a in c.appearances()
+        }.values())
+        missing_appearances = find_missing_appearances_in(appearances, conn=conn)
+        bulk_insert(
+            "song", SONG_COLUMNS, [make_appearance_row(a) for a in missing_appearances],
+            conn=conn, commit=False, ignore=True)
+        timings['appearances'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = add_multiple_charts(charts, batch_size, conn)
+        timings['charts'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # earlier dates of songs with new appearances (or of new artists) change too
+        refreshed = charted_dates(
+            [a.song_spotify_id for a in missing_appearances], [r[0] for r in artist_rows], conn)
+        for c in charts:
+            refreshed.setdefault(c.chart_id, set()).add(c.chart_date)
+        for refreshed_chart_id, chart_dates in refreshed.items():
+            refresh_gender_rollup(refreshed_chart_id, chart_dates, conn)
+        timings['rollup'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for refreshed_chart_id, chart_dates in refreshed.items():
+            refresh_chart_deltas(refreshed_chart_id, sorted(chart_dates), conn)
+        timings['deltas'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for refreshed_chart_id, chart_dates in refreshed.items():
+            refresh_artist_postings(refreshed_chart_id, chart_dates, conn)
+        timings['postings'] = time.perf_counter() - start
+
+    if refreshed:
+        invalidate_charts(refreshed)
+    if any(c.chart_id == RAP_CAVIAR_ID for c in charts):
+        os.environ['LATEST_CHART_DATE'] = get_most_recent_chart_date().strftime(DATE_FORMAT)
+    timings.update({
+        'dumps': len(dumps),
+        'charts_written': len(charts),
+        'chart_rows': rows,
+        'new_artists': len(missing_artists),
+        'new_appearances': len(missing_appearances)
+    })
+    return timings
+
+
+def _drop_duplicates(charts: List[Chart], paths: List[str]) -> List[Chart]:
+    """
+    Keeps one chart per (chart_id, chart_date), from the last of its dumps, so two versions of a
+    playlist's day aren't merged into one chart.
+    """
+    latest: Dict[Tuple[str, str], Tuple[Chart, str]] = {}
+    for chart, path in zip(charts, paths):
+        key = (chart.chart_id, chart.chart_date)
+        if key in latest:
+            print(f"Chart {chart.chart_id} at date {chart.chart_date} is in {latest[key][1]} and {path}, using {path}.")
+        latest[key] = (chart, path)
+    return [chart for chart, _ in latest.values()]
+
+
+def _drop_existing(charts: List[Chart]) -> List[Chart]:
+    """
+    Leaves out charts whose (chart_id, chart_date) already has rows.
+    """
+    if not charts:
+        return charts
+    existing = set(
+        tuple(r) for r in db_query_in(
+            "SELECT DISTINCT chart_id, chart_date FROM chart WHERE (chart_id, chart_date) IN {}",
+            list(set((c.chart_id, c.chart_date) for c in charts))
+        )
+    )
+    for c in charts:
+        if (c.chart_id, c.chart_date) in existing:
+            print(f"Chart {c.chart_id} at date {c.chart_date} already exists, skipping.")
+    return [c for c in charts if (c.chart_id, c.chart_date) not in existing]
+
+
+def add_multiple_charts(
+        charts: List[Chart],
+        batch_size: Union[int, None] = None,
+        conn: Union[Connection, None] = None
+) -> int:
+    """
+    Inserts the tracks of several charts in one bulk insert (inside conn's open transaction, if given).
+
+    OUTPUT:
+        rows (int): chart rows written
+    """
+    return bulk_insert(
+        "chart", CHART_COLUMNS, (r for c in charts for r in c.charting_rows()),
+        conn=conn, commit=conn is None, batch_size=batch_size, ignore=True)
@@ -0,0 +1,138 @@
+"""
+Server-side Total/Normalized bar charts, as standalone SVG.
+
+Replaces the dash bars page for home.html: the SVGs are rendered once per chart date, then kept in
+chart_cache and on disk (BAR_CACHE_DIR), so a page view inlines them without building any figures.
+"""
+import hashlib
+import math
+import os
+import tempfile
+from collections import namedtuple
+from html import escape
+from typing import Dict, List
+
+from ..config.config import COLORS, GENDERS, RAP_CAVIAR_ID
+from . import get_chart_stats
+from .cache import cached_by_date
+from .shared_cache import shared_by_date
+from .track import parse_chart_id
+
+BarCharts = namedtuple("BarCharts", ["stats", "total", "normalized"])
+
+# bump when the drawing changes, so svgs cached on disk by older code aren't reused
+RENDER_VERSION = 1
+
+WIDTH = 330
+HEIGHT = 400
+MARGIN = dict(t=70, r=20, l=45, b=30)
+
+
+def bar_cache_dir() -> str:
+    return os.getenv("BAR_CACHE_DIR", os.path.join(os.getcwd(), ".cache", "bars"))
+
+
+def tick_step(y_max: float, max_ticks: int = 6) -> float:
+    """
+    Smallest step of 1, 2 or 5 times a power of ten giving at most max_ticks gridlines up to y_max.
+    """
+    magnitude = 10 ** math.floor(math.log10(y_max / max_ticks))
+    return next(m * magnitude for m in [1, 2, 5, 10] if y_max / (m * magnitude) <= max_ticks)
+
+
+def render_bar_svg(count_data: Dict[str, float], normalize: bool, chart_date: str) -> str:
+    """
+    Draws what make_bar_graph (dash/dashboard.py) does: one bar per gender on black, value above each bar.
+
+    INPUTS:
+        count_data (dict): gender code ('m', 'f', 'n') -> value
+        normalize (bool): values are percentages
+        chart_date (str): for the title
+
+    OUTPUT:
+        svg (str)
+    """
+    title = "% of Artist Credits" if normalize else "Total Artist Credits"
+    y_max = 110 if normalize else (max(count_data.values()) * 1.2 or 1)
+    plot_w = WIDTH - MARGIN['l'] - MARGIN['r']
+    plot_h = HEIGHT - MARGIN['t'] - MARGIN['b']
+    slot = plot_w / len(GENDERS)
+
+    def y(value: float) -> float:
+        return MARGIN['t'] + plot_h * (1 - value / y_max)
+
+    parts: List[str] = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {WIDTH} {HEIGHT}" width="{WIDTH}" height="{HEIGHT}" '
+        f'font-family="Arial" role="img" aria-label="{escape(title)} ({escape(chart_date)})">',
+        f'<rect width="{WIDTH}" height="{HEIGHT}" fill="black"/>',
+        f'<text x="{WIDTH / 2}" y="28" fill="white" font-size="17" text-anchor="middle">{escape(title)}</text>',
+        f'<text x="{WIDTH / 2}" y="50" fill="white" font-size="17" text-anchor="middle">({escape(chart_date)})</text>'
+    ]
+    step = tick_step(y_max)
+    tick = 0.0
+    while tick <= y_max:
+        parts.append(
+            f'<line x1="{MARGIN["l"]}" x2="{WIDTH - MARGIN["r"]}" y1="{y(tick):.1f}" y2="{y(tick):.1f}" '
+            f'stroke="#444" stroke-width="1"/>'
+            f'<text x="{MARGIN["l"] - 8}" y="{y(tick) + 4:.1f}" fill="white" font-size="12" '
+            f'text-anchor="end">{tick:g}</text>'
+        )
+        tick += step
+    for i, g in enumerate(GENDERS):
+        value = count_data.get(g.lower()[0], 0)
+        x = MARGIN['l'] + slot * (i + 0.1)
+        label = f"{value:.1f}%" if normalize else f"{value:g}"
+        parts.append(
+            f'<rect x="{x:.1f}" y="{y(value):.1f}" width="{slot * 0.8:.1f}" height="{y(0) - y(value):.1f}" '
+            f'fill="{COLORS[g]}"><title>{g}: {label}</title></rect>'
+            f'<text x="{x + slot * 0.4:.1f}" y="{y(value) - 6:.1f}" fill="white" font-size="13" '
+            f'text-anchor="middle">{label}</text>'
+            f'<text x="{x + slot * 0.4:.1f}" y="{HEIGHT - MARGIN["b"] + 18}" fill="white" font-size="12" '
+            f'text-anchor="middle">{g}</text>'
+        )
+    parts.append('</svg>')
+    return "".join(parts)
+
+
+def _disk_path(chart_id: str, chart_date: str, kind: str, stats: Dict[str, Dict[str, float]]) -> str:
+    # named by a digest of what's drawn, so an svg of a date that's since changed is never served
+    digest = hashlib.sha1(repr((RENDER_VERSION, sorted(stats.items()))).encode()).hexdigest()[:12]
+    return os.path.join(bar_cache_dir(), chart_id, f"{chart_date}-{kind}-{digest}.svg")
+
+
+def _read_or_render(path: str, render) -> str:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        pass
+    svg = render()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(path), delete=False) as f:
+            f.write(svg)
+        os.replace(f.name, path)
+    except OSError:
+        pass  # a read-only or full disk only costs a re-render
+    return svg
+
+
+@cached_by_date("bars")
+@shared_by_date("bars")
+def get_bar_charts(chart_date: str, chart_id: str = RAP_CAVIAR_ID) -> BarCharts:
+    """
+    The Total and Normalized bar SVGs of a chart, from memory, disk, or rendered (in that order).
+
+    OUTPUT:
+        bars (BarCharts): the stats drawn, and the two svgs
+    """
+    chart_id = parse_chart_id(chart_id)
+    stats = get_chart_stats(chart_date, chart_id)
+    svgs = {}
+    for kind, normalize in [("total", False), ("normalized", True)]:
+        count_data = {g: v['Normalized' if normalize else 'Total'] for g, v in stats.items()}
+        svgs[kind] = _read_or_render(
+            _disk_path(chart_id, chart_date, kind, stats),
+            lambda: render_bar_svg(count_data, normalize, chart_date)
+        )
+    return BarCharts(stats, svgs["total"], svgs["normalized"])
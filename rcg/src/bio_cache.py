@@ -0,0 +1,120 @@
+"""On-disk cache of artist bios and the gender verdicts derived from them."""
+import os
+import sqlite3
+import threading
+import time
+from typing import Tuple, Union
+
+NEGATIVE_VERDICTS = ['l', 'p', 'd', 'x']  # not found on last.fm, no page, disambiguation, no bio
+
+
+class BioCache:
+    """
+    sqlite-backed cache keyed by (provider, artist name).
+
+    Verdicts in NEGATIVE_VERDICTS expire after negative_ttl seconds, everything else after ttl, so a
+    missing page is retried sooner than a found one is refetched. Past max_entries, the least recently
+    used entries are dropped.
+
+    INPUTS:
+        path (str): sqlite file, or ":memory:"
+        ttl (float): seconds to keep a bio-derived verdict
+        negative_ttl (float): seconds to keep a not-found verdict
+        max_entries (int)
+    """
+
+    def __init__(
+            self,
+            path: str,
+            ttl: float = 90 * 24 * 3600,
+            negative_ttl: float = 7 * 24 * 3600,
+            max_entries: int = 20000
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: Union[sqlite3.Connection, None] = None
+        self._pid: Union[int, None] = None
+        return
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            if self.path != ":memory:" and os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS bio (
+                    provider TEXT NOT NULL,
+                    artist_name TEXT NOT NULL,
+                    verdict TEXT NOT NULL,
+                    bio TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (provider, artist_name)
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS bio_accessed_at ON bio (accessed_at)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, provider: str, artist_name: str) -> Union[Tuple[str, Union[str, None]], None]:
+        """
+        OUTPUT:
+            (verdict, bio) if there's an unexpired entry, otherwise None
+        """
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT verdict, bio, fetched_at FROM bio WHERE provider=? AND artist_name=?",
+                (provider, artist_name)
+            ).fetchone()
+            if row is None:
+                return None
+            verdict, bio, fetched_at = row
+            ttl = self.negative_ttl if verdict in NEGATIVE_VERDICTS else self.ttl
+            if now - fetched_at > ttl:
+                self.conn.execute("DELETE FROM bio WHERE provider=? AND artist_name=?", (provider, artist_name))
+                return None
+            self.conn.execute(
+                "UPDATE bio SET accessed_at=? WHERE provider=? AND artist_name=?",
+                (now, provider, artist_name)
+            )
+        return verdict, bio
+
+    def set(self, provider: str, artist_name: str, verdict: str, bio: Union[str, None] = None) -> str:
+        """
+        Stores a verdict (and the bio it came from) and returns the verdict.
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO bio VALUES (?, ?, ?, ?, ?, ?)",
+                (provider, artist_name, verdict, bio, now, now)
+            )
+            self._evict()
+        return verdict
+
+    def _evict(self) -> None:
+        excess = self.conn.execute("SELECT COUNT(*) FROM bio").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM bio WHERE rowid IN (SELECT rowid FROM bio ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            )
+        return
+
+    def clear(self) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM bio")
+        return
+
+
+bio_cache = BioCache(
+    os.getenv("BIO_CACHE_PATH", os.path.join(os.getcwd(), ".cache", "bio_cache.sqlite")),
+    ttl=float(os.getenv("BIO_CACHE_TTL", 90 * 24 * 3600)),
+    negative_ttl=float(os.getenv("BIO_CACHE_NEGATIVE_TTL", 7 * 24 * 3600)),
+    max_entries=int(os.getenv("BIO_CACHE_MAX_ENTRIES", 20000))
+)
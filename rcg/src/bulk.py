@@ -0,0 +1,135 @@
+"""Parameterized bulk inserts."""
+import os
+import tempfile
+from itertools import chain, islice
+from typing import Any, Iterable, Iterator, Sequence, Union
+
+from pymysql.connections import Connection
+
+from .db import get_pool
+from .snapshot import mark_snapshot_stale
+
+
+def bulk_config() -> dict:
+    """
+    BULK_BATCH_SIZE: rows per executemany call (pymysql folds each call into multi-row INSERTs)
+    BULK_LOAD_DATA_THRESHOLD: from this many rows, use LOAD DATA LOCAL INFILE if MYSQL_LOCAL_INFILE is set
+    """
+    return {
+        "batch_size": int(os.getenv("BULK_BATCH_SIZE", 1000)),
+        "load_data_threshold": int(os.getenv("BULK_LOAD_DATA_THRESHOLD", 5000)),
+        "local_infile": bool(os.getenv("MYSQL_LOCAL_INFILE"))
+    }
+
+
+def bulk_insert(
+        table: str,
+        columns: Sequence[str],
+        rows: Iterable[Sequence[Any]],
+        conn: Union[Connection, None] = None,
+        commit: bool = True,
+        batch_size: Union[int, None] = None,
+        method: str = "auto",
+        ignore: bool = False
+) -> int:
+    """
+    Inserts rows into table. Values are sent as parameters, never formatted into the query.
+
+    rows are read batch_size at a time (and at most load_data_threshold ahead, to pick a method), so a
+    generator of rows is never held in memory all at once.
+
+    INPUTS:
+        table (str)
+        columns (Sequence[str])
+        rows (Iterable[Sequence]): one value per column
+        conn (Connection, optional): default borrows one from the pool
+        commit (bool): False leaves the transaction open on conn
+        batch_size (int): rows per executemany call, default from bulk_config()
+        method (str): "executemany", "load_data" or "auto" (load_data for large batches when enabled)
+        ignore (bool): INSERT IGNORE / LOAD DATA ... IGNORE, skipping rows that hit a unique key
+
+    OUTPUT:
+        count (int): rows inserted (with ignore, rows skipped for duplicate keys aren't counted)
+    """
+    assert method in ["auto", "executemany", "load_data"]
+    config = bulk_config()
+    batch_size = batch_size or config["batch_size"]
+    rows = (tuple(r) for r in rows)
+    head = list(islice(rows, config["load_data_threshold"] if method == "auto" and config["local_infile"] else 1))
+    if not head:
+        return 0
+    if method == "auto":
+        use_load_data = config["local_infile"] and len(head) >= config["load_data_threshold"]
+        method = "load_data" if use_load_data else "executemany"
+    rows = chain(head, rows)
+    insert = _load_data if method == "load_data" else _executemany
+    if conn is None:
+        with get_pool().connection() as pooled_conn:
+            count = insert(pooled_conn, table, columns, rows, batch_size, ignore)
+            if commit:
+                pooled_conn.commit()
+    else:
+        count = insert(conn, table, columns, rows, batch_size, ignore)
+        if commit:
+            conn.commit()
+    if commit:
+        mark_snapshot_stale()
+    return count
+
+
+def _column_list(columns: Sequence[str]) -> str:
+    return ", ".join(f"`{c}`" for c in columns)
+
+
+def _executemany(
+        conn: Connection,
+        table: str,
+        columns: Sequence[str],
+        rows: Iterator[tuple],
+        batch_size: int,
+        ignore: bool
+) -> int:
+    q = "INSERT {}INTO {} ({}) VALUES ({})".format(
+        "IGNORE " if ignore else "", table, _column_list(columns), ", ".join(["%s"] * len(columns)))
+    count = 0
+    with conn.cursor() as cur:
+        batch = list(islice(rows, batch_size))
+        while batch:
+            count += cur.executemany(q, batch) or 0
+            batch = list(islice(rows, batch_size))
+    return count
+
+
+def _tsv_value(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def _load_data(
+        conn: Connection,
+        table: str,
+        columns: Sequence[str],
+        rows: Iterator[tuple],
+        batch_size: int,
+        ignore: bool
+) -> int:
+    """
+    Streams rows as tab-separated text through LOAD DATA LOCAL INFILE.
+
+    pymysql reads LOCAL INFILE data from a path, so the buffer is spooled to a temp file. Needs
+    local_infile on the connection (MYSQL_LOCAL_INFILE) and on the server.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8", newline="") as buffer:
+        for row in rows:
+            buffer.write("\t".join(_tsv_value(v) for v in row) + "\n")
+        buffer.flush()
+        q = """
+            LOAD DATA LOCAL INFILE %s {}INTO TABLE {}
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+            LINES TERMINATED BY '\\n'
+            ({})
+            """.format("IGNORE " if ignore else "", table, _column_list(columns))
+        with conn.cursor() as cur:
+            return cur.execute(q, (buffer.name,))
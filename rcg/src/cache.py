@@ -0,0 +1,157 @@
+"""In-process cache for data derived from a single chart date."""
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Tuple, Union
+
+from ..config.config import RAP_CAVIAR_ID
+
+_MISSING = object()
+
+
+class ChartCache:
+    """
+    LRU cache of per-date values (Chart, tally, stats...), keyed by (chart_date, kind).
+
+    A chart never changes once it's in the db, so entries only leave by LRU eviction, by
+    invalidate(chart_date), which add_chart_to_db calls for the dates it changes, or by sync() when
+    another process has changed the db.
+
+    INPUTS:
+        max_entries (int): most (chart_date, kind) entries held at once
+        max_bytes (int, optional): if set, also evicts until the pickled size of all entries fits
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: Union[int, None] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: OrderedDict = OrderedDict()
+        self._sizes: Dict[Tuple[str, Hashable], int] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.data_version: Hashable = None
+        return
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Tuple[str, Hashable]) -> bool:
+        return key in self._data
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def get(self, chart_date: str, kind: Hashable, default: Any = None) -> Any:
+        key = (chart_date, kind)
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, chart_date: str, kind: Hashable, value: Any) -> None:
+        key = (chart_date, kind)
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._sizes[key] = size
+            self._evict()
+        return
+
+    def _evict(self) -> None:
+        while len(self._data) > self.max_entries or (self.max_bytes and self.nbytes > self.max_bytes):
+            key, _ = self._data.popitem(last=False)
+            self._sizes.pop(key, None)
+        return
+
+    def invalidate(self, chart_date: str) -> None:
+        """Drops every kind of entry for chart_date."""
+        with self._lock:
+            for key in [k for k in self._data if k[0] == chart_date]:
+                del self._data[key]
+                self._sizes.pop(key, None)
+        return
+
+    def sync(self, data_version: Hashable) -> None:
+        """
+        Drops every entry when the shared data version isn't the one the entries were computed under.
+        """
+        with self._lock:
+            if data_version != self.data_version:
+                self._data.clear()
+                self._sizes.clear()
+                self.data_version = data_version
+        return
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+        return
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def _env_int(var: str) -> Union[int, None]:
+    value = os.getenv(var)
+    return int(value) if value else None
+
+
+chart_cache = ChartCache(
+    max_entries=_env_int("CHART_CACHE_MAX_ENTRIES") or 512,
+    max_bytes=_env_int("CHART_CACHE_MAX_BYTES")
+)
+
+
+def cache_kind(kind: str, chart_id: Union[str, None] = None) -> Hashable:
+    """
+    Rap Caviar entries are keyed by kind alone, other playlists by (kind, chart_id).
+    """
+    return kind if chart_id in [None, RAP_CAVIAR_ID] else (kind, chart_id)
+
+
+def cached_by_date(kind: str, cache: ChartCache = chart_cache) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorator for functions whose arguments are a chart_date and optionally a chart_id.
+
+    Empty results aren't cached: an empty result means the date hasn't been ingested yet (and other
+    gunicorn workers won't see the invalidation when it is).
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(func)
+        def wrapper(chart_date: str, chart_id: Union[str, None] = None) -> Any:
+            key = cache_kind(kind, chart_id)
+            value = cache.get(chart_date, key, _MISSING)
+            if value is _MISSING:
+                value = func(chart_date) if chart_id is None else func(chart_date, chart_id)
+                if _is_populated(value):
+                    cache.set(chart_date, key, value)
+            return value
+        return wrapper
+    return decorator
+
+
+def _is_populated(value: Any) -> bool:
+    if hasattr(value, "tracks"):
+        return bool(value.tracks)
+    if hasattr(value, "stats"):
+        return _is_populated(value.stats)
+    if isinstance(value, dict) and value and all(isinstance(v, dict) and "Total" in v for v in value.values()):
+        # get_chart_stats always returns all three genders, zeroed if there's no chart
+        return any(v["Total"] for v in value.values())
+    return bool(value)
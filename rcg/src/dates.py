@@ -1,3 +1,4 @@
+import os
 import re
 from datetime import datetime as dt
 from datetime import timedelta
@@ -5,6 +6,7 @@ from typing import Any, Callable, Union
 
 from pytz import timezone
 
+from ..config.config import RAP_CAVIAR_ID
 from .db import db_query
 
 DATE_FORMAT = "%Y-%m-%d"
@@ -35,15 +37,26 @@ def get_date(
     return date
 
 
-def get_most_recent_chart_date() -> dt:
+def get_most_recent_chart_date(chart_id: str = RAP_CAVIAR_ID) -> dt:
     """
-    Gets the most recent chart date.
+    Gets the most recent chart date (for Rap Caviar, unless another chart_id is provided).
     """
-    most_recent_chart_date = db_query("select max(chart_date) from chart")[0][0]
+    most_recent_chart_date = db_query("select max(chart_date) from chart where chart_id=%s", params=(chart_id,))[0][0]
     verify_date(most_recent_chart_date)
     return timezone('US/Eastern').localize(dt.strptime(most_recent_chart_date, DATE_FORMAT))
 
 
+def latest_chart_date() -> str:
+    """
+    LATEST_CHART_DATE, looked up on first use (not at startup) and kept in the environment.
+
+    add_chart_to_db and backfill move it forward when they write a newer Rap Caviar chart.
+    """
+    if not os.getenv("LATEST_CHART_DATE"):
+        os.environ["LATEST_CHART_DATE"] = get_most_recent_chart_date().strftime(DATE_FORMAT)
+    return os.environ["LATEST_CHART_DATE"]
+
+
 def verify_date(chart_date: str):
     """
     Assures correct date formatting, prevents SQL injections.
@@ -1,11 +1,43 @@
 # db init
 import os
-from typing import Any, Union
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Sequence, Union
 
 from pymysql import connect
 from pymysql.connections import Connection
-from sqlalchemy import create_engine
-from sqlalchemy.engine.base import Engine
+from pymysql.cursors import SSCursor
+from pymysql.err import InterfaceError, OperationalError
+
+from .snapshot import mark_snapshot_stale, snapshot_reader
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine.base import Engine
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within pool_timeout seconds."""
+
+
+class LockTimeout(Exception):
+    """Raised when an advisory lock isn't granted within its timeout."""
+
+
+def pool_config() -> Dict[str, Any]:
+    """
+    Pool settings, read from the environment at call time so .env files loaded by init_app() apply.
+
+    Shared by the pymysql pool behind db_query and the sqlalchemy engine from make_sql_engine.
+    """
+    return {
+        "pool_size": int(os.getenv("MYSQL_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("MYSQL_POOL_MAX_OVERFLOW", 5)),
+        "pool_recycle": int(os.getenv("MYSQL_POOL_RECYCLE", 3600)),
+        "pool_timeout": float(os.getenv("MYSQL_POOL_TIMEOUT", 30)),
+        "pool_pre_ping": os.getenv("MYSQL_POOL_PRE_PING", "True") not in ["False", "false", "0"]
+    }
 
 
 def make_sql_connection() -> Connection:
@@ -15,21 +47,220 @@ def make_sql_connection() -> Connection:
             password=os.environ["MYSQL_PW"],
             host=os.environ["MYSQL_URL"],
             database=os.environ["MYSQL_DB"],
-            port=3306
+            port=3306,
+            local_infile=bool(os.getenv("MYSQL_LOCAL_INFILE"))
         )
     else:
         conn = connect(
             user=os.environ["MYSQL_USER"],
             host=os.environ["MYSQL_URL"],
             database=os.environ["MYSQL_DB"],
-            port=3306
+            port=3306,
+            local_infile=bool(os.getenv("MYSQL_LOCAL_INFILE"))
         )
     return conn
 
 
-def make_sql_engine() -> Engine:
+class ConnectionPool:
+    """
+    Process-wide pool of pymysql connections.
+
+    Idle connections are reused LIFO. A connection is dropped instead of reused if it is older than
+    pool_recycle seconds or fails a ping (when pool_pre_ping). At most pool_size connections are kept
+    idle, and at most pool_size + max_overflow are open at once; past that, acquire() waits up to
+    pool_timeout seconds.
+
+    The pool remembers the pid that created it. After a fork (gunicorn workers) the child drops the
+    inherited connections without closing them, so the parent's sockets are left alone.
+    """
+
+    def __init__(
+            self,
+            pool_size: int = 5,
+            max_overflow: int = 5,
+            pool_recycle: int = 3600,
+            pool_timeout: float = 30,
+            pool_pre_ping: bool = True
+    ):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_recycle = pool_recycle
+        self.pool_timeout = pool_timeout
+        self.pool_pre_ping = pool_pre_ping
+        self._cond = threading.Condition()
+        self._reset()
+        return
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._idle: deque = deque()
+        self._created_at: Dict[int, float] = {}
+        self._counters = {
+            "created": 0,
+            "reused": 0,
+            "recycled": 0,
+            "ping_failures": 0,
+            "discarded": 0,
+            "waits": 0,
+            "timeouts": 0
+        }
+        return
+
+    def _check_pid(self) -> None:
+        if self._pid != os.getpid():
+            self._reset()
+
+    @property
+    def _open(self) -> int:
+        return len(self._created_at)
+
+    def _discard(self, conn: Connection, counter: str = "discarded") -> None:
+        self._created_at.pop(id(conn), None)
+        self._counters[counter] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+        return
+
+    def _usable(self, conn: Connection) -> bool:
+        if time.monotonic() - self._created_at.get(id(conn), 0) > self.pool_recycle:
+            self._discard(conn, "recycled")
+            return False
+        if self.pool_pre_ping:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                self._discard(conn, "ping_failures")
+                return False
+        return True
+
+    def acquire(self) -> Connection:
+        deadline = time.monotonic() + self.pool_timeout
+        with self._cond:
+            self._check_pid()
+            while True:
+                while self._idle:
+                    conn = self._idle.pop()
+                    if self._usable(conn):
+                        self._counters["reused"] += 1
+                        return conn
+                if self._open < self.pool_size + self.max_overflow:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"no connection available after {self.pool_timeout}s ({self._open} open)")
+                self._counters["waits"] += 1
+                self._cond.wait(remaining)
+            # reserve the slot before dialing so concurrent callers can't overshoot the limit
+            placeholder = object()
+            self._created_at[id(placeholder)] = time.monotonic()
+        try:
+            conn = make_sql_connection()
+        finally:
+            with self._cond:
+                self._created_at.pop(id(placeholder), None)
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self._counters["created"] += 1
+        return conn
+
+    def release(self, conn: Connection, discard: bool = False) -> None:
+        """
+        Returns a connection to the pool. Any open transaction is rolled back first so the next
+        borrower doesn't read from a stale snapshot.
+        """
+        with self._cond:
+            if self._pid != os.getpid() or id(conn) not in self._created_at:
+                # borrowed before a fork or never ours; not safe to pool
+                return
+            if not discard:
+                try:
+                    conn.rollback()
+                except Exception:
+                    discard = True
+            if discard or not conn.open or len(self._idle) >= self.pool_size:
+                self._discard(conn)
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+        return
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        except (OperationalError, InterfaceError):
+            self.release(conn, discard=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            self._check_pid()
+            stats = {
+                "pool_size": self.pool_size,
+                "max_overflow": self.max_overflow,
+                "open": self._open,
+                "idle": len(self._idle),
+                "checked_out": self._open - len(self._idle)
+            }
+            stats.update(self._counters)
+        return stats
+
+    def dispose(self) -> None:
+        """Closes all idle connections. Checked-out connections are closed when released."""
+        with self._cond:
+            self._check_pid()
+            while self._idle:
+                self._discard(self._idle.pop())
+        return
+
+
+_POOL: Union[ConnectionPool, None] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process-wide pool, creating it from pool_config() on first use.
+    """
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ConnectionPool(**pool_config())
+    return _POOL
+
+
+def _reset_pool_after_fork() -> None:
+    global _POOL_LOCK
+    _POOL_LOCK = threading.Lock()
+    if _POOL is not None:
+        _POOL._cond = threading.Condition()
+        _POOL._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def pool_stats() -> Dict[str, int]:
+    return get_pool().stats()
+
+
+def make_sql_engine() -> "Engine":
     """
     For using pandas .to_sql() -- INSERT wasn't working otherwise
+
+    Uses the same pool settings as db_query.
     """
     if os.getenv("MYSQL_PW"):
         connection_string = "mysql://{}:{}@{}/{}".format(
@@ -46,28 +277,135 @@ def make_sql_engine() -> Engine:
                 'MYSQL_URL',
                 'MYSQL_DB']]
         )
-    return create_engine(connection_string)
+    # imported here because sqlalchemy is only needed for pandas .to_sql(), not by the web app
+    from sqlalchemy import create_engine
+    return create_engine(connection_string, **pool_config())
 
 
 def db_query(
     q: str,
     conn: Union[Connection, None] = None,
     commit: bool = False,
-    close: bool = True
+    close: bool = True,
+    params: Union[Sequence[Any], None] = None
 ) -> Any:
+    """
+    Runs a query and returns all rows. Values in params are escaped into %s placeholders in q.
+
+    Without a conn, a connection is borrowed from the pool and returned afterwards (close is ignored).
+    With a conn, it is used as-is and closed if close is True.
+
+    Reads without a conn are answered from the snapshot file when SNAPSHOT_PATH is set and the
+    snapshot covers the query's tables (see snapshot.py).
+    """
     if os.getenv("SQL_DEBUG"):
         try:
             with open("sql.txt", "a+") as f:
-                f.write("\n---\n" + q + "\n***\n")
+                f.write("\n---\n" + q + ("\n" + str(params) if params else "") + "\n***\n")
         except:
             pass
+    if not conn and not commit:
+        reader = snapshot_reader()
+        if reader is not None and reader.covers(q):
+            try:
+                return reader.query(q, params)
+            except reader.errors as e:
+                print(f"snapshot can't answer query, reading mysql: {e!r}")
     if not conn:
-        conn = make_sql_connection()
+        with get_pool().connection() as pooled_conn:
+            return _execute(q, pooled_conn, commit, params)
+    data = _execute(q, conn, commit, params)
+    if close:
+        conn.close()
+    return data
+
+
+def db_stream(q: str, params: Union[Sequence[Any], None] = None, batch_size: int = 1000) -> Iterator[Any]:
+    """
+    Yields the rows of a query as the server sends them (an unbuffered SSCursor), for results too big
+    for db_query's fetchall(). Memory use is one batch of rows, whatever the size of the result.
+
+    The pooled connection is held until the generator is exhausted or closed. If it's closed early
+    (e.g. the client of a streaming response went away), the connection is discarded rather than
+    returned, instead of reading the rest of the result to free it.
+    """
+    pool = get_pool()
+    conn = pool.acquire()
+    finished = False
+    try:
+        # not closed on the way out: closing an SSCursor reads (and drops) whatever is left of the result
+        cur = conn.cursor(SSCursor)
+        cur.execute(q, params)
+        rows = cur.fetchmany(batch_size)
+        while rows:
+            yield from rows
+            rows = cur.fetchmany(batch_size)
+        cur.close()
+        finished = True
+    finally:
+        pool.release(conn, discard=not finished)
+    return
+
+
+def _execute(q: str, conn: Connection, commit: bool, params: Union[Sequence[Any], None] = None) -> Any:
     with conn.cursor() as cur:
-        cur.execute(q)
+        cur.execute(q, params)
         if commit:
             conn.commit()
-    data = cur.fetchall()
-    if close:
-        conn.close()
+            mark_snapshot_stale()
+        data = cur.fetchall()
     return data
+
+
+@contextmanager
+def transaction(lock_name: Union[str, None] = None, lock_timeout: int = 60) -> Iterator[Connection]:
+    """
+    Yields a pooled connection inside a transaction, committed if the block finishes and rolled
+    back if it raises.
+
+    With a lock_name, the MySQL advisory lock GET_LOCK(lock_name) is held for the duration, so
+    concurrent holders of the same name run one at a time (across processes and hosts).
+    """
+    with get_pool().connection() as conn:
+        if lock_name:
+            granted = _execute("SELECT GET_LOCK(%s, %s)", conn, False, (lock_name, lock_timeout))[0][0]
+            if granted != 1:
+                raise LockTimeout(f"lock {lock_name} not granted after {lock_timeout}s")
+        try:
+            conn.begin()
+            yield conn
+            conn.commit()
+            mark_snapshot_stale()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            if lock_name:
+                _execute("SELECT RELEASE_LOCK(%s)", conn, False, (lock_name,))
+    return
+
+
+def db_query_in(
+    q: str,
+    keys: Sequence[Any],
+    batch_size: int = 500,
+    conn: Union[Connection, None] = None
+) -> List[Any]:
+    """
+    Runs q for batches of keys and returns all rows, for queries like "... WHERE id IN {}".
+
+    {} in q is filled with a parenthesized placeholder list for each batch. Keys can be scalars or
+    tuples (for row constructors like "WHERE (a, b) IN {}").
+    """
+    rows: List[Any] = []
+    keys = list(keys)
+    for i in range(0, len(keys), batch_size):
+        batch = keys[i:i + batch_size]
+        if isinstance(batch[0], tuple):
+            placeholder = "(" + ", ".join(["%s"] * len(batch[0])) + ")"
+            params = [v for k in batch for v in k]
+        else:
+            placeholder = "%s"
+            params = batch
+        rows += db_query(q.format("(" + ", ".join([placeholder] * len(batch)) + ")"), conn, close=False, params=params)
+    return rows
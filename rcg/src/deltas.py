@@ -0,0 +1,262 @@
+"""
+chart_delta: the tracks and artists added to / removed from each chart since the chart before it.
+
+Stored at ingest, so comparing two dates reads only the deltas between them, however far apart they are.
+"""
+import asyncio
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+from pymysql.connections import Connection
+
+from ..config.config import RAP_CAVIAR_ID
+from .aiodb import async_db_query
+from .bulk import bulk_insert
+from .dates import verify_date
+from .db import db_query, transaction
+from .track import Appearance, Codebook, ColumnarChart, parse_chart_id
+
+DELTA_COLUMNS = [
+    "chart_id",
+    "chart_date",
+    "prev_date",
+    "item_type",  # "track" or "artist"
+    "item_id",  # song_spotify_id or artist spotify_id
+    "change_type",  # "added" or "removed"
+    "item_name",  # song_name or artist_name
+    "primary_artist_name",  # tracks only
+    "features"  # tracks only
+]
+
+# one chart's (tracks, artists): item_id -> (item_name, primary_artist_name, features)
+Membership = Tuple[Dict[str, Tuple[Any, ...]], Dict[str, Tuple[Any, ...]]]
+
+
+def create_chart_deltas() -> None:
+    db_query(
+        """
+        CREATE TABLE IF NOT EXISTS chart_delta (
+            chart_id VARCHAR(64) NOT NULL,
+            chart_date CHAR(10) NOT NULL,
+            prev_date CHAR(10),
+            item_type VARCHAR(8) NOT NULL,
+            item_id VARCHAR(64) NOT NULL,
+            change_type VARCHAR(8) NOT NULL,
+            item_name TEXT,
+            primary_artist_name TEXT,
+            features TEXT,
+            PRIMARY KEY (chart_id, chart_date, item_type, item_id)
+        )
+        """, commit=True)
+    return
+
+
+def _in_dates(chart_dates: List[str]) -> str:
+    return "(" + ", ".join(["%s"] * len(chart_dates)) + ")"
+
+
+def load_memberships(chart_id: str, chart_dates: List[str], conn: Connection) -> Dict[str, Membership]:
+    """
+    The tracks and credited artists of each chart, read on conn (so uncommitted rows are included).
+    """
+    appearances: Dict[str, List[Appearance]] = {d: [] for d in chart_dates}
+    for i in range(0, len(chart_dates), 500):
+        batch = chart_dates[i:i + 500]
+        for chart_date, *appearance in db_query(
+                """
+                SELECT
+                    chart.chart_date,
+                    chart.song_spotify_id,
+                    chart.song_name,
+                    artist.spotify_id,
+                    artist.artist_name,
+                    song.primary
+                FROM chart
+                INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
+                LEFT JOIN artist ON song.artist_spotify_id=artist.spotify_id
+                WHERE chart.chart_id=%s AND chart.chart_date IN {}
+                """.format(_in_dates(batch)),
+                conn, close=False, params=[chart_id] + batch):
+            appearances[chart_date].append(Appearance._make(appearance))
+    songs, artists = Codebook(), Codebook()
+    memberships = {}
+    for chart_date, chart_appearances in appearances.items():
+        chart = ColumnarChart.from_appearances(chart_date, chart_appearances, songs, artists, chart_id)
+        memberships[chart_date] = (
+            {t.song_spotify_id: (t.song_name, t.primary_artist_name, t.features) for t in chart.tracks},
+            {a.spotify_id: (a.name, None, None) for a in chart.artists()}
+        )
+    return memberships
+
+
+def make_delta_rows(
+        chart_id: str,
+        chart_date: str,
+        prev_date: Union[str, None],
+        membership: Membership,
+        prev_membership: Membership
+) -> List[Tuple[Any, ...]]:
+    """
+    OUTPUT:
+        rows (list): values for DELTA_COLUMNS
+    """
+    rows = []
+    for item_type, items, prev_items in zip(["track", "artist"], membership, prev_membership):
+        for change_type, new, old in [("added", items, prev_items), ("removed", prev_items, items)]:
+            rows += [
+                (chart_id, chart_date, prev_date, item_type, item_id, change_type, *details)
+                for item_id, details in new.items() if item_id not in old
+            ]
+    return rows
+
+
+def refresh_chart_deltas(
+        chart_id: str,
+        chart_dates: List[str],
+        conn: Union[Connection, None] = None
+) -> int:
+    """
+    Recomputes the deltas of some dates of one chart, and of the chart after each of them (whose
+    previous chart they now are, if they were backfilled into a gap).
+
+    With a conn, runs inside its open transaction (nothing is committed).
+
+    OUTPUT:
+        rows (int): delta rows written
+    """
+    if not chart_dates:
+        return 0
+    if conn is None:
+        with transaction() as conn:
+            return refresh_chart_deltas(chart_id, chart_dates, conn)
+    charted = [r[0] for r in db_query(
+        "SELECT DISTINCT chart_date FROM chart WHERE chart_id=%s ORDER BY chart_date",
+        conn, close=False, params=(chart_id,))]
+    targets = set()
+    for d in chart_dates:
+        i = bisect_left(charted, d)
+        targets.update(charted[i:i + 2])
+    targets = sorted(targets)
+    previous = {d: charted[i - 1] if i else None for d, i in ((d, bisect_left(charted, d)) for d in targets)}
+    memberships = load_memberships(
+        chart_id, sorted(set(targets) | set(p for p in previous.values() if p)), conn)
+    empty: Membership = ({}, {})
+    rows = []
+    for d in targets:
+        prev_date = previous[d]
+        rows += make_delta_rows(chart_id, d, prev_date, memberships[d], memberships.get(prev_date, empty))
+    for i in range(0, len(targets), 500):
+        batch = targets[i:i + 500]
+        db_query(
+            f"DELETE FROM chart_delta WHERE chart_id=%s AND chart_date IN {_in_dates(batch)}",
+            conn, close=False, params=[chart_id] + batch)
+    return bulk_insert("chart_delta", DELTA_COLUMNS, rows, conn=conn, commit=False)
+
+
+def rebuild_chart_deltas(chart_id: Union[str, None] = None) -> int:
+    """
+    Recomputes every delta (or one chart's), one transaction per chart.
+
+    OUTPUT:
+        rows (int): delta rows written
+    """
+    chart_ids = [chart_id] if chart_id else [r[0] for r in db_query("SELECT DISTINCT chart_id FROM chart")]
+    written = 0
+    for c in chart_ids:
+        chart_dates = [r[0] for r in db_query("SELECT DISTINCT chart_date FROM chart WHERE chart_id=%s", params=(c,))]
+        with transaction() as conn:
+            db_query("DELETE FROM chart_delta WHERE chart_id=%s", conn, close=False, params=(c,))
+            written += refresh_chart_deltas(c, chart_dates, conn)
+    return written
+
+
+# the last date with a chart, up to a date (from the chart_id_date index); params: chart_id, date
+CHARTED_ON_OR_BEFORE_QUERY = "SELECT MAX(chart_date) FROM chart WHERE chart_id=%s AND chart_date<=%s"
+
+# params: chart_id, start (exclusive), end
+WINDOW_QUERY = """
+    SELECT item_type, item_id, change_type, item_name, primary_artist_name, features
+    FROM chart_delta
+    WHERE chart_id=%s AND chart_date>%s AND chart_date<=%s
+    ORDER BY chart_date, item_type, item_id
+    """
+
+
+def charted_on_or_before(chart_date: str, chart_id: str) -> Union[str, None]:
+    return db_query(CHARTED_ON_OR_BEFORE_QUERY, params=(chart_id, chart_date))[0][0]
+
+
+def compose_deltas(rows: Iterable[Tuple[Any, ...]]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """
+    Folds consecutive charts' deltas into one. An item's first and last change decide it: added
+    (then maybe removed and re-added) is "added", and the same for removed; an item that ends the
+    window as it started isn't listed.
+
+    INPUTS:
+        rows (iterable): (item_type, item_id, change_type, item_name, primary_artist_name, features),
+            in chart_date order
+
+    OUTPUT:
+        delta (dict): {"added": [...], "removed": [...]} for "tracks" and "artists"
+    """
+    first: Dict[Tuple[str, str], str] = {}
+    last: Dict[Tuple[str, str], Tuple[Any, ...]] = {}
+    for row in rows:
+        first.setdefault(row[:2], row[2])
+        last[row[:2]] = row
+    delta: Dict[str, Dict[str, List[Dict[str, Any]]]] = {
+        "tracks": {"added": [], "removed": []},
+        "artists": {"added": [], "removed": []}
+    }
+    for (item_type, item_id), (_, _, change_type, name, primary_artist_name, features) in last.items():
+        if first[(item_type, item_id)] != change_type:
+            continue
+        if item_type == "track":
+            item = {
+                "song_spotify_id": item_id,
+                "song_name": name,
+                "primary_artist_name": primary_artist_name,
+                "features": features
+            }
+        else:
+            item = {"spotify_id": item_id, "artist_name": name}
+        delta[item_type + "s"][change_type].append(item)
+    return delta
+
+
+def compare_charts(start: str, end: str, chart_id: str = RAP_CAVIAR_ID) -> Dict[str, Any]:
+    """
+    What changed between the chart of start and the chart of end, from the stored deltas in between
+    (one indexed range read, however far apart the dates are).
+
+    Dates without a chart stand for the last chart before them; start is None in the output if
+    there's no chart on or before it, and everything on the end chart counts as added.
+
+    OUTPUT:
+        delta (dict): chart_id, the charted start and end dates compared, and compose_deltas()
+    """
+    chart_id = _check_window(start, end, chart_id)
+    start, end = charted_on_or_before(start, chart_id), charted_on_or_before(end, chart_id)
+    rows = db_query(WINDOW_QUERY, params=(chart_id, start or "", end)) if end else []
+    return {"chart_id": chart_id, "start": start, "end": end, **compose_deltas(rows)}
+
+
+async def compare_charts_async(start: str, end: str, chart_id: str = RAP_CAVIAR_ID) -> Dict[str, Any]:
+    """
+    compare_charts on the async driver (for the ASGI app): the start and end charts are looked up
+    concurrently.
+    """
+    chart_id = _check_window(start, end, chart_id)
+    (start,), (end,) = (rows[0] for rows in await asyncio.gather(
+        async_db_query(CHARTED_ON_OR_BEFORE_QUERY, (chart_id, start)),
+        async_db_query(CHARTED_ON_OR_BEFORE_QUERY, (chart_id, end))
+    ))
+    rows = await async_db_query(WINDOW_QUERY, (chart_id, start or "", end)) if end else []
+    return {"chart_id": chart_id, "start": start, "end": end, **compose_deltas(rows)}
+
+
+def _check_window(start: str, end: str, chart_id: str) -> str:
+    verify_date(start)
+    verify_date(end)
+    assert start <= end, f"start ({start}) is after end ({end})"
+    return parse_chart_id(chart_id)
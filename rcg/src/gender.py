@@ -1,9 +1,13 @@
 import os
+import threading
+import time
 from collections import Counter
-from typing import Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple, Union
 
-import pylast
-import wikipedia
+from .bio_cache import bio_cache
+from .track import Artist
 
 
 def lookup_gender(artist_name: str) -> Tuple[str, str, str]:
@@ -18,10 +22,82 @@ def lookup_gender(artist_name: str) -> Tuple[str, str, str]:
     return lfm_gender, wikipedia_gender, gender
 
 
+class RateLimiter:
+    """
+    Spaces out calls to at most `rate` per second, across threads.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+        return
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+        return
+
+
+def resolve_genders(
+        artists: List[Artist],
+        max_workers: Union[int, None] = None,
+        rate_limits: Union[Dict[str, float], None] = None
+) -> List[Tuple[str, str, str]]:
+    """
+    lookup_gender for a batch of artists, with the last.fm and wikipedia calls for all of them made in
+    parallel.
+
+    INPUTS:
+        artists (List[Artist])
+        max_workers (int): concurrent lookups per provider, default GENDER_LOOKUP_WORKERS or 8
+        rate_limits (dict): max calls per second per provider ('last_fm', 'wikipedia'),
+            defaults LAST_FM_RATE or 5 and WIKIPEDIA_RATE or 10
+
+    OUTPUT:
+        genders (List[Tuple[str, str, str]]): (lfm_gender, wikipedia_gender, gender) per artist, in input order
+    """
+    if not artists:
+        return []
+    max_workers = max_workers or int(os.getenv("GENDER_LOOKUP_WORKERS", 8))
+    rate_limits = {
+        "last_fm": float(os.getenv("LAST_FM_RATE", 5)),
+        "wikipedia": float(os.getenv("WIKIPEDIA_RATE", 10)),
+        **(rate_limits or {})
+    }
+    limiters = {provider: RateLimiter(rate) for provider, rate in rate_limits.items()}
+
+    def limited(provider: str, lookup: Callable[[str], str]) -> Callable[[str], str]:
+        def limited_lookup(artist_name: str) -> str:
+            limiters[provider].wait()
+            return lookup(artist_name)
+        return limited_lookup
+
+    lfm_lookup = limited("last_fm", get_lastfm_gender)
+    wikipedia_lookup = limited("wikipedia", get_wikipedia_gender)
+    # one pool per provider, so workers sleeping in one provider's rate limiter don't hold up the other
+    with ThreadPoolExecutor(max_workers=max_workers) as lfm_executor, \
+            ThreadPoolExecutor(max_workers=max_workers) as wikipedia_executor:
+        lfm_futures = [lfm_executor.submit(lfm_lookup, a.name) for a in artists]
+        wikipedia_futures = [wikipedia_executor.submit(wikipedia_lookup, a.name) for a in artists]
+        genders = []
+        for lfm_future, wikipedia_future in zip(lfm_futures, wikipedia_futures):
+            lfm_gender, wikipedia_gender = lfm_future.result(), wikipedia_future.result()
+            genders.append((lfm_gender, wikipedia_gender, parse_genders(lfm_gender, wikipedia_gender)))
+    return genders
+
+
+@lru_cache(maxsize=1)
 def access_lfm() -> Any:
     """
-    Instantiates a lastfm network object w credentials.
+    Instantiates a lastfm network object w credentials. Built once and reused.
     """
+    # pylast and wikipedia are imported where they're used, so only ingest pays for them
+    import pylast
     return pylast.LastFMNetwork(
         api_key=os.environ['LAST_FM_ID'],
         api_secret=os.environ['LAST_FM_SECRET'],
@@ -33,21 +109,33 @@ def access_lfm() -> Any:
 def get_lastfm_gender(artist: str) -> str:
     """
     Loads the LastFM bio for an artists for gender processing.
+
+    Results (including not-found ones) are kept in bio_cache.
     """
+    cached = bio_cache.get("last_fm", artist)
+    if cached:
+        return cached[0]
+    import pylast
     lastfm_network = access_lfm()
     try:
         bio = pylast.Artist(artist, lastfm_network).get_bio_content(language="en")
     except pylast.WSError:
-        return "l"  # artist not found in last fm
+        return bio_cache.set("last_fm", artist, "l")  # artist not found in last fm
     if (not bio) or (bio.startswith('<a href="https://www.last.fm/music/')):
-        return "x"  # no last fm bio
-    return gender_count(bio)
+        return bio_cache.set("last_fm", artist, "x")  # no last fm bio
+    return bio_cache.set("last_fm", artist, gender_count(bio), bio)
 
 
 def get_wikipedia_gender(artist: str) -> str:
     """
     Loads the wikipedia bio for an artists for gender processing.
+
+    Results (including not-found ones) are kept in bio_cache.
     """
+    cached = bio_cache.get("wikipedia", artist)
+    if cached:
+        return cached[0]
+    import wikipedia
     try:
         bio = wikipedia.page(artist, auto_suggest=False, redirect=True).content
     except wikipedia.DisambiguationError as e:
@@ -55,10 +143,10 @@ def get_wikipedia_gender(artist: str) -> str:
             artist_ = next(o for o in e.options if 'rapper' in o)
             bio = wikipedia.page(artist_, auto_suggest=False, redirect=True).content
         except StopIteration:
-            return "d"  # disambiguation error
+            return bio_cache.set("wikipedia", artist, "d")  # disambiguation error
     except wikipedia.PageError:
-        return "p"  # page error
-    return gender_count(bio)
+        return bio_cache.set("wikipedia", artist, "p")  # page error
+    return bio_cache.set("wikipedia", artist, gender_count(bio), bio)
 
 
 def gender_count(bio: str) -> str:
@@ -0,0 +1,57 @@
+"""In-memory index of group_table, for expanding groups into their members."""
+import threading
+import time
+from typing import Any, Dict, List, Tuple, Union
+
+from .db import db_query
+
+
+class GroupIndex:
+    """
+    group_spotify_id -> [(artist_name, artist_spotify_id)], loaded from group_table with one query.
+
+    Before use the index checks a cheap version of group_table (row count and max group_id) and
+    reloads only if it changed. Checks are skipped for check_interval seconds after the last one,
+    unless refresh(force=True).
+
+    INPUTS:
+        check_interval (float): seconds between version checks
+    """
+
+    def __init__(self, check_interval: float = 60):
+        self.check_interval = check_interval
+        self._members: Dict[str, List[Tuple[str, str]]] = {}
+        self._version: Union[Tuple[Any, ...], None] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        return
+
+    def __contains__(self, group_spotify_id: str) -> bool:
+        self.refresh()
+        return group_spotify_id in self._members
+
+    def members(self, group_spotify_id: str) -> List[Tuple[str, str]]:
+        self.refresh()
+        return self._members.get(group_spotify_id, [])
+
+    def refresh(self, force: bool = False) -> None:
+        with self._lock:
+            if not force and time.monotonic() - self._checked_at < self.check_interval:
+                return
+            version = tuple(db_query("SELECT COUNT(*), MAX(group_id) FROM group_table")[0])
+            self._checked_at = time.monotonic()
+            if version == self._version:
+                return
+            self._members = self._load()
+            self._version = version
+        return
+
+    def _load(self) -> Dict[str, List[Tuple[str, str]]]:
+        members: Dict[str, List[Tuple[str, str]]] = {}
+        for group_spotify_id, artist_name, artist_spotify_id in db_query(
+                "SELECT group_spotify_id, artist_name, artist_spotify_id FROM group_table"):
+            members.setdefault(group_spotify_id, []).append((artist_name, artist_spotify_id))
+        return members
+
+
+group_index = GroupIndex()
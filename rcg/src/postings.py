@@ -0,0 +1,180 @@
+"""
+artist_posting: an inverted index of the chart history, artist -> (chart_date, song) postings, kept up
+to date at ingest.
+
+The primary key starts with the artist, so one artist's history is a single range read of its own
+postings, however long the chart history is.
+"""
+import datetime
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+from pymysql.connections import Connection
+
+from ..config.config import RAP_CAVIAR_ID
+from .dates import DATE_FORMAT
+from .db import db_query, transaction
+from .track import parse_chart_id
+
+POSTING_SELECT = """
+    SELECT
+        song.artist_spotify_id,
+        chart.chart_id,
+        chart.chart_date,
+        chart.song_spotify_id,
+        chart.song_name,
+        song.primary IN ('True', 't')
+    FROM chart
+    INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
+    WHERE song.artist_spotify_id IS NOT NULL {}
+    """
+
+POSTING_INSERT = """
+    INSERT IGNORE INTO artist_posting
+        (artist_spotify_id, chart_id, chart_date, song_spotify_id, song_name, is_primary)
+    """
+
+
+def create_artist_postings() -> None:
+    db_query(
+        """
+        CREATE TABLE IF NOT EXISTS artist_posting (
+            artist_spotify_id VARCHAR(64) NOT NULL,
+            chart_id VARCHAR(64) NOT NULL,
+            chart_date CHAR(10) NOT NULL,
+            song_spotify_id VARCHAR(64) NOT NULL,
+            song_name TEXT,
+            is_primary BOOLEAN NOT NULL,
+            PRIMARY KEY (artist_spotify_id, chart_id, chart_date, song_spotify_id),
+            KEY artist_posting_date (chart_id, chart_date)
+        )
+        """, commit=True)
+    return
+
+
+def refresh_artist_postings(
+        chart_id: str,
+        chart_dates: Iterable[str],
+        conn: Union[Connection, None] = None
+) -> None:
+    """
+    Recomputes the postings of some dates of one chart.
+
+    With a conn, runs inside its open transaction (nothing is committed).
+    """
+    chart_dates = sorted(set(chart_dates))
+    if not chart_dates:
+        return
+    if conn is None:
+        with transaction() as conn:
+            return refresh_artist_postings(chart_id, chart_dates, conn)
+    in_dates = "(" + ", ".join(["%s"] * len(chart_dates)) + ")"
+    params = [chart_id] + chart_dates
+    db_query(
+        f"DELETE FROM artist_posting WHERE chart_id=%s AND chart_date IN {in_dates}",
+        conn, close=False, params=params)
+    db_query(
+        POSTING_INSERT + POSTING_SELECT.format(f"AND chart.chart_id=%s AND chart.chart_date IN {in_dates}"),
+        conn, close=False, params=params)
+    return
+
+
+def rebuild_artist_postings(chart_id: Union[str, None] = None) -> int:
+    """
+    Recomputes the whole index (or one chart's part of it) from the chart history, in one transaction.
+
+    OUTPUT:
+        rows (int): postings written
+    """
+    where = "AND chart.chart_id=%s" if chart_id else ""
+    params = (chart_id,) if chart_id else None
+    with transaction() as conn:
+        db_query(
+            "DELETE FROM artist_posting" + (" WHERE chart_id=%s" if chart_id else ""),
+            conn, close=False, params=params)
+        db_query(POSTING_INSERT + POSTING_SELECT.format(where), conn, close=False, params=params)
+    return db_query(
+        "SELECT COUNT(*) FROM artist_posting" + (" WHERE chart_id=%s" if chart_id else ""),
+        params=params)[0][0]
+
+
+def find_streaks(chart_dates: List[str]) -> List[Dict[str, Any]]:
+    """
+    Runs of consecutive days in sorted, distinct chart_dates.
+
+    OUTPUT:
+        streaks (list): {"start", "end", "days"}, in date order
+    """
+    streaks: List[Dict[str, Any]] = []
+    previous = None
+    for chart_date in chart_dates:
+        day = datetime.datetime.strptime(chart_date, DATE_FORMAT).date()
+        if previous is not None and day - previous == datetime.timedelta(days=1):
+            streaks[-1]["end"] = chart_date
+            streaks[-1]["days"] += 1
+        else:
+            streaks.append({"start": chart_date, "end": chart_date, "days": 1})
+        previous = day
+    return streaks
+
+
+def summarize_postings(postings: Iterable[Tuple[str, str, str, Any]]) -> Dict[str, Any]:
+    """
+    INPUTS:
+        postings (iterable): (chart_date, song_spotify_id, song_name, is_primary), in date order
+
+    OUTPUT:
+        history (dict): credit counts, one entry per date charted (with its songs), and streaks
+    """
+    dates: List[Dict[str, Any]] = []
+    primary_credits = 0
+    for chart_date, song_spotify_id, song_name, is_primary in postings:
+        if not dates or dates[-1]["date"] != chart_date:
+            dates.append({"date": chart_date, "songs": []})
+        dates[-1]["songs"].append({
+            "song_spotify_id": song_spotify_id,
+            "song_name": song_name,
+            "primary": bool(is_primary)
+        })
+        primary_credits += bool(is_primary)
+    total_credits = sum(len(d["songs"]) for d in dates)
+    streaks = find_streaks([d["date"] for d in dates])
+    return {
+        "total_credits": total_credits,
+        "primary_credits": primary_credits,
+        "featured_credits": total_credits - primary_credits,
+        "days_charted": len(dates),
+        "first_charted": dates[0]["date"] if dates else None,
+        "last_charted": dates[-1]["date"] if dates else None,
+        "longest_streak": max(streaks, key=lambda s: s["days"]) if streaks else None,
+        "streaks": streaks,
+        "dates": dates
+    }
+
+
+def get_artist_history(spotify_id: str, chart_id: str = RAP_CAVIAR_ID) -> Union[Dict[str, Any], None]:
+    """
+    An artist's whole chart history from its postings (plus its artist row).
+
+    OUTPUT:
+        history (dict): summarize_postings() with the artist's spotify_id, name and gender, or None
+            for an artist that never charted
+    """
+    chart_id = parse_chart_id(chart_id)
+    postings = db_query(
+        """
+        SELECT chart_date, song_spotify_id, song_name, is_primary
+        FROM artist_posting
+        WHERE artist_spotify_id=%s AND chart_id=%s
+        ORDER BY chart_date, song_spotify_id
+        """, params=(spotify_id, chart_id))
+    if not postings:
+        return None
+    artist = db_query("SELECT artist_name, gender FROM artist WHERE spotify_id=%s", params=(spotify_id,))
+    name, gender = artist[0] if artist else (None, None)
+    return {
+        "spotify_id": spotify_id,
+        "artist_name": name,
+        "gender": gender,
+        "chart_id": chart_id,
+        **summarize_postings(postings)
+    }
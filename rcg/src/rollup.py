@@ -0,0 +1,91 @@
+"""
+chart_gender_daily: credits and percentage per (chart_id, chart_date, gender), kept up to date at ingest.
+
+Genders are stored as in the artist table, with unknown (NULL) genders as UNKNOWN_GENDER so they
+still count towards each date's percentages.
+"""
+from typing import Iterable, Union
+
+from pymysql.connections import Connection
+
+from .db import db_query, transaction
+
+UNKNOWN_GENDER = "?"
+
+ROLLUP_SELECT = f"""
+    SELECT
+        chart.chart_id,
+        chart.chart_date,
+        COALESCE(artist.gender, '{UNKNOWN_GENDER}') AS rollup_gender,
+        COUNT(*),
+        COUNT(*) / SUM(COUNT(*)) OVER (PARTITION BY chart.chart_id, chart.chart_date) * 100
+    FROM chart
+    INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
+    LEFT JOIN artist ON song.artist_spotify_id=artist.spotify_id
+    {{}}
+    GROUP BY chart.chart_id, chart.chart_date, rollup_gender
+    """
+
+ROLLUP_INSERT = "INSERT INTO chart_gender_daily (chart_id, chart_date, gender, credits, percentage)"
+
+
+def create_gender_rollup() -> None:
+    db_query(
+        """
+        CREATE TABLE IF NOT EXISTS chart_gender_daily (
+            chart_id VARCHAR(64) NOT NULL,
+            chart_date CHAR(10) NOT NULL,
+            gender VARCHAR(16) NOT NULL,
+            credits INT NOT NULL,
+            percentage DOUBLE NOT NULL,
+            PRIMARY KEY (chart_id, chart_date, gender)
+        )
+        """, commit=True)
+    return
+
+
+def refresh_gender_rollup(
+        chart_id: str,
+        chart_dates: Iterable[str],
+        conn: Union[Connection, None] = None
+) -> None:
+    """
+    Recomputes the rollup rows of some dates of one chart.
+
+    With a conn, runs inside its open transaction (nothing is committed), so the rollup changes
+    together with the chart rows it summarizes.
+    """
+    chart_dates = sorted(set(chart_dates))
+    if not chart_dates:
+        return
+    if conn is None:
+        with transaction() as conn:
+            return refresh_gender_rollup(chart_id, chart_dates, conn)
+    in_dates = "(" + ", ".join(["%s"] * len(chart_dates)) + ")"
+    params = [chart_id] + chart_dates
+    db_query(
+        f"DELETE FROM chart_gender_daily WHERE chart_id=%s AND chart_date IN {in_dates}",
+        conn, close=False, params=params)
+    db_query(
+        ROLLUP_INSERT + ROLLUP_SELECT.format(f"WHERE chart.chart_id=%s AND chart.chart_date IN {in_dates}"),
+        conn, close=False, params=params)
+    return
+
+
+def rebuild_gender_rollup(chart_id: Union[str, None] = None) -> int:
+    """
+    Recomputes the whole rollup (or one chart's part of it) from the chart history, in one transaction.
+
+    OUTPUT:
+        rows (int): rollup rows written
+    """
+    where = "WHERE chart.chart_id=%s" if chart_id else ""
+    params = (chart_id,) if chart_id else None
+    with transaction() as conn:
+        db_query(
+            "DELETE FROM chart_gender_daily" + (" WHERE chart_id=%s" if chart_id else ""),
+            conn, close=False, params=params)
+        db_query(ROLLUP_INSERT + ROLLUP_SELECT.format(where), conn, close=False, params=params)
+    return db_query(
+        "SELECT COUNT(*) FROM chart_gender_daily" + (" WHERE chart_id=%s" if chart_id else ""),
+        params=params)[0][0]
@@ -0,0 +1,96 @@
+"""Ingests several playlists at once."""
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Union
+
+from ..config.config import PLAYLISTS
+from . import load_spotify_chart
+from .adding import add_chart_to_db, add_multiple_artists, find_missing_artists_in
+from .track import Chart, parse_chart_id
+
+IngestReport: tuple[str, str, int, float, float, str] = namedtuple(
+    "IngestReport", [
+        "chart_id",
+        "chart_date",
+        "tracks",
+        "fetch_seconds",
+        "write_seconds",
+        "error"
+    ]
+)
+
+
+def configured_playlists() -> List[str]:
+    """
+    Playlist ids from RCG_PLAYLISTS (comma-separated) if set, otherwise config.PLAYLISTS.
+    """
+    if os.getenv("RCG_PLAYLISTS"):
+        return [parse_chart_id(c.strip()) for c in os.environ["RCG_PLAYLISTS"].split(",") if c.strip()]
+    return list(PLAYLISTS.values())
+
+
+def ingest_playlists(
+        chart_ids: Union[List[str], None] = None,
+        max_workers: Union[int, None] = None
+) -> List[IngestReport]:
+    """
+    Fetches and writes several playlists concurrently.
+
+    Runs in three steps: fetch every playlist on a worker pool, add the artists missing from the db
+    for all of them at once (so an artist on several playlists is looked up once), then write each
+    chart on the pool. A playlist that fails doesn't stop the others; its error is in the report.
+
+    INPUTS:
+        chart_ids (List[str]): default is configured_playlists()
+        max_workers (int): default INGEST_WORKERS or 4
+
+    OUTPUT:
+        reports (List[IngestReport]): one per playlist, in input order
+    """
+    chart_ids = [parse_chart_id(c) for c in (chart_ids or configured_playlists())]
+    max_workers = max_workers or int(os.getenv("INGEST_WORKERS", 4))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched = list(executor.map(_fetch, chart_ids))
+        charts = [chart for chart, _, error in fetched if not error]
+
+        start = time.perf_counter()
+        missing = find_missing_artists_in(a for chart in charts for a in chart.artists())
+        if missing:
+            add_multiple_artists(missing)
+        print(f"added {len(missing)} new artists for {len(charts)} charts in {time.perf_counter() - start:.2f}s")
+
+        written = iter(executor.map(_write, charts))
+    reports = []
+    for chart_id, (chart, fetch_seconds, error) in zip(chart_ids, fetched):
+        write_seconds = 0.0
+        if not error:
+            write_seconds, error = next(written)
+        reports.append(IngestReport(
+            chart_id,
+            chart.chart_date if chart else None,
+            len(chart.tracks) if chart else 0,
+            round(fetch_seconds, 3),
+            round(write_seconds, 3),
+            error
+        ))
+    return reports
+
+
+def _fetch(chart_id: str) -> Tuple[Union[Chart, None], float, Union[str, None]]:
+    start = time.perf_counter()
+    try:
+        chart = load_spotify_chart(chart_id)
+    except Exception as e:
+        return None, time.perf_counter() - start, repr(e)
+    return chart, time.perf_counter() - start, None
+
+
+def _write(chart: Chart) -> Tuple[float, Union[str, None]]:
+    start = time.perf_counter()
+    try:
+        add_chart_to_db(chart)
+    except Exception as e:
+        return time.perf_counter() - start, repr(e)
+    return time.perf_counter() - start, None
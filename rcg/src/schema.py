@@ -0,0 +1,170 @@
+"""
+Idempotent schema changes, applied by `python -m rcg.cli migrate` (and by the test setup).
+
+Each step checks information_schema first, so ensure_schema() can be run any number of times.
+"""
+from typing import Dict, List, Tuple
+
+from ..config.config import RAP_CAVIAR_ID
+from .db import db_query
+from .deltas import create_chart_deltas, rebuild_chart_deltas
+from .postings import create_artist_postings, rebuild_artist_postings
+from .rollup import create_gender_rollup, rebuild_gender_rollup
+
+# table -> (index name, key columns); prefix lengths because tables loaded with pandas .to_sql() have TEXT columns
+UNIQUE_KEYS: Dict[str, Tuple[str, List[str]]] = {
+    "artist": ("artist_spotify_id_unique", ["spotify_id(64)"]),
+    "song": ("song_artist_unique", ["song_spotify_id(64)", "artist_spotify_id(64)"]),
+    "chart": ("chart_song_unique", ["chart_id(64)", "chart_date(10)", "song_spotify_id(64)"])
+}
+
+
+class SchemaError(Exception):
+    """Raised when the db is missing a schema change, or one can't be applied as is."""
+
+
+def column_exists(table: str, column: str) -> bool:
+    return db_query(
+        """
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema=DATABASE() AND table_name=%s AND column_name=%s
+        """, params=(table, column))[0][0] > 0
+
+
+def index_exists(table: str, index: str) -> bool:
+    return db_query(
+        """
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema=DATABASE() AND table_name=%s AND index_name=%s
+        """, params=(table, index))[0][0] > 0
+
+
+def table_exists(table: str) -> bool:
+    return db_query(
+        """
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_schema=DATABASE() AND table_name=%s
+        """, params=(table,))[0][0] > 0
+
+
+def ensure_chart_id() -> None:
+    """
+    Adds chart.chart_id (existing rows are Rap Caviar) and an index on (chart_id, chart_date).
+    """
+    if not column_exists("chart", "chart_id"):
+        db_query(
+            f"ALTER TABLE chart ADD COLUMN chart_id VARCHAR(64) NOT NULL DEFAULT '{RAP_CAVIAR_ID}'",
+            commit=True)
+    if not index_exists("chart", "chart_id_date"):
+        # prefix lengths because tables loaded with pandas .to_sql() have TEXT columns
+        db_query("CREATE INDEX chart_id_date ON chart (chart_id(64), chart_date(10))", commit=True)
+    return
+
+
+def duplicate_count(table: str, columns: List[str]) -> int:
+    columns = ", ".join(c.split("(")[0] for c in columns)
+    return db_query(f"""
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM {table} GROUP BY {columns} HAVING COUNT(*) > 1
+        ) AS duplicates
+        """)[0][0]
+
+
+def dedupe_table(table: str, index: str, columns: List[str]) -> None:
+    """
+    Rebuilds table with the unique key, keeping the first copy of each duplicated row.
+    """
+    db_query(f"DROP TABLE IF EXISTS {table}_dedupe", commit=True)
+    db_query(f"CREATE TABLE {table}_dedupe LIKE {table}", commit=True)
+    db_query(f"CREATE UNIQUE INDEX {index} ON {table}_dedupe ({', '.join(columns)})", commit=True)
+    db_query(f"INSERT IGNORE INTO {table}_dedupe SELECT * FROM {table}", commit=True)
+    db_query(f"RENAME TABLE {table} TO {table}_old, {table}_dedupe TO {table}", commit=True)
+    db_query(f"DROP TABLE {table}_old", commit=True)
+    return
+
+
+def ensure_unique_keys(dedupe: bool = False) -> None:
+    """
+    Adds the UNIQUE_KEYS that make ingest idempotent.
+
+    If a table already has duplicate keys this raises, unless dedupe is True, in which case the
+    table is rebuilt keeping one row per key.
+    """
+    for table, (index, columns) in UNIQUE_KEYS.items():
+        if index_exists(table, index):
+            continue
+        duplicates = duplicate_count(table, columns)
+        if duplicates and not dedupe:
+            raise SchemaError(
+                f"{table} has {duplicates} duplicated keys on {columns}; "
+                "run `python -m rcg.cli migrate --dedupe` to keep one row per key")
+        if duplicates:
+            print(f"removing {duplicates} duplicated keys from {table}")
+            dedupe_table(table, index, columns)
+        else:
+            db_query(f"CREATE UNIQUE INDEX {index} ON {table} ({', '.join(columns)})", commit=True)
+    return
+
+
+def ensure_gender_rollup() -> None:
+    """
+    Creates chart_gender_daily and fills it from the chart history (see rollup.py).
+    """
+    if not table_exists("chart_gender_daily"):
+        create_gender_rollup()
+        rebuild_gender_rollup()
+    return
+
+
+def ensure_chart_deltas() -> None:
+    """
+    Creates chart_delta and fills it from the chart history (see deltas.py).
+    """
+    if not table_exists("chart_delta"):
+        create_chart_deltas()
+        rebuild_chart_deltas()
+    return
+
+
+def ensure_artist_postings() -> None:
+    """
+    Creates artist_posting and fills it from the chart history (see postings.py).
+    """
+    if not table_exists("artist_posting"):
+        create_artist_postings()
+        rebuild_artist_postings()
+    return
+
+
+_VERIFIED = False
+
+
+def require_schema() -> None:
+    """
+    Checks (once per process) that ensure_schema has been run, for code that relies on it.
+    """
+    global _VERIFIED
+    if _VERIFIED:
+        return
+    missing = [index for table, (index, _) in UNIQUE_KEYS.items() if not index_exists(table, index)]
+    if not column_exists("chart", "chart_id"):
+        missing.append("chart.chart_id")
+    if not table_exists("chart_gender_daily"):
+        missing.append("chart_gender_daily")
+    if not table_exists("chart_delta"):
+        missing.append("chart_delta")
+    if not table_exists("artist_posting"):
+        missing.append("artist_posting")
+    if missing:
+        raise SchemaError(f"schema is out of date (missing {missing}); run `python -m rcg.cli migrate`")
+    _VERIFIED = True
+    return
+
+
+def ensure_schema(dedupe: bool = False) -> None:
+    ensure_chart_id()
+    ensure_unique_keys(dedupe)
+    ensure_gender_rollup()
+    ensure_chart_deltas()
+    ensure_artist_postings()
+    return
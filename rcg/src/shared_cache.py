@@ -0,0 +1,322 @@
+"""
+Cache shared by every worker and process: rendered pages and computed chart payloads.
+
+chart_cache lives inside one process, so with gunicorn's 4 workers it's held (and warmed) 4 times.
+Entries here are stored once, in Redis or in a directory of files, keyed by name + chart_date + the
+data version. Writers (add_chart_to_db, backfill) bump the data version, which orphans every entry
+computed from older data. Orphans are never read again: each bump sweeps away the entries whose ttl has
+run out (and a read deletes an expired entry it finds), so the files of a FileBackend stay bounded by
+about a ttl's worth of data versions. A worker that reads a new data version also empties its
+chart_cache, so it never renders an entry for the new version from data loaded before it.
+"""
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from typing import Any, Callable, Iterator, Tuple, Union
+
+from ..config.config import RAP_CAVIAR_ID
+from .cache import chart_cache
+
+_MISSING = object()
+
+
+def shared_cache_config() -> dict:
+    """
+    SHARED_CACHE_URL: redis://host:port/db, file:///some/dir, or "none" to turn the cache off
+        (default: files under .cache/shared)
+    SHARED_CACHE_TTL: seconds an entry is kept
+    SHARED_CACHE_LOCK_TIMEOUT: longest a worker waits for another one computing the same entry
+    """
+    return {
+        "url": os.getenv("SHARED_CACHE_URL", "file://" + os.path.join(os.getcwd(), ".cache", "shared")),
+        "ttl": int(os.getenv("SHARED_CACHE_TTL", 24 * 3600)),
+        "lock_timeout": float(os.getenv("SHARED_CACHE_LOCK_TIMEOUT", 30))
+    }
+
+
+class FileBackend:
+    """
+    One pickle file per key in a directory every worker can reach. Locks are flock()s on a file per key.
+    """
+
+    errors = (OSError, EOFError, pickle.PickleError)
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "locks"), exist_ok=True)
+        return
+
+    def _path(self, key: str, folder: str = "") -> str:
+        return os.path.join(self.directory, folder, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key: str) -> Any:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return _MISSING
+        if expires_at > time.time():
+            return value
+        _remove(path)
+        return _MISSING
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        expires_at = time.time() + ttl
+        with tempfile.NamedTemporaryFile("wb", dir=self.directory, delete=False) as f:
+            pickle.dump((expires_at, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        # the expiry is also the file's mtime, so sweep() finds expired entries without reading them
+        os.utime(f.name, (expires_at, expires_at))
+        os.replace(f.name, self._path(key))
+        return
+
+    def sweep(self, grace: float = 60) -> int:
+        """
+        Deletes entries that expired over grace seconds ago (orphans of older data versions included),
+        temp files left by writers that died, and the lock files no worker holds.
+
+        OUTPUT:
+            removed (int): files deleted
+        """
+        removed = 0
+        cutoff = time.time() - grace
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    removed += _remove(entry.path)
+        with os.scandir(os.path.join(self.directory, "locks")) as entries:
+            for entry in entries:
+                try:
+                    f = open(entry.path, "rb")
+                except FileNotFoundError:
+                    continue
+                with f:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    # unlinked while held: a worker that opened it just before still gets its lock, and
+                    # at worst computes the entry alongside one that opens the new file
+                    removed += _remove(entry.path)
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        return removed
+
+    def incr(self, key: str) -> int:
+        with self.lock("count:" + key, timeout=10):
+            value = self.count(key) + 1
+            self.set("count:" + key, value, 10 * 365 * 24 * 3600)
+        return value
+
+    def count(self, key: str) -> int:
+        value = self.get("count:" + key)
+        return 0 if value is _MISSING else value
+
+    @contextmanager
+    def lock(self, key: str, timeout: float) -> Iterator[bool]:
+        with open(self._path(key, "locks"), "a") as f:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        acquired = False
+                        break
+                    time.sleep(0.05)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        return
+
+
+def _remove(path: str) -> int:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    return 1
+
+
+class RedisBackend:
+    """
+    Keys are prefixed with "rcg:". Locks are redis locks that expire after lock_timeout, so a worker that
+    dies while computing doesn't block the entry.
+    """
+
+    def __init__(self, url: str, lock_timeout: float = 30):
+        # imported here so redis is only loaded when it's configured
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.lock_timeout = lock_timeout
+        self.errors = (redis.RedisError, pickle.PickleError)
+        return
+
+    def get(self, key: str) -> Any:
+        value = self.client.get("rcg:" + key)
+        return _MISSING if value is None else pickle.loads(value)
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self.client.set("rcg:" + key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ex=ttl)
+        return
+
+    def incr(self, key: str) -> int:
+        # a plain integer (not pickled), so redis can INCR it atomically
+        return int(self.client.incr("rcg:count:" + key))
+
+    def count(self, key: str) -> int:
+        return int(self.client.get("rcg:count:" + key) or 0)
+
+    def sweep(self) -> int:
+        # redis drops expired keys itself
+        return 0
+
+    @contextmanager
+    def lock(self, key: str, timeout: float) -> Iterator[bool]:
+        lock = self.client.lock("rcg:lock:" + key, timeout=self.lock_timeout, blocking_timeout=timeout)
+        acquired = lock.acquire()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except self.errors as e:
+                    # expired or unreachable: the entry is computed either way
+                    print(f"shared cache lock not released: {e!r}")
+        return
+
+
+class SharedCache:
+    """
+    get_or_compute() with stampede protection: on a miss, only the worker holding the entry's lock
+    computes it; the others wait for the lock and then read what it stored. A cache that can't be
+    reached is treated as a miss, so pages still render without it.
+
+    INPUTS:
+        backend (FileBackend | RedisBackend | None): None turns caching off
+        ttl (int): seconds an entry is kept
+        lock_timeout (float): longest wait for another worker's computation before computing anyway
+    """
+
+    def __init__(self, backend: Union[FileBackend, RedisBackend, None], ttl: int = 24 * 3600, lock_timeout: float = 30):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        return
+
+    def _read_version(self) -> int:
+        version = self.backend.count("data_version")
+        chart_cache.sync(version)
+        return version
+
+    def data_version(self) -> int:
+        if self.backend is None:
+            return 0
+        try:
+            return self._read_version()
+        except self.backend.errors as e:
+            print(f"shared cache unavailable: {e!r}")
+            return 0
+
+    def data_state(self) -> Union[Tuple[int, float], None]:
+        """
+        (data version, when it was bumped), the same in every worker, or None when the cache is off or
+        can't be reached.
+        """
+        if self.backend is None:
+            return None
+        try:
+            changed_at = self.backend.get("data_changed_at")
+            return self._read_version(), 0.0 if changed_at is _MISSING else changed_at
+        except self.backend.errors as e:
+            print(f"shared cache unavailable: {e!r}")
+            return None
+
+    def bump_data_version(self) -> None:
+        """
+        Called after the db changes: every entry keyed by the old version stops being read.
+        """
+        if self.backend is None:
+            return
+        try:
+            # set first, so a worker reading in between pairs the old version with a newer time, not the reverse
+            self.backend.set("data_changed_at", time.time(), 10 * 365 * 24 * 3600)
+            self.backend.incr("data_version")
+            self.backend.sweep()
+        except self.backend.errors as e:
+            print(f"shared cache unavailable, entries may be stale until they expire: {e!r}")
+        return
+
+    def get_or_compute(self, name: str, chart_date: str, compute: Callable[[], Any]) -> Any:
+        if self.backend is None:
+            return compute()
+        key = None
+        with ExitStack() as held:
+            try:
+                key = f"{name}:{chart_date}:{self._read_version()}"
+                value = self.backend.get(key)
+                if value is not _MISSING:
+                    return value
+                held.enter_context(self.backend.lock(key, self.lock_timeout))
+                value = self.backend.get(key)
+                if value is not _MISSING:
+                    return value
+            except self.backend.errors as e:
+                print(f"shared cache unavailable: {e!r}")
+            # outside the handler: compute() runs once, and its own errors reach the caller
+            value = compute()
+            if key is not None:
+                try:
+                    self.backend.set(key, value, self.ttl)
+                except self.backend.errors as e:
+                    print(f"shared cache unavailable: {e!r}")
+        return value
+
+
+def make_shared_cache() -> SharedCache:
+    config = shared_cache_config()
+    url = config["url"]
+    if url == "none":
+        backend = None
+    elif url.startswith(("redis://", "rediss://", "unix://")):
+        backend = RedisBackend(url, config["lock_timeout"])
+    else:
+        backend = FileBackend(url[len("file://"):] if url.startswith("file://") else url)
+    return SharedCache(backend, config["ttl"], config["lock_timeout"])
+
+
+_SHARED_CACHE: Union[SharedCache, None] = None
+
+
+def get_shared_cache() -> SharedCache:
+    """
+    Built on first use, after init_app() has loaded the .env files.
+    """
+    global _SHARED_CACHE
+    if _SHARED_CACHE is None:
+        _SHARED_CACHE = make_shared_cache()
+    return _SHARED_CACHE
+
+
+def shared_by_date(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorator like cached_by_date, for functions of (chart_date, chart_id=None) whose results every
+    worker can share. Stack it under @cached_by_date so each worker still keeps its own copy.
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(func)
+        def wrapper(chart_date: str, chart_id: Union[str, None] = None) -> Any:
+            key = name if chart_id in (None, RAP_CAVIAR_ID) else f"{name}:{chart_id}"
+            return get_shared_cache().get_or_compute(
+                key, chart_date, lambda: func(chart_date) if chart_id is None else func(chart_date, chart_id))
+        return wrapper
+    return decorator
@@ -0,0 +1,286 @@
+"""
+Read-only snapshot of the db in a local SQLite file, for a chart history that rarely changes.
+
+With SNAPSHOT_PATH set (and the file built by `python -m rcg.cli snapshot refresh`), db_query answers
+reads of the snapshot's tables from the file, in microseconds instead of a round trip to MySQL.
+Writes, queries on a given conn (transactions) and reads of other tables still go to MySQL.
+
+Any commit through db_query, transaction() or bulk_insert marks the snapshot stale (a <path>.stale
+file next to it), and every process reads from MySQL again until the next refresh. For writes made
+some other way, `snapshot status` compares the snapshot with MySQL.
+
+Text columns compare case-insensitively, as under MySQL's default collations; accents still count
+(sqlite's NOCASE only folds ASCII), so a query comparing names with different accents can differ.
+
+The file also works as a test fixture with no db server: see write_snapshot().
+"""
+import datetime
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import namedtuple
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+
+# table -> indexed columns (one list per index)
+SNAPSHOT_TABLES: Dict[str, List[List[str]]] = {
+    "chart": [["chart_id", "chart_date"], ["song_spotify_id"]],
+    "song": [["song_spotify_id"], ["artist_spotify_id"]],
+    "artist": [["spotify_id"]],
+    "group_table": [["group_spotify_id"]],
+    "chart_gender_daily": [["chart_id", "chart_date"]],
+    "chart_delta": [["chart_id", "chart_date"]],
+    "artist_posting": [["artist_spotify_id", "chart_id", "chart_date"]]
+}
+
+TABLE_NAMES = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)", re.IGNORECASE)
+
+SnapshotStatus = namedtuple(
+    "SnapshotStatus", ["path", "built_at", "age_seconds", "marked_stale", "matches_source", "stale"])
+
+
+def snapshot_config() -> Dict[str, Any]:
+    """
+    SNAPSHOT_PATH: the snapshot file; reads only use it when this is set
+    SNAPSHOT_CHECK_SECONDS: how often a process looks for a refreshed or stale-marked snapshot
+    """
+    return {
+        "path": os.getenv("SNAPSHOT_PATH"),
+        "check_seconds": float(os.getenv("SNAPSHOT_CHECK_SECONDS", 1))
+    }
+
+
+def default_snapshot_path() -> str:
+    return snapshot_config()["path"] or os.path.join(os.getcwd(), ".cache", "snapshot.sqlite3")
+
+
+def to_sqlite(q: str, params: Union[Sequence[Any], None] = None) -> str:
+    """
+    Rewrites a pymysql query for sqlite: %s placeholders, and the reserved column name primary.
+    """
+    if params is not None:
+        q = q.replace("%s", "?").replace("%%", "%")
+    return re.sub(r"\.primary\b", '."primary"', q)
+
+
+def _sqlite_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def write_snapshot(
+        path: str,
+        tables: Dict[str, Tuple[Sequence[str], Iterable[Sequence[Any]]]],
+        signature: Union[Dict[str, Any], None] = None
+) -> Dict[str, int]:
+    """
+    Writes a snapshot file from rows (streamed, not held in memory), then swaps it in atomically:
+    processes reading the old file switch at their next check.
+
+    INPUTS:
+        path (str)
+        tables (dict): table -> (columns, rows)
+        signature (dict): source_signature() of the data, for snapshot_status()
+
+    OUTPUT:
+        counts (dict): table -> rows written
+    """
+    started = time.time()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".sqlite3")
+    os.close(fd)
+    counts = {}
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        for table, (columns, rows) in tables.items():
+            # quoted, since some column names (primary) are sqlite keywords. NOCASE, since MySQL's default
+            # collations compare text case-insensitively (in =, IN, GROUP BY and ORDER BY alike)
+            column_list = ", ".join('"' + c + '" COLLATE NOCASE' for c in columns)
+            conn.execute(f"CREATE TABLE {table} ({column_list})")
+            placeholders = ", ".join(["?"] * len(columns))
+            cur = conn.executemany(
+                f"INSERT INTO {table} VALUES ({placeholders})",
+                (tuple(_sqlite_value(v) for v in row) for row in rows))
+            counts[table] = cur.rowcount
+            for i, index_columns in enumerate(SNAPSHOT_TABLES.get(table, [])):
+                if set(index_columns) <= set(columns):
+                    conn.execute(f"CREATE INDEX {table}_{i} ON {table} ({', '.join(index_columns)})")
+        conn.execute("CREATE TABLE snapshot_meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.executemany("INSERT INTO snapshot_meta VALUES (?, ?)", [
+            ("built_at", str(started)),
+            ("signature", json.dumps(signature or {}, sort_keys=True, default=str))
+        ])
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    # a write that landed while this was built left the marker (newer than started) in place
+    marker = path + ".stale"
+    if os.path.exists(marker) and os.path.getmtime(marker) <= started:
+        os.remove(marker)
+    return counts
+
+
+def source_signature() -> Dict[str, Any]:
+    """
+    Row counts of the snapshot tables in MySQL, plus the latest chart date and a checksum of genders
+    (which change in place).
+    """
+    # imported here: db imports this module
+    from .db import db_query, get_pool
+    from .schema import table_exists
+    tables = [table for table in SNAPSHOT_TABLES if table_exists(table)]
+    # on an explicit connection, so these are never answered from the snapshot itself
+    with get_pool().connection() as conn:
+        signature: Dict[str, Any] = {
+            table: db_query(f"SELECT COUNT(*) FROM {table}", conn, close=False)[0][0] for table in tables
+        }
+        signature["latest_chart_date"] = db_query("SELECT MAX(chart_date) FROM chart", conn, close=False)[0][0]
+        signature["genders"] = db_query(
+            "SELECT SUM(CRC32(COALESCE(gender, ''))) FROM artist", conn, close=False)[0][0]
+    return json.loads(json.dumps(signature, default=str))
+
+
+def build_snapshot(path: Union[str, None] = None) -> Dict[str, int]:
+    """
+    Copies the snapshot tables from MySQL into path (default: SNAPSHOT_PATH), streaming each table.
+
+    OUTPUT:
+        counts (dict): table -> rows written
+    """
+    from .db import db_query, db_stream
+    from .schema import table_exists
+    signature = source_signature()
+    tables = {}
+    for table in SNAPSHOT_TABLES:
+        if table_exists(table):
+            columns = [r[0] for r in db_query(f"SHOW COLUMNS FROM {table}")]
+            tables[table] = (columns, db_stream(f"SELECT * FROM {table}"))
+    return write_snapshot(path or default_snapshot_path(), tables, signature)
+
+
+def read_meta(path: str) -> Dict[str, str]:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return dict(conn.execute("SELECT key, value FROM snapshot_meta").fetchall())
+    finally:
+        conn.close()
+
+
+def snapshot_status(path: Union[str, None] = None, compare: bool = True) -> SnapshotStatus:
+    """
+    Whether a snapshot is stale: marked stale by a write, or (with compare) different from MySQL now.
+    """
+    path = path or default_snapshot_path()
+    if not os.path.exists(path):
+        return SnapshotStatus(path, None, None, False, None, True)
+    meta = read_meta(path)
+    built_at = float(meta["built_at"])
+    marked_stale = os.path.exists(path + ".stale")
+    matches_source = json.loads(meta["signature"]) == source_signature() if compare else None
+    return SnapshotStatus(
+        path, built_at, time.time() - built_at, marked_stale, matches_source,
+        marked_stale or matches_source is False
+    )
+
+
+def mark_snapshot_stale() -> None:
+    """
+    Called after commits: every process stops reading the snapshot until it's refreshed.
+    """
+    path = snapshot_config()["path"]
+    if path and os.path.exists(path):
+        with open(path + ".stale", "a"):
+            os.utime(path + ".stale")
+    return
+
+
+class SnapshotReader:
+    """
+    Answers db_query reads from a snapshot file: one read-only sqlite connection per thread (and
+    process), reopened when the file is replaced by a refresh. Every check_seconds it looks at the file
+    again; a stale marker or a missing file sends reads back to MySQL.
+    """
+
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path: str, check_seconds: float = 1):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._identity: Union[Tuple[int, int], None] = None
+        self._tables: frozenset = frozenset()
+        return
+
+    def _check(self) -> None:
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                if os.path.exists(self.path + ".stale"):
+                    raise FileNotFoundError
+                stat = os.stat(self.path)
+            except OSError:
+                self._identity = None
+                return
+            identity = (stat.st_ino, stat.st_mtime_ns)
+            if identity != self._identity:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+                try:
+                    self._tables = frozenset(
+                        r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+                finally:
+                    conn.close()
+                self._identity = identity
+        return
+
+    def covers(self, q: str) -> bool:
+        """
+        True for a SELECT whose tables are all in the (current, fresh) snapshot.
+        """
+        if time.monotonic() - self._checked_at > self.check_seconds:
+            self._check()
+        if self._identity is None or not q.lstrip().upper().startswith("SELECT"):
+            return False
+        tables = set(TABLE_NAMES.findall(q))
+        return bool(tables) and tables <= self._tables
+
+    def _connection(self) -> sqlite3.Connection:
+        key = (os.getpid(), self._identity)
+        if getattr(self._local, "key", None) != key:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            conn.create_function("CRC32", 1, lambda v: None if v is None else zlib.crc32(str(v).encode()))
+            self._local.conn, self._local.key = conn, key
+        return self._local.conn
+
+    def query(self, q: str, params: Union[Sequence[Any], None] = None) -> Tuple[Tuple[Any, ...], ...]:
+        cur = self._connection().execute(to_sqlite(q, params), tuple(params) if params is not None else ())
+        return tuple(cur.fetchall())
+
+
+_READER: Union[SnapshotReader, None] = None
+
+
+def snapshot_reader() -> Union[SnapshotReader, None]:
+    """
+    The process's reader for SNAPSHOT_PATH, or None when snapshot reads are off.
+    """
+    global _READER
+    config = snapshot_config()
+    if not config["path"]:
+        return None
+    if _READER is None or _READER.path != config["path"]:
+        _READER = SnapshotReader(config["path"], config["check_seconds"])
+    return _READER
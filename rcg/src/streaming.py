@@ -0,0 +1,127 @@
+"""
+Bulk export of the chart history as NDJSON or CSV, streamed from the db (see /api/export in routes.py).
+
+Rows come from db_stream and are formatted a chunk at a time, so memory stays flat whether the range
+is a day or years, and the first bytes go out before the query has finished.
+"""
+import csv
+import io
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from ..config.config import RAP_CAVIAR_ID
+from .dates import verify_date
+from .db import db_stream
+from .track import parse_chart_id
+
+# name -> (columns, query); queries take chart_id, start, end
+EXPORTS: Dict[str, Tuple[List[str], str]] = {
+    "chart": (
+        ["chart_date", "song_spotify_id", "song_name", "primary_artist_name", "primary_artist_spotify_id"],
+        """
+        SELECT chart_date, song_spotify_id, song_name, primary_artist_name, primary_artist_spotify_id
+        FROM chart
+        WHERE chart_id=%s AND chart_date BETWEEN %s AND %s
+        ORDER BY chart_date
+        """
+    ),
+    "credits": (
+        ["chart_date", "song_spotify_id", "song_name", "artist_spotify_id", "artist_name", "primary", "gender"],
+        """
+        SELECT
+            chart.chart_date,
+            chart.song_spotify_id,
+            chart.song_name,
+            song.artist_spotify_id,
+            artist.artist_name,
+            song.primary IN ('True', 't'),
+            artist.gender
+        FROM chart
+        INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
+        LEFT JOIN artist ON song.artist_spotify_id=artist.spotify_id
+        WHERE chart.chart_id=%s AND chart.chart_date BETWEEN %s AND %s
+        ORDER BY chart.chart_date
+        """
+    ),
+    "artists": (
+        ["artist_spotify_id", "artist_name", "gender", "credits", "first_charted", "last_charted"],
+        """
+        SELECT
+            song.artist_spotify_id,
+            MAX(artist.artist_name),
+            MAX(artist.gender),
+            COUNT(*),
+            MIN(chart.chart_date),
+            MAX(chart.chart_date)
+        FROM chart
+        INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
+        LEFT JOIN artist ON song.artist_spotify_id=artist.spotify_id
+        WHERE chart.chart_id=%s AND chart.chart_date BETWEEN %s AND %s
+        GROUP BY song.artist_spotify_id
+        """
+    )
+}
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _chunks(lines: Iterable[str], chunk_rows: int) -> Iterator[str]:
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_rows:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def format_ndjson(columns: List[str], rows: Iterable[Tuple[Any, ...]], chunk_rows: int = 500) -> Iterator[str]:
+    """
+    One JSON object per line, chunk_rows lines per yielded string.
+    """
+    return _chunks((json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows), chunk_rows)
+
+
+def format_csv(columns: List[str], rows: Iterable[Tuple[Any, ...]], chunk_rows: int = 500) -> Iterator[str]:
+    """
+    A header line (yielded on its own, before any row is read), then chunk_rows rows per yielded string.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(row: Iterable[Any]) -> str:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        return buffer.getvalue()
+
+    yield line(columns)
+    yield from _chunks((line(row) for row in rows), chunk_rows)
+
+
+def stream_export(
+        name: str,
+        start: str,
+        end: str,
+        output_format: str = "ndjson",
+        chart_id: str = RAP_CAVIAR_ID
+) -> Iterator[str]:
+    """
+    Checks the arguments right away (AssertionError for bad ones, KeyError for an unknown export), then
+    returns a generator of the formatted rows.
+
+    INPUTS:
+        name (str): a key of EXPORTS
+        start, end (str): chart dates, inclusive
+        output_format (str): a key of FORMATS
+        chart_id (str)
+    """
+    columns, q = EXPORTS[name]
+    verify_date(start)
+    verify_date(end)
+    assert start <= end, f"start ({start}) is after end ({end})"
+    assert output_format in FORMATS, f"format ({output_format}) is not one of {list(FORMATS)}"
+    rows = db_stream(q, params=(parse_chart_id(chart_id), start, end))
+    formatter = format_csv if output_format == "csv" else format_ndjson
+    return formatter(columns, rows)
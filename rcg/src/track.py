@@ -1,6 +1,9 @@
+import re
+from array import array
 from collections import namedtuple
 from typing import Any, Dict, Iterable, List, Union
 
+from ..config.config import RAP_CAVIAR_ID
 from .dates import verify_date
 
 Artist: tuple[str] = namedtuple(
@@ -11,6 +14,15 @@ Artist: tuple[str] = namedtuple(
     ]
 )
 
+CHART_COLUMNS = [
+    "song_name",
+    "song_spotify_id",
+    "primary_artist_name",
+    "primary_artist_spotify_id",
+    "chart_date",
+    "chart_id"
+]
+
 Appearance: tuple[str, str, str, str, bool] = namedtuple(
     "Appearance", [
         "song_spotify_id",
@@ -65,16 +77,18 @@ class Track:
             return ""
         return ", ".join(featured)
 
-    def format_for_charting(self, chart_date: str) -> str:
-        return "(" + ", ".join(
-            f'"{p}"' for p in
-            [
-                self.song_name,
-                self.song_spotify_id,
-                self.primary_artist_name,
-                self.primary_artist_id,
-                chart_date
-            ]) + ")"
+    def charting_row(self, chart_date: str, chart_id: str = RAP_CAVIAR_ID) -> tuple[str, ...]:
+        """
+        Values for CHART_COLUMNS.
+        """
+        return (
+            self.song_name,
+            self.song_spotify_id,
+            self.primary_artist_name,
+            self.primary_artist_id,
+            chart_date,
+            chart_id
+        )
 
     def appearances(self) -> list[Appearance]:
         """
@@ -92,13 +106,22 @@ class Track:
 
 
 class Chart:
+    """
+    INPUTS:
+        chart_date (str)
+        tracks (Iterable[Track])
+        chart_id (str): spotify playlist id (bare, URI or URL), default is Rap Caviar
+    """
+
     def __init__(
             self,
             chart_date: str,
-            tracks: List[Track]
+            tracks: Iterable[Track],
+            chart_id: str = RAP_CAVIAR_ID
     ):
         verify_date(chart_date)
         self.chart_date = chart_date
+        self.chart_id = parse_chart_id(chart_id)
         self.tracks = set(tracks)
         return
 
@@ -123,26 +146,154 @@ class Chart:
             for a in t.artists
         ])
 
-    def make_charting_query(self) -> str:
+    def charting_rows(self) -> list[tuple[str, ...]]:
         """
-        Constructs a single query string for adding all tracks to the database.
+        Rows for adding all tracks to the chart table (see CHART_COLUMNS).
+        """
+        return [t.charting_row(self.chart_date, self.chart_id) for t in self.tracks]
+
+
+class Codebook:
+    """
+    Interns spotify ids as small ints, keeping the first name seen for each.
+
+    Charts built with the same Codebook share its id and name lists, so scanning many dates costs a
+    few bytes per row instead of a tuple of strings per row.
+    """
 
-        OUTPUT:
-            q (str): mysql query string
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        return
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def code(self, spotify_id: str, name: str) -> int:
+        try:
+            return self.codes[spotify_id]
+        except KeyError:
+            self.codes[spotify_id] = len(self.ids)
+            self.ids.append(spotify_id)
+            self.names.append(name)
+            return self.codes[spotify_id]
+
+
+class ColumnarChart(Chart):
+    """
+    A Chart stored as parallel columns, one row per appearance: song code, artist code, primary flag.
+
+    Codes index into the song and artist Codebooks. Track and Artist objects are only built if
+    something asks for .tracks (iterating, comparing, templates); appearances() and artists() read the
+    columns directly.
+
+    Primary flags are normalized to True/False, same as charts parsed from spotify.
+
+    INPUTS:
+        chart_date (str)
+        songs (Codebook)
+        artists (Codebook)
+        song_codes (array)
+        artist_codes (array)
+        primary (array)
+        chart_id (str)
+    """
+
+    def __init__(
+            self,
+            chart_date: str,
+            songs: Codebook,
+            artists: Codebook,
+            song_codes: array,
+            artist_codes: array,
+            primary: array,
+            chart_id: str = RAP_CAVIAR_ID
+    ):
+        verify_date(chart_date)
+        assert len(song_codes) == len(artist_codes) == len(primary)
+        self.chart_date = chart_date
+        self.chart_id = parse_chart_id(chart_id)
+        self.songs = songs
+        self.artist_codebook = artists
+        self.song_codes = song_codes
+        self.artist_codes = artist_codes
+        self.primary = primary
+        self._tracks: Union[set[Track], None] = None
+        return
+
+    @classmethod
+    def from_appearances(
+            cls,
+            chart_date: str,
+            appearances: Iterable[Appearance],
+            songs: Union[Codebook, None] = None,
+            artists: Union[Codebook, None] = None,
+            chart_id: str = RAP_CAVIAR_ID
+    ) -> "ColumnarChart":
+        """
+        Builds the columns in one pass over appearances. Pass shared Codebooks when loading many dates.
         """
-        q = """
-                INSERT INTO
-                chart (
-                    song_name,
-                    song_spotify_id,
-                    primary_artist_name,
-                    primary_artist_spotify_id,
-                    chart_date
-                )
-                VALUES """
-
-        q += ",\n\t".join([t.format_for_charting(self.chart_date) for t in self.tracks]) + ";"
-        return q
+        songs = songs if songs is not None else Codebook()
+        artists = artists if artists is not None else Codebook()
+        song_codes, artist_codes, primary = array("I"), array("I"), array("b")
+        for a in appearances:
+            song_codes.append(songs.code(a.song_spotify_id, a.song_name))
+            artist_codes.append(artists.code(a.artist_spotify_id, a.artist_name))
+            primary.append(a.primary in ['T', 't', 'True', True])
+        return cls(chart_date, songs, artists, song_codes, artist_codes, primary, chart_id)
+
+    def __len__(self) -> int:
+        return len(self.song_codes)
+
+    @property
+    def tracks(self) -> set[Track]:
+        if self._tracks is None:
+            rows_by_song: Dict[int, List[int]] = {}
+            for i, song_code in enumerate(self.song_codes):
+                rows_by_song.setdefault(song_code, []).append(i)
+            self._tracks = set(
+                Track(
+                    self.songs.names[song_code],
+                    self.songs.ids[song_code],
+                    [self._artist(i) for i in rows]
+                ) for song_code, rows in rows_by_song.items()
+            )
+        return self._tracks
+
+    def _artist(self, i: int) -> Artist:
+        artist_code = self.artist_codes[i]
+        return Artist(self.artist_codebook.names[artist_code], self.artist_codebook.ids[artist_code], bool(self.primary[i]))
+
+    def song_ids(self) -> set[str]:
+        return set(self.songs.ids[c] for c in self.song_codes)
+
+    def artist_ids(self) -> set[str]:
+        return set(self.artist_codebook.ids[c] for c in self.artist_codes)
+
+    def appearances(self) -> list[Appearance]:
+        return [
+            Appearance(
+                self.songs.ids[s],
+                self.songs.names[s],
+                self.artist_codebook.ids[a],
+                self.artist_codebook.names[a],
+                bool(p)
+            ) for s, a, p in zip(self.song_codes, self.artist_codes, self.primary)
+        ]
+
+    def artists(self) -> set[Artist]:
+        return set(self._artist(i) for i in range(len(self)))
+
+
+def parse_chart_id(chart_id: str) -> str:
+    """
+    Reduces a playlist URI ("spotify:playlist:<id>") or URL ("https://open.spotify.com/playlist/<id>?si=...")
+    to the bare id, which is what the chart table stores.
+    """
+    chart_id = re.split(r"[:/]", chart_id.split("?")[0])[-1]
+    assert re.fullmatch(r"[0-9A-Za-z]+", chart_id), f"chart_id ({chart_id}) is not a spotify playlist id"
+    return chart_id
 
 
 def create_artist(name: str, spotify_id: str, primary: Union[str, bool] = False) -> Artist:
@@ -0,0 +1,192 @@
+"""Gender credit trends over date ranges, served from chart_gender_daily held in memory."""
+import math
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple, Union
+
+from ..config.config import RAP_CAVIAR_ID
+from .dates import verify_date
+from .db import db_query
+from .track import parse_chart_id
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+TREND_GENDERS = ['m', 'f', 'n']
+
+# resolution -> pandas offset alias; weeks start on monday, and periods are labelled by their first day
+RESOLUTIONS = {
+    "daily": "D",
+    "weekly": "W-MON",
+    "monthly": "MS"
+}
+
+
+def trend_max_points() -> int:
+    return int(os.getenv("TREND_MAX_POINTS", 120))
+
+
+class TrendIndex:
+    """
+    chart_id -> DataFrame of credits per chart date, one column per gender in TREND_GENDERS plus
+    "total" (every credit, including unknown genders) and "days" (1 per charted day).
+
+    Loaded from chart_gender_daily with one primary-key range read per chart_id, after which any
+    date range is a slice of the frame. As with GroupIndex, a cheap version of the rollup (row count,
+    latest date and credit checksums) is checked at most once every check_interval seconds, and the
+    frame reloads only if it changed.
+
+    INPUTS:
+        check_interval (float): seconds between version checks
+    """
+
+    def __init__(self, check_interval: float = 60):
+        self.check_interval = check_interval
+        self._frames: Dict[str, "pd.DataFrame"] = {}
+        self._versions: Dict[str, Tuple[Any, ...]] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        return
+
+    def daily(self, chart_id: str = RAP_CAVIAR_ID) -> "pd.DataFrame":
+        self.refresh(chart_id)
+        return self._frames[chart_id]
+
+    def refresh(self, chart_id: str = RAP_CAVIAR_ID, force: bool = False) -> None:
+        with self._lock:
+            checked_at = self._checked_at.get(chart_id, float("-inf"))
+            if not force and time.monotonic() - checked_at < self.check_interval:
+                return
+            # credits and a gender-weighted checksum change when older dates are recomputed in place
+            version = tuple(db_query(
+                """
+                SELECT COUNT(*), MAX(chart_date), SUM(credits), SUM(credits * CRC32(gender))
+                FROM chart_gender_daily WHERE chart_id=%s
+                """, params=(chart_id,))[0])
+            self._checked_at[chart_id] = time.monotonic()
+            if version == self._versions.get(chart_id):
+                return
+            self._frames[chart_id] = self._load(chart_id)
+            self._versions[chart_id] = version
+        return
+
+    def invalidate(self, chart_id: str = RAP_CAVIAR_ID) -> None:
+        """
+        Makes the next read check the version, instead of waiting out check_interval.
+        """
+        with self._lock:
+            self._checked_at.pop(chart_id, None)
+        return
+
+    def _load(self, chart_id: str) -> "pd.DataFrame":
+        rows = db_query(
+            "SELECT chart_date, gender, credits FROM chart_gender_daily WHERE chart_id=%s", params=(chart_id,))
+        return make_daily_frame(rows)
+
+
+def make_daily_frame(rows: List[Tuple[Any, ...]]) -> "pd.DataFrame":
+    """
+    INPUT:
+        rows (list): (chart_date, gender, credits)
+
+    OUTPUT:
+        daily (DataFrame): indexed by chart date, columns TREND_GENDERS + ["total", "days"]
+    """
+    # imported here so pandas stays off the web app's import path until a trend is first requested
+    import pandas as pd
+    columns = TREND_GENDERS + ["total", "days"]
+    if not rows:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name="chart_date"), dtype="int64")
+    df = pd.DataFrame(rows, columns=["chart_date", "gender", "credits"])
+    df["gender"] = df["gender"].fillna("?")
+    df["credits"] = df["credits"].astype("int64")
+    daily = df.pivot_table(index="chart_date", columns="gender", values="credits", aggfunc="sum", fill_value=0)
+    total = daily.sum(axis=1)
+    daily = daily.reindex(columns=TREND_GENDERS, fill_value=0)
+    daily["total"] = total
+    daily["days"] = 1
+    daily.index = pd.DatetimeIndex(pd.to_datetime(daily.index, format="%Y-%m-%d"), name="chart_date")
+    daily.columns.name = None
+    return daily.sort_index()
+
+
+def summarize_trend(
+        daily: "pd.DataFrame",
+        start: str,
+        end: str,
+        resolution: str = "daily",
+        max_points: Union[int, None] = None
+) -> List[Dict[str, Any]]:
+    """
+    Aggregates a daily frame (see make_daily_frame) to resolution, then merges neighbouring periods
+    until there are at most max_points of them.
+
+    INPUTS:
+        daily (DataFrame)
+        start (str): first date, inclusive
+        end (str): last date, inclusive
+        resolution (str): a key of RESOLUTIONS
+        max_points (int): default TREND_MAX_POINTS
+
+    OUTPUT:
+        points (list): one dict per period, with its first date, the number of charted days in it, and
+            per gender {"Total": credits per charted day, "Normalized": % of all credits} (as get_chart_stats)
+    """
+    assert resolution in RESOLUTIONS, f"resolution ({resolution}) should be one of {list(RESOLUTIONS)}"
+    max_points = max_points or trend_max_points()
+    assert max_points > 0, "max_points should be positive"
+    sums = daily.loc[start:end]
+    if resolution != "daily":
+        sums = sums.resample(RESOLUTIONS[resolution], label="left", closed="left").sum()
+    sums = sums[sums["days"] > 0]
+    if len(sums) > max_points:
+        step = math.ceil(len(sums) / max_points)
+        buckets = [i // step for i in range(len(sums))]
+        dates = sums.index[::step]
+        sums = sums.groupby(buckets).sum()
+        sums.index = dates
+    points = []
+    for date, row in sums.iterrows():
+        total = row["total"]
+        points.append({
+            "date": date.strftime("%Y-%m-%d"),
+            "days": int(row["days"]),
+            **{
+                g: {
+                    "Total": round(float(row[g]) / row["days"], 1),
+                    "Normalized": round(float(row[g]) / total * 100, 1) if total else 0
+                } for g in TREND_GENDERS
+            }
+        })
+    return points
+
+
+def get_trend(
+        start: str,
+        end: str,
+        resolution: str = "daily",
+        max_points: Union[int, None] = None,
+        chart_id: str = RAP_CAVIAR_ID
+) -> Dict[str, Any]:
+    """
+    Gender credits for every chart between start and end (inclusive), at most max_points of them.
+
+    OUTPUT:
+        trend (dict): the request, echoed back, and its points (see summarize_trend)
+    """
+    verify_date(start)
+    verify_date(end)
+    assert start <= end, f"start ({start}) is after end ({end})"
+    chart_id = parse_chart_id(chart_id)
+    points = summarize_trend(trend_index.daily(chart_id), start, end, resolution, max_points)
+    return {
+        "chart_id": chart_id,
+        "start": start,
+        "end": end,
+        "resolution": resolution,
+        "points": points
+    }
+
+
+trend_index = TrendIndex(check_interval=float(os.getenv("TREND_CHECK_INTERVAL", 60)))
@@ -0,0 +1,86 @@
+"""
+ASGI serving mode: the connexion app under uvicorn workers, with async routes in front of it.
+
+Routes listed here are served on the worker's event loop from the async driver (aiodb.py), so one
+worker has many of them in flight. Every other request falls through to the connexion app, which runs
+the Flask routes and the dash app in a2wsgi's thread pool.
+"""
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import connexion
+from flask import Flask
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import (HTMLResponse, JSONResponse, PlainTextResponse,
+                                 Response)
+from starlette.routing import Mount, Route
+
+from ..config.config import RAP_CAVIAR_ID
+from ..src.aiodb import close_async_pool
+from ..src.dates import get_date, latest_chart_date, verify_date
+from ..src.deltas import compare_charts_async
+from .conditional import (Validator, data_validator, not_modified,
+                          validator_headers)
+from .routes import render_report
+
+
+def make_asgi_app(connex_app: connexion.FlaskApp) -> Starlette:
+    flask_app: Flask = connex_app.app
+
+    async def report(request: Request) -> Response:
+        """
+        /report/<chart_date>, as routes.report: today's and yesterday's charts are resolved concurrently.
+        """
+        # the sync lookups (db, shared cache) run in a thread, off the event loop
+        latest = await asyncio.to_thread(latest_chart_date)
+        chart_date = request.path_params.get("chart_date") or latest
+        try:
+            verify_date(chart_date)
+        except AssertionError as e:
+            return PlainTextResponse(str(e), status_code=400)
+        conditional_headers = request.headers.get("if-none-match"), request.headers.get("if-modified-since")
+        # the flask route's endpoint, so both serve the same validator for the same page
+        validator = await asyncio.to_thread(data_validator, "web_routes.report", chart_date, {})
+        if validator and not_modified(validator, *conditional_headers):
+            return Response(status_code=304, headers=validator_headers(validator, chart_date, latest))
+        yesterday_date = get_date(chart_date, 1)
+        delta = await compare_charts_async(yesterday_date, chart_date)
+        # a request context so the template's url_for() resolves as it does under flask
+        with flask_app.test_request_context(request.url.path):
+            body = render_report(chart_date, yesterday_date, delta)
+        validator = validator or Validator(hashlib.sha1(body.encode()).hexdigest(), None)
+        headers = validator_headers(validator, chart_date, latest)
+        if not_modified(validator, *conditional_headers):
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(body, headers=headers)
+
+    async def compare(request: Request) -> Response:
+        """
+        /api/compare, as routes.compare.
+        """
+        end = request.query_params.get("date") or await asyncio.to_thread(latest_chart_date)
+        try:
+            verify_date(end)
+            start = request.query_params.get("start") or get_date(end, int(request.query_params.get("days", 1)))
+            delta = await compare_charts_async(start, end, request.query_params.get("chart_id", RAP_CAVIAR_ID))
+        except (AssertionError, ValueError) as e:
+            return PlainTextResponse(str(e), status_code=400)
+        return JSONResponse(delta)
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        yield
+        await close_async_pool()
+
+    return Starlette(
+        routes=[
+            Route("/report", report),
+            Route("/report/{chart_date}", report),
+            Route("/api/compare", compare),
+            Mount("/", app=connex_app)
+        ],
+        lifespan=lifespan
+    )
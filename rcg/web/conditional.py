@@ -0,0 +1,103 @@
+"""Conditional GET (ETag / Last-Modified) and Cache-Control for routes that serve one chart date."""
+import hashlib
+import os
+from collections import namedtuple
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Any, Callable, Dict, Tuple, Union
+
+from flask import Response, make_response, request
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+from ..src.dates import latest_chart_date, verify_date
+from ..src.shared_cache import get_shared_cache
+from .fingerprint import template_fingerprint, template_modified_at
+
+# etag: digest of the url, the data version and the templates; last_modified: the later of the last
+# data version bump and the newest template (None when only the body can be hashed)
+Validator = namedtuple("Validator", ["etag", "last_modified"])
+
+
+def cache_control_config() -> Dict[str, int]:
+    """
+    HTTP_MAX_AGE: seconds browsers and CDNs may reuse a past date's page (it won't change)
+    HTTP_MAX_AGE_LATEST: the same for the latest date, which is replaced at the next ingest
+    """
+    return {
+        "max_age": int(os.getenv("HTTP_MAX_AGE", 30 * 24 * 3600)),
+        "max_age_latest": int(os.getenv("HTTP_MAX_AGE_LATEST", 300))
+    }
+
+
+def data_validator(endpoint: str, chart_date: str, kwargs: Dict[str, Any]) -> Union[Validator, None]:
+    """
+    The validator of a page, from what it's rendered from rather than from the rendered body: every
+    worker computes the same one without rendering or querying anything.
+
+    OUTPUT:
+        validator (Validator | None): None when the shared cache is off or unreachable, since the data
+            version is then unknown
+    """
+    state = get_shared_cache().data_state()
+    if state is None:
+        return None
+    version, changed_at = state
+    etag = hashlib.sha1("|".join(
+        [endpoint, chart_date, str(version), template_fingerprint()] + [f"{k}={v}" for k, v in sorted(kwargs.items())]
+    ).encode()).hexdigest()
+    last_modified = datetime.fromtimestamp(max(changed_at, template_modified_at()), timezone.utc)
+    return Validator(etag, last_modified.replace(microsecond=0))
+
+
+def not_modified(validator: Validator, if_none_match: Union[str, None], if_modified_since: Union[str, None]) -> bool:
+    """
+    Whether a request's If-None-Match (or, without one, If-Modified-Since) header matches validator.
+    """
+    if if_none_match:
+        return parse_etags(if_none_match).contains(validator.etag)
+    since = parse_date(if_modified_since)
+    return bool(validator.last_modified and since and since >= validator.last_modified)
+
+
+def validator_headers(validator: Validator, chart_date: str, latest: str) -> Dict[str, str]:
+    """
+    ETag, Last-Modified and Cache-Control for a page of chart_date, given the latest chart date.
+    """
+    config = cache_control_config()
+    max_age = config["max_age_latest" if chart_date >= latest else "max_age"]
+    headers = {"ETag": quote_etag(validator.etag), "Cache-Control": f"public, max-age={max_age}"}
+    if validator.last_modified:
+        headers["Last-Modified"] = http_date(validator.last_modified)
+    return headers
+
+
+def conditional(view: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Decorator for views taking a chart_date (default: the latest chart).
+
+    The validator comes from the shared data version (bumped by every ingest) and the templates, so a
+    request whose If-None-Match / If-Modified-Since matches it gets a 304 from any worker without the
+    view running, so without any queries. With the shared cache off, the ETag is a hash of the rendered
+    body instead: the view always runs, and only the transfer is saved.
+    """
+    @wraps(view)
+    def wrapper(chart_date: Union[str, None] = None, **kwargs: Any) -> Response:
+        latest = latest_chart_date()
+        chart_date = chart_date or latest
+        verify_date(chart_date)
+        validator = data_validator(request.endpoint, chart_date, kwargs)
+        if validator and not_modified(validator, *_conditional_headers()):
+            return Response(status=304, headers=validator_headers(validator, chart_date, latest))
+        response = make_response(view(chart_date, **kwargs))
+        if response.status_code != 200:
+            return response
+        validator = validator or Validator(hashlib.sha1(response.get_data()).hexdigest(), None)
+        response.headers.update(validator_headers(validator, chart_date, latest))
+        if not_modified(validator, *_conditional_headers()):
+            return Response(status=304, headers=validator_headers(validator, chart_date, latest))
+        return response
+    return wrapper
+
+
+def _conditional_headers() -> Tuple[Union[str, None], Union[str, None]]:
+    return request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since")
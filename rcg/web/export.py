@@ -0,0 +1,213 @@
+"""
+Static export of the site: /, every /<chart_date>, every /report/<chart_date> and the bar SVGs, written
+to a directory any static file server can serve (with gzip/brotli siblings for servers that send them
+precompressed, e.g. nginx gzip_static / brotli_static).
+
+Pages are rendered through the Flask app's test client in a process pool. Each page's fingerprint (a
+digest of the rows it's drawn from, plus the templates and static files) is kept in manifest.json,
+so a re-export only renders pages whose data or templates changed.
+
+    python -m rcg.cli export -o site -w 8
+
+A /<chart_date> page is written as <chart_date>/index.html. The dash pages need a server and aren't
+exported.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Union
+
+from ..config.config import RAP_CAVIAR_ID
+from ..src.dates import get_date, latest_chart_date
+from ..src.db import db_query
+from .fingerprint import ROOT, template_fingerprint
+
+# bump when pages change in a way the templates and static files don't show
+EXPORT_VERSION = 1
+
+Page = namedtuple("Page", ["url", "path", "fingerprint"])
+
+ExportResult = namedtuple("ExportResult", ["rendered", "skipped", "failed", "seconds"])
+
+
+def data_fingerprints(chart_id: str = RAP_CAVIAR_ID) -> Dict[str, str]:
+    """
+    A digest per chart date of what its pages show, from two grouped scans: its chart rows with their
+    songs' credits and those artists' names and genders (so a renamed artist, a gender edit or a credit
+    added to a song changes every date the song charted on), and its chart_gender_daily rows.
+
+    OUTPUT:
+        fingerprints (dict): chart_date -> digest
+    """
+    parts: Dict[str, List[str]] = {}
+    for chart_date, *values in db_query(
+            """
+            SELECT chart.chart_date, COUNT(*), SUM(CRC32(chart.song_spotify_id)), SUM(CRC32(chart.song_name)),
+            SUM(CRC32(song.artist_spotify_id)), SUM(CRC32(song.primary)),
+            SUM(CRC32(artist.artist_name)), SUM(CRC32(artist.gender))
+            FROM chart
+            LEFT JOIN song ON song.song_spotify_id = chart.song_spotify_id
+            LEFT JOIN artist ON artist.spotify_id = song.artist_spotify_id
+            WHERE chart.chart_id=%s GROUP BY chart.chart_date
+            """, params=(chart_id,)):
+        parts.setdefault(chart_date, []).append(repr(values))
+    for chart_date, gender, credits in db_query(
+            "SELECT chart_date, gender, credits FROM chart_gender_daily WHERE chart_id=%s ORDER BY chart_date, gender",
+            params=(chart_id,)):
+        parts.setdefault(chart_date, []).append(f"{gender}:{credits}")
+    return {d: hashlib.sha1("|".join(p).encode()).hexdigest() for d, p in sorted(parts.items())}
+
+
+def code_fingerprint() -> str:
+    """
+    A digest of the templates and static files, so changing either re-renders everything.
+    """
+    return hashlib.sha1(f"{EXPORT_VERSION}:{template_fingerprint()}".encode()).hexdigest()
+
+
+def plan_pages(fingerprints: Dict[str, str], latest: str, code: str) -> List[Page]:
+    """
+    Every page of the site, each with the fingerprint of what it's rendered from (a report also
+    depends on the day before).
+
+    INPUTS:
+        fingerprints (dict): from data_fingerprints()
+        latest (str): the chart date served at /
+        code (str): from code_fingerprint()
+    """
+    def digest(*parts: str) -> str:
+        return hashlib.sha1("|".join((code,) + parts).encode()).hexdigest()
+
+    pages = []
+    if latest in fingerprints:
+        pages.append(Page("/", "index.html", digest(latest, fingerprints[latest])))
+    for chart_date, fingerprint in fingerprints.items():
+        yesterday = get_date(chart_date, 1)
+        pages += [
+            Page(f"/{chart_date}", f"{chart_date}/index.html", digest(fingerprint)),
+            Page(
+                f"/report/{chart_date}", f"report/{chart_date}/index.html",
+                digest(fingerprint, yesterday, fingerprints.get(yesterday, ""))
+            ),
+            Page(f"/bars/{chart_date}/total.svg", f"bars/{chart_date}/total.svg", digest(fingerprint)),
+            Page(f"/bars/{chart_date}/normalized.svg", f"bars/{chart_date}/normalized.svg", digest(fingerprint))
+        ]
+    return pages
+
+
+def load_manifest(out_dir: str) -> Dict[str, str]:
+    try:
+        with open(os.path.join(out_dir, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def pages_to_render(pages: List[Page], manifest: Dict[str, str], out_dir: str) -> List[Page]:
+    """
+    The pages whose fingerprint isn't in the manifest, or whose file is gone.
+    """
+    return [
+        p for p in pages
+        if manifest.get(p.path) != p.fingerprint or not os.path.exists(os.path.join(out_dir, p.path))
+    ]
+
+
+def write_file(path: str, data: bytes, compress: bool = True) -> None:
+    """
+    Writes data atomically, plus (with compress) path.gz and, if the brotli package is installed, path.br.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    versions = [("", data)]
+    if compress:
+        versions.append((".gz", gzip.compress(data, 9, mtime=0)))
+        try:
+            # optional: only needed for .br files
+            import brotli
+            versions.append((".br", brotli.compress(data)))
+        except ImportError:
+            pass
+    for suffix, content in versions:
+        with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(path), delete=False) as f:
+            f.write(content)
+        os.replace(f.name, path + suffix)
+    return
+
+
+_CLIENT = None
+
+
+def _init_worker() -> None:
+    global _CLIENT
+    # pages are rendered from the db: not read from (or written into) the shared cache, whose entries
+    # may come from older templates, and which an export would flood with every page of the site
+    os.environ["SHARED_CACHE_URL"] = "none"
+    # the app is only built in the pool's processes, with the web routes registered by app.py
+    from app import app
+    _CLIENT = app.test_client()
+    return
+
+
+def _render(page: Page, out_dir: str) -> Tuple[Page, Union[str, None]]:
+    """
+    OUTPUT:
+        (page, error): error is None if the page was written
+    """
+    try:
+        response = _CLIENT.get(page.url)
+        if response.status_code != 200:
+            return page, f"status {response.status_code}"
+        write_file(os.path.join(out_dir, page.path), response.get_data())
+    except Exception as e:
+        return page, repr(e)
+    return page, None
+
+
+def export_site(out_dir: str, max_workers: Union[int, None] = None, force: bool = False) -> ExportResult:
+    """
+    Renders every changed page into out_dir (all of them with force) and updates its manifest.
+
+    Pages that fail are reported and left out of the manifest, so the next export retries them.
+
+    INPUTS:
+        out_dir (str)
+        max_workers (int): rendering processes, default is one per cpu
+        force (bool): ignore the manifest
+    """
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    # looked up here so the pool's processes inherit LATEST_CHART_DATE instead of each querying it
+    latest = latest_chart_date()
+    pages = plan_pages(data_fingerprints(), latest, code_fingerprint())
+    manifest = {} if force else load_manifest(out_dir)
+    todo = pages_to_render(pages, manifest, out_dir)
+
+    static_dir = os.path.join(out_dir, "static")
+    shutil.copytree(os.path.join(ROOT, "static"), static_dir, dirs_exist_ok=True)
+    for directory, _, file_names in os.walk(static_dir):
+        for file_name in file_names:
+            if file_name.endswith((".css", ".js", ".svg")):
+                with open(os.path.join(directory, file_name), "rb") as f:
+                    write_file(os.path.join(directory, file_name), f.read())
+
+    failed = []
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+            results = executor.map(_render, todo, [out_dir] * len(todo), chunksize=16)
+            for page, error in results:
+                if error:
+                    failed.append((page.url, error))
+                    manifest.pop(page.path, None)
+                else:
+                    manifest[page.path] = page.fingerprint
+    finally:
+        # saved even if the export is interrupted, so finished pages aren't rendered again
+        manifest_json = json.dumps(manifest, indent=1, sort_keys=True).encode()
+        write_file(os.path.join(out_dir, "manifest.json"), manifest_json, compress=False)
+    return ExportResult(len(todo) - len(failed), len(pages) - len(todo), failed, time.perf_counter() - start)
@@ -0,0 +1,38 @@
+"""What pages are rendered from besides the data: the templates, the static files and the bar charts' code."""
+import hashlib
+import os
+from functools import lru_cache
+from typing import List
+
+from ..src.bars import RENDER_VERSION
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _template_files() -> List[str]:
+    paths = []
+    for folder in ["templates", "static"]:
+        for directory, _, file_names in sorted(os.walk(os.path.join(ROOT, folder))):
+            paths += [os.path.join(directory, file_name) for file_name in sorted(file_names)]
+    return paths
+
+
+@lru_cache(maxsize=1)
+def template_fingerprint() -> str:
+    """
+    A digest of the templates and static files (read once per process: a deploy restarts the workers).
+    """
+    digest = hashlib.sha1(f"{RENDER_VERSION}".encode())
+    for path in _template_files():
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def template_modified_at() -> float:
+    """
+    The newest modification time of the templates and static files.
+    """
+    return max((os.path.getmtime(path) for path in _template_files()), default=0.0)
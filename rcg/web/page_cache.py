@@ -0,0 +1,25 @@
+"""Rendered pages, shared by every worker through the shared cache."""
+from functools import wraps
+from typing import Any, Callable
+
+from flask import request
+
+from ..src.shared_cache import get_shared_cache
+from .fingerprint import template_fingerprint
+
+
+def shared_page(view: Callable[..., str]) -> Callable[..., str]:
+    """
+    Decorator for views of (chart_date, **kwargs) that return rendered html. Goes under @conditional,
+    which resolves chart_date.
+
+    Pages are keyed by endpoint + url arguments + the templates' fingerprint + chart_date + data
+    version, and computed by one worker at a time (see SharedCache.get_or_compute). With the
+    fingerprint, workers of a new deploy don't serve pages rendered by the old templates.
+    """
+    @wraps(view)
+    def wrapper(chart_date: str, **kwargs: Any) -> str:
+        name = ":".join(
+            ["page", request.endpoint, template_fingerprint()[:12]] + [f"{k}={v}" for k, v in sorted(kwargs.items())])
+        return get_shared_cache().get_or_compute(name, chart_date, lambda: view(chart_date, **kwargs))
+    return wrapper
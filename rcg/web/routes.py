@@ -1,11 +1,20 @@
 import os
 from typing import Any, Union
 
-from flask import Blueprint, render_template
+from flask import Blueprint, Response, abort, render_template, request
 
-from ..src import get_chart_stats, load_chart, load_spotify_chart, make_tally
+from ..config.config import RAP_CAVIAR_ID
+from ..src import load_chart_view, load_spotify_chart
 from ..src.adding import add_chart_to_db
-from ..src.dates import get_date, verify_date
+from ..src.bars import BarCharts, get_bar_charts
+from ..src.dates import get_date, latest_chart_date, verify_date
+from ..src.deltas import compare_charts
+from ..src.postings import get_artist_history
+from ..src.scheduler import ingest_playlists
+from ..src.streaming import EXPORTS, FORMATS, stream_export
+from ..src.trend import get_trend
+from .conditional import conditional
+from .page_cache import shared_page
 
 web_routes = Blueprint("web_routes", __name__)
 
@@ -23,7 +32,7 @@ def testo():
 @web_routes.route("/dpt/<chart_date>")
 def date_picker_test(chart_date: Union[str, None] = None) -> str:
     if chart_date is None:
-        chart_date = os.environ["LATEST_CHART_DATE"]
+        chart_date = latest_chart_date()
     verify_date(chart_date)
     return render_template(
         "date-picker-test.html",
@@ -37,37 +46,157 @@ def update() -> dict[Any, Any]:
     return get_chart_delta(new_chart.chart_date, True)
 
 
+@web_routes.route("/update/XXYYXX/all", methods=["GET"])
+def update_all() -> dict[Any, Any]:
+    return {r.chart_id: r._asdict() for r in ingest_playlists()}
+
+
+@web_routes.route("/api/trend", methods=["GET"])
+def trend() -> dict[Any, Any]:
+    """
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD&resolution=daily|weekly|monthly&points=N&chart_id=...
+
+    end defaults to the latest chart, start to 90 days before end.
+    """
+    end = request.args.get("end") or latest_chart_date()
+    try:
+        verify_date(end)
+        return get_trend(
+            request.args.get("start") or get_date(end, 90),
+            end,
+            request.args.get("resolution", "daily"),
+            request.args.get("points", type=int),
+            request.args.get("chart_id", RAP_CAVIAR_ID)
+        )
+    except (AssertionError, ValueError) as e:
+        abort(400, str(e))
+
+
+@web_routes.route("/api/compare", methods=["GET"])
+def compare() -> dict[Any, Any]:
+    """
+    ?date=YYYY-MM-DD&days=N or ?date=YYYY-MM-DD&start=YYYY-MM-DD, and &chart_id=...
+
+    Tracks and artists added to / removed from the chart between start (default: N days before date,
+    N defaulting to 1) and date (default: the latest chart).
+    """
+    end = request.args.get("date") or latest_chart_date()
+    try:
+        verify_date(end)
+        start = request.args.get("start") or get_date(end, request.args.get("days", 1, type=int))
+        return compare_charts(start, end, request.args.get("chart_id", RAP_CAVIAR_ID))
+    except (AssertionError, ValueError) as e:
+        abort(400, str(e))
+
+
+@web_routes.route("/api/export/<name>", methods=["GET"])
+def export(name: str) -> Response:
+    """
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD&format=ndjson|csv&chart_id=...
+
+    name is "chart", "credits" (one row per artist credit) or "artists" (credits and gender per artist).
+    end defaults to the latest chart, start to end. The rows are streamed as they're read.
+    """
+    if name not in EXPORTS:
+        abort(404)
+    end = request.args.get("end") or latest_chart_date()
+    output_format = request.args.get("format", "ndjson")
+    try:
+        rows = stream_export(
+            name,
+            request.args.get("start") or end,
+            end,
+            output_format,
+            request.args.get("chart_id", RAP_CAVIAR_ID)
+        )
+    except (AssertionError, ValueError) as e:
+        abort(400, str(e))
+    return Response(rows, mimetype=FORMATS[output_format], headers={
+        "Content-Disposition": f'attachment; filename="{name}.{output_format}"',
+        # so a buffering proxy (nginx) passes chunks on as they come
+        "X-Accel-Buffering": "no"
+    })
+
+
+@web_routes.route("/api/artist/<spotify_id>", methods=["GET"])
+def artist_history(spotify_id: str) -> dict[Any, Any]:
+    """
+    ?chart_id=...
+
+    Every date the artist charted (with the songs, primary or featured), credit counts and streaks.
+    """
+    try:
+        history = get_artist_history(spotify_id, request.args.get("chart_id", RAP_CAVIAR_ID))
+    except AssertionError as e:
+        abort(400, str(e))
+    if history is None:
+        abort(404)
+    return history
+
+
+@web_routes.route("/artist/<spotify_id>")
+def artist_page(spotify_id: str) -> str:
+    history = get_artist_history(spotify_id)
+    if history is None:
+        abort(404)
+    return render_template("artist.html", history=history)
+
+
 @web_routes.route("/")
 @web_routes.route("/<chart_date>")
+@conditional
+@shared_page
 def make_latest_chart(chart_date: Union[str, None] = None) -> str:
     if chart_date is None:
-        chart_date = os.environ["LATEST_CHART_DATE"]
+        chart_date = latest_chart_date()
     verify_date(chart_date)
-    tally = make_tally(chart_date)
-    assert tally, f"no chart date for {chart_date}"
-    chart = load_chart(chart_date)
-    count_data = get_chart_stats(chart_date)
+    view = load_chart_view(chart_date)
+    assert view.tally, f"no chart date for {chart_date}"
     return render_template(
         "home.html",
         chart_date=chart_date,
-        count_data=count_data,
-        tally=tally,
-        chart_w_features=[t._todict() for t in chart]
+        count_data=view.stats,
+        bars=get_bar_charts(chart_date),
+        tally=view.tally,
+        chart_w_features=[t._todict() for t in view.chart]
     )
 
 
+@web_routes.route("/bars/<chart_date>/<kind>.svg")
+@conditional
+def bar_chart(chart_date: str, kind: str) -> Response:
+    """
+    kind is "total" or "normalized".
+    """
+    verify_date(chart_date)
+    if kind not in BarCharts._fields[1:]:
+        abort(404)
+    return Response(getattr(get_bar_charts(chart_date), kind), mimetype="image/svg+xml")
+
+
 @web_routes.route("/report")
 @web_routes.route("/report/<chart_date>")
+@conditional
+@shared_page
+def report(chart_date: Union[str, None] = None) -> str:
+    return get_chart_delta(chart_date)
+
+
 def get_chart_delta(chart_date: Union[str, None] = None, updated: bool = False) -> str:
     if chart_date is None:
-        chart_date = os.getenv("LATEST_CHART_DATE")
+        chart_date = latest_chart_date()
     verify_date(chart_date)
     yesterday_date = get_date(chart_date, 1)
-    today_chart, yesterday_chart = (load_chart(d) for d in [chart_date, yesterday_date])
-    if yesterday_chart.tracks:
-        added_to_chart = today_chart.tracks - yesterday_chart.tracks
-        removed_from_chart = yesterday_chart.tracks - today_chart.tracks
+    return render_report(chart_date, yesterday_date, compare_charts(yesterday_date, chart_date), updated)
+
 
+def render_report(chart_date: str, yesterday_date: str, delta: dict[str, Any], updated: bool = False) -> str:
+    """
+    Renders report.html from compare_charts(yesterday_date, chart_date).
+    """
+    if delta["start"] == yesterday_date:
+        added_to_chart = delta["tracks"]["added"]
+        removed_from_chart = delta["tracks"]["removed"]
     else:
         yesterday_date += " **NO CHART IN DB**"
         added_to_chart = None
@@ -6,7 +6,7 @@ from logging.handlers import RotatingFileHandler
 import pytest
 from pretest_setup import pretest_setup
 
-from rcg.src import parse_spotify_chart
+from rcg.src.adding import parse_spotify_chart
 from rcg.src.track import Chart
 
 
@@ -3,6 +3,7 @@ import os
 import pandas as pd
 
 from rcg.src.db import db_query, make_sql_engine
+from rcg.src.schema import ensure_schema
 
 
 def pretest_setup():
@@ -18,6 +19,7 @@ def pretest_setup():
         print(t)
         df = pd.read_csv(os.path.join(test_dir, f'{t}_df.csv'))
         df.to_sql(t, con=engine, if_exists='replace', index=False)
+    ensure_schema(dedupe=True)
     print('db setup!')
     assert db_query('select count(*) from chart where chart_date="2022-12-31"'
                     ) == ((50,),)
@@ -0,0 +1,17 @@
+from starlette.testclient import TestClient
+
+from asgi import app
+
+
+def test_flask_routes_fall_through():
+    with TestClient(app) as client:
+        response = client.get("/testo")
+    assert response.status_code == 200
+    assert " • " in response.text
+
+
+def test_async_routes_reject_bad_input():
+    with TestClient(app) as client:
+        assert client.get("/report/12-31-2022").status_code == 400
+        assert client.get("/api/compare?date=2023-01-01&days=-7").status_code == 400
+        assert client.get("/api/compare?date=2023-01-01&start=2023-02-01").status_code == 400
@@ -0,0 +1,30 @@
+import os
+import shutil
+
+from rcg.src.backfill import _drop_duplicates, find_dumps, parse_dump
+
+
+def test_parse_dumps(tmp_path):
+    source = os.path.join(os.getcwd(), "tests/test_data/test_chart.json")
+    for name in ["rapcaviar_2023-02-02.json", "2023-02-01.json", "notes.txt"]:
+        shutil.copy(source, tmp_path / name)
+    dumps = find_dumps(str(tmp_path))
+    assert [d for d, _ in dumps] == ["2023-02-01", "2023-02-02"]
+    chart = parse_dump(*dumps[0])
+    assert chart.chart_date == "2023-02-01"
+    assert chart.chart_id == "37i9dQZF1DX0XUsuxWHRQd"
+    assert len(chart.tracks) == 51
+
+
+def test_dumps_sharing_a_date(tmp_path):
+    source = os.path.join(os.getcwd(), "tests/test_data/test_chart.json")
+    for name in ["rapcaviar_2023-02-01.json", "other_2023-02-01.json"]:
+        shutil.copy(source, tmp_path / name)
+    dumps = find_dumps(str(tmp_path))
+    assert [os.path.basename(p) for _, p in dumps] == ["other_2023-02-01.json", "rapcaviar_2023-02-01.json"]
+    rap_caviar, other = parse_dump(*dumps[1]), parse_dump(*dumps[0], chart_id="otherPlaylist")
+    kept = _drop_duplicates([rap_caviar, other], ["a", "b"])
+    assert [c.chart_id for c in kept] == ["37i9dQZF1DX0XUsuxWHRQd", "otherPlaylist"]
+    # two dumps of the same playlist and day: the later one wins, nothing is merged
+    later = parse_dump(*dumps[0])
+    assert [c is later for c in _drop_duplicates([rap_caviar, later], ["a", "b"])] == [True]
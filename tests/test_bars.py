@@ -0,0 +1,34 @@
+import xml.etree.ElementTree as ET
+
+from rcg.src.bars import _read_or_render, render_bar_svg, tick_step
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+def test_tick_step():
+    assert tick_step(110) == 20
+    assert tick_step(92.4) == 20
+    assert tick_step(6) == 1
+    assert tick_step(1) == 0.2
+
+
+def test_render_bar_svg():
+    svg = ET.fromstring(render_bar_svg({'m': 70, 'f': 20, 'n': 10}, False, "2022-12-31"))
+    bars = [r for r in svg.iter(f"{SVG}rect") if r.get("fill") != "black"]
+    assert [b.find(f"{SVG}title").text for b in bars] == ["Male: 70", "Female: 20", "Non-Binary: 10"]
+    heights = [float(b.get("height")) for b in bars]
+    assert heights[0] == max(heights) and abs(heights[1] / heights[0] - 2 / 7) < 0.01
+    texts = [t.text for t in svg.iter(f"{SVG}text")]
+    assert "(2022-12-31)" in texts
+
+
+def test_render_normalized_and_empty():
+    svg = render_bar_svg({'m': 62, 'f': 30, 'n': 8}, True, "2022-12-31")
+    assert "62.0%" in svg and "% of Artist Credits" in svg
+    ET.fromstring(render_bar_svg({'m': 0, 'f': 0, 'n': 0}, False, "2022-12-31"))
+
+
+def test_read_or_render_keeps_svg_on_disk(tmp_path):
+    path = str(tmp_path / "chart" / "2022-12-31-total-abc.svg")
+    assert _read_or_render(path, lambda: "<svg/>") == "<svg/>"
+    assert _read_or_render(path, lambda: "rendered again") == "<svg/>"
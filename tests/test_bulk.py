@@ -0,0 +1,40 @@
+from rcg.src.bulk import bulk_insert
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def executemany(self, q, batch):
+        self.conn.batches.append((len(batch), self.conn.produced))
+        return len(batch)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.batches = []
+        self.produced = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def test_bulk_insert_streams_batches(monkeypatch):
+    monkeypatch.delenv("MYSQL_LOCAL_INFILE", raising=False)
+    conn = FakeConnection()
+
+    def rows():
+        for i in range(25):
+            conn.produced += 1
+            yield (i, str(i))
+
+    assert bulk_insert("chart", ["a", "b"], rows(), conn=conn, commit=False, batch_size=10) == 25
+    # (rows in the batch, rows read from the generator when it was sent): never more than a batch ahead
+    assert conn.batches == [(10, 10), (10, 20), (5, 25)]
+    assert bulk_insert("chart", ["a", "b"], iter([]), conn=conn, commit=False) == 0
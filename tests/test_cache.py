@@ -0,0 +1,59 @@
+from rcg.src.bio_cache import BioCache
+from rcg.src.cache import ChartCache, cached_by_date
+
+
+def test_lru_eviction():
+    cache = ChartCache(max_entries=2)
+    cache.set("2022-12-29", "chart", 1)
+    cache.set("2022-12-30", "chart", 2)
+    cache.get("2022-12-29", "chart")
+    cache.set("2022-12-31", "chart", 3)
+    assert ("2022-12-30", "chart") not in cache
+    assert cache.get("2022-12-29", "chart") == 1
+
+
+def test_byte_eviction():
+    cache = ChartCache(max_bytes=2000)
+    for i in range(10):
+        cache.set(f"2022-12-{i + 10}", "tally", "x" * 500)
+    assert cache.nbytes <= 2000
+    assert len(cache) < 10
+
+
+def test_invalidate_one_date():
+    cache = ChartCache()
+    for kind in ["chart", "tally", "stats"]:
+        cache.set("2022-12-31", kind, kind)
+        cache.set("2022-12-30", kind, kind)
+    cache.invalidate("2022-12-31")
+    assert len(cache) == 3
+    assert cache.get("2022-12-30", "stats") == "stats"
+
+
+def test_cached_by_date_skips_empty():
+    cache = ChartCache()
+    calls = []
+
+    @cached_by_date("tally", cache)
+    def tally(chart_date):
+        calls.append(chart_date)
+        return [] if chart_date == "2023-01-02" else [("Drake", "m", 4)]
+
+    tally("2022-12-31")
+    tally("2022-12-31")
+    tally("2023-01-02")
+    tally("2023-01-02")
+    assert calls == ["2022-12-31", "2023-01-02", "2023-01-02"]
+
+
+def test_bio_cache(tmp_path):
+    cache = BioCache(str(tmp_path / "bios.sqlite"), ttl=60, negative_ttl=-1, max_entries=2)
+    assert cache.set("last_fm", "Yeat", "m", "he is a rapper") == "m"
+    assert cache.get("last_fm", "Yeat") == ("m", "he is a rapper")
+    assert cache.get("wikipedia", "Yeat") is None
+    cache.set("wikipedia", "Nobody", "p")
+    assert cache.get("wikipedia", "Nobody") is None  # negative verdicts expired immediately
+    for name in ["A", "B", "C"]:
+        cache.set("last_fm", name, "f")
+    assert cache.get("last_fm", "Yeat") is None
+    assert cache.get("last_fm", "C") == ("f", None)
@@ -1,13 +1,33 @@
+import asyncio
 import json
 import logging
 import os
+import shutil
 
-from rcg.src import load_chart, load_spotipy, parse_spotify_chart, get_chart_stats
-from rcg.src.adding import add_chart_to_db
+import pytest
+
+from rcg.config.config import RAP_CAVIAR_ID
+from rcg.src import (get_chart_stats, load_chart, load_chart_view,
+                     load_spotipy, make_tally)
+from rcg.src.adding import (add_chart_to_db, find_missing_appearances,
+                            find_missing_appearances_in, find_missing_artists,
+                            find_missing_artists_in, get_group_artists,
+                            parse_spotify_chart, set_artist_gender)
+from rcg.src.aiodb import close_async_pool
+from rcg.src.backfill import backfill
+from rcg.src.bars import get_bar_charts
 from rcg.src.dates import get_most_recent_chart_date
-from rcg.src.db import db_query
-from rcg.src.gender import lookup_gender
-from rcg.src.track import Chart
+from rcg.src.db import db_query, db_stream
+from rcg.src.deltas import (compare_charts, compare_charts_async,
+                            rebuild_chart_deltas)
+from rcg.src.gender import lookup_gender, resolve_genders
+from rcg.src.postings import get_artist_history, rebuild_artist_postings
+from rcg.src.rollup import rebuild_gender_rollup
+from rcg.src.snapshot import build_snapshot, snapshot_reader
+from rcg.src.streaming import EXPORTS, stream_export
+from rcg.src.track import Chart, ColumnarChart, Track, create_artist
+from rcg.src.trend import get_trend
+from rcg.web.export import data_fingerprints
 
 
 def test_gender():
@@ -16,6 +36,12 @@ def test_gender():
     assert lookup_gender("Yeat") == ("m", "m", "m")
 
 
+def test_resolve_genders():
+    artists = [create_artist(name, spotify_id) for name, spotify_id in [
+        ("Nicki Minaj", "0hCNtLu0JehylgoiP8L4Gh"), ("Yeat", "3qiHUAX7zY4Qnjx8TNUzVx")]]
+    assert resolve_genders(artists) == [('f', 'f', 'f'), ("m", "m", "m")]
+
+
 def test_spotipy():
     logging.info("TESTING SPOTIPY")
     sp = load_spotipy()
@@ -27,6 +53,7 @@ def test_parse_spotify_chart(pretest):
     test_rc = json.load(open(os.path.join(pretest, "test_chart.json")))
     test_chart: Chart = parse_spotify_chart("2023-01-01", raw_chart=test_rc)
     assert test_chart.chart_date == "2023-01-01"
+    assert test_chart.chart_id == "37i9dQZF1DX0XUsuxWHRQd"
     assert len(test_chart.appearances()) == 94
 
 
@@ -41,6 +68,8 @@ def test_group_artists():
         ('Phesto', '2tgyOPAmFNLotTv5yiQ9Ip'),
         ('Opio', '1dpAIrpTGOrblTYJHpE8ao')
     )
+    artists = get_group_artists([create_artist("Souls Of Mischief", '5Rzqmz1zAszembFHGZQuAt', True)])
+    assert [a.name for a in artists[1:]] == ['Tajai', 'A-Plus', 'Phesto', 'Opio']
 
 
 def test_load_chart():
@@ -48,6 +77,30 @@ def test_load_chart():
     assert len(chart.appearances()) == 86
 
 
+def test_find_missing_rows():
+    known = load_chart("2022-12-31")
+    known_tracks = sorted(known.tracks, key=lambda t: t.song_spotify_id)[:3]
+    new_artist = create_artist("Not An Artist", "not_an_artist_id", True)
+    new_tracks = [
+        # a charted song with an artist it was never credited with
+        Track(known_tracks[0].song_name, known_tracks[0].song_spotify_id, known_tracks[0].artists + [new_artist]),
+        Track("Not A Song", "not_a_song_id", [new_artist])
+    ]
+    chart = Chart("2023-01-02", known_tracks + new_tracks)
+    missing_appearances = [
+        (known_tracks[0].song_spotify_id, "not_an_artist_id"), ("not_a_song_id", "not_an_artist_id")]
+
+    assert find_missing_artists(chart) == [new_artist]
+    assert sorted((a.song_spotify_id, a.artist_spotify_id) for a in find_missing_appearances(chart)) == \
+        sorted(missing_appearances)
+    # batches of 2 split the found and missing keys across several queries
+    assert find_missing_artists_in(chart.artists(), batch_size=2) == [new_artist]
+    assert sorted((a.song_spotify_id, a.artist_spotify_id)
+                  for a in find_missing_appearances_in(chart.appearances(), batch_size=2)) == sorted(missing_appearances)
+    assert find_missing_artists(known) == []
+    assert find_missing_appearances_in(known.appearances(), batch_size=7) == []
+
+
 def test_update_chart(pretest):
     test_rc = json.load(open(os.path.join(pretest, "test_chart.json")))
     test_chart: Chart = parse_spotify_chart("2023-01-01", raw_chart=test_rc)
@@ -74,6 +127,28 @@ def test_update_chart(pretest):
     ))
 
 
+def test_add_chart_is_idempotent(pretest):
+    test_rc = json.load(open(os.path.join(pretest, "test_chart.json")))
+    test_chart: Chart = parse_spotify_chart("2023-01-01", raw_chart=test_rc)
+    counts = [db_query(f"SELECT COUNT(*) FROM {table}")[0][0] for table in ["chart", "song", "artist"]]
+    add_chart_to_db(test_chart)
+    assert [db_query(f"SELECT COUNT(*) FROM {table}")[0][0] for table in ["chart", "song", "artist"]] == counts
+    assert load_chart("2023-01-01") == test_chart
+
+
+def test_changed_chart_same_day(test_chart):
+    # the playlist changed after 2023-01-01 was ingested: one track dropped, one from the day before added
+    dropped = sorted(test_chart.tracks, key=lambda t: t.song_spotify_id)[0]
+    added = next(t for t in load_chart.__wrapped__("2022-12-31").tracks if t not in test_chart.tracks)
+    changed = Chart("2023-01-01", [t for t in test_chart.tracks if t != dropped] + [added])
+    count = db_query("SELECT COUNT(*) FROM chart WHERE chart_date='2023-01-01'")[0][0]
+    for _ in range(2):
+        add_chart_to_db(changed)
+        # the stored chart is kept as it was, not merged with the new version
+        assert db_query("SELECT COUNT(*) FROM chart WHERE chart_date='2023-01-01'")[0][0] == count == len(test_chart.tracks)
+        assert load_chart.__wrapped__("2023-01-01") == test_chart
+
+
 def test_artist_added():
     spotify_id = db_query(
         "SELECT spotify_id from artist where artist_name='Doja Cat'"
@@ -84,3 +159,195 @@ def test_artist_added():
 def test_format_data():
     chart_stats = get_chart_stats("2023-01-01")
     assert chart_stats['m']['Total'] == 77
+
+
+def test_chart_view_matches_separate_queries():
+    view = load_chart_view("2022-12-31")
+    assert view.chart == load_chart.__wrapped__("2022-12-31")
+    assert view.stats == get_chart_stats.__wrapped__("2022-12-31")
+    assert set(a for row in view.tally for a in row) == set(a for row in make_tally.__wrapped__("2022-12-31") for a in row)
+
+
+def test_columnar_chart(test_chart):
+    columnar = ColumnarChart.from_appearances(test_chart.chart_date, test_chart.appearances())
+    assert len(columnar) == len(test_chart.appearances()) == 94
+    assert columnar == test_chart
+    assert columnar.artists() == test_chart.artists()
+    assert columnar.song_ids() == set(t.song_spotify_id for t in test_chart)
+
+
+def test_trend_matches_chart_stats():
+    point = get_trend("2022-12-31", "2022-12-31")["points"][0]
+    stats = get_chart_stats("2022-12-31")
+    for g in ["m", "f", "n"]:
+        assert point[g]["Total"] == stats[g]["Total"]
+        assert abs(point[g]["Normalized"] - stats[g]["Normalized"]) <= 0.5
+
+
+def test_gender_rollup_rebuild():
+    # 2023-01-01 was added through add_chart_to_db, so its rollup rows were written at ingest
+    ingested = get_chart_stats.__wrapped__("2023-01-01")
+    assert rebuild_gender_rollup() == db_query("SELECT COUNT(*) FROM chart_gender_daily")[0][0]
+    assert get_chart_stats.__wrapped__("2023-01-01") == ingested
+    assert ingested['m']['Total'] == 77
+
+
+def test_bar_charts():
+    bars = get_bar_charts("2022-12-31")
+    assert bars.stats == get_chart_stats("2022-12-31")
+    assert f">{bars.stats['m']['Total']}<" in bars.total
+    assert get_bar_charts("2022-12-31") is bars
+
+
+def test_compare_charts_matches_loaded_charts():
+    old, new = load_chart("2022-12-31"), load_chart("2023-01-01")
+    delta = compare_charts("2022-12-31", "2023-01-01")
+    assert (delta["start"], delta["end"]) == ("2022-12-31", "2023-01-01")
+    assert set(t["song_spotify_id"] for t in delta["tracks"]["added"]) == new.song_ids() - old.song_ids()
+    assert set(t["song_spotify_id"] for t in delta["tracks"]["removed"]) == old.song_ids() - new.song_ids()
+    assert set(a["spotify_id"] for a in delta["artists"]["added"]) == new.artist_ids() - old.artist_ids()
+    # 2023-01-01's deltas were written at ingest; a rebuild gives the same answer
+    rebuild_chart_deltas()
+    assert compare_charts("2022-12-31", "2023-01-01") == delta
+
+
+def test_async_compare_matches():
+    async def load():
+        try:
+            return await compare_charts_async("2022-12-31", "2023-01-01")
+        finally:
+            await close_async_pool()
+    assert asyncio.run(load()) == compare_charts("2022-12-31", "2023-01-01")
+
+
+def test_streamed_export():
+    q = "SELECT song_spotify_id FROM chart WHERE chart_date BETWEEN '2022-12-31' AND '2023-01-01' ORDER BY chart_date"
+    assert list(db_stream(q, batch_size=7)) == list(db_query(q))
+    lines = "".join(stream_export("chart", "2022-12-31", "2022-12-31")).splitlines()
+    assert set(json.loads(line)["song_spotify_id"] for line in lines) == load_chart("2022-12-31").song_ids()
+    assert next(stream_export("credits", "2022-12-31", "2023-01-01", "csv")).startswith("chart_date,")
+    # a stream closed part way through discards its connection instead of reading the rest
+    rows = db_stream(q, batch_size=1)
+    next(rows)
+    rows.close()
+    assert db_query(q)
+
+
+def test_snapshot_matches_mysql(tmp_path, monkeypatch):
+    columns, q = EXPORTS["credits"]
+    params = (RAP_CAVIAR_ID, "2022-12-31", "2023-01-01")
+    name_q = "SELECT COUNT(*) FROM artist WHERE artist_name=%s"
+    mysql_rows, mysql_names = db_query(q, params=params), db_query(name_q, params=("cardi b",))
+    build_snapshot(os.path.join(tmp_path, "snapshot.sqlite3"))
+    monkeypatch.setenv("SNAPSHOT_PATH", os.path.join(tmp_path, "snapshot.sqlite3"))
+    monkeypatch.setenv("SNAPSHOT_CHECK_SECONDS", "0")
+    assert snapshot_reader().covers(q)
+    snapshot_rows = db_query(q, params=params)
+    assert sorted(tuple(map(str, r)) for r in snapshot_rows) == sorted(tuple(map(str, r)) for r in mysql_rows)
+    assert db_query(name_q, params=("cardi b",)) == mysql_names
+
+
+def test_artist_history():
+    drake = "3TVXtAsR1Inumwj472S9r4"
+    credits = db_query(
+        """
+        SELECT COUNT(*) FROM chart INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
+        WHERE song.artist_spotify_id=%s AND chart.chart_id=%s
+        """, params=(drake, RAP_CAVIAR_ID))[0][0]
+    history = get_artist_history(drake)
+    assert history["artist_name"] == "Drake"
+    assert history["total_credits"] == credits
+    assert "Rich Flex" in [s["song_name"] for d in history["dates"] for s in d["songs"]]
+    # 2023-01-01's postings were written at ingest; a rebuild gives the same history
+    rebuild_artist_postings()
+    assert get_artist_history(drake) == history
+    assert get_artist_history("not_an_artist") is None
+
+
+def test_rollup_follows_new_credits(test_chart):
+    def rollup():
+        return set(db_query("SELECT chart_id, chart_date, gender, credits FROM chart_gender_daily"))
+
+    def postings():
+        return set(db_query("SELECT * FROM artist_posting"))
+
+    # 2023-01-01 is already stored, but one of its songs gains a credit for an artist already in the db
+    track = next(t for t in test_chart.tracks if db_query(
+        "SELECT COUNT(DISTINCT chart_date) FROM chart WHERE song_spotify_id=%s", params=(t.song_spotify_id,))[0][0] > 1)
+    credited = set(a.spotify_id for a in track.artists)
+    spotify_id, name = next(r for r in db_query("SELECT spotify_id, artist_name FROM artist") if r[0] not in credited)
+    changed = Chart("2023-01-01", [t for t in test_chart.tracks if t != track] + [
+        Track(track.song_name, track.song_spotify_id, track.artists + [create_artist(name, spotify_id)])])
+    add_chart_to_db(changed)
+    # every date the song charted on was recomputed at ingest, not just 2023-01-01
+    ingested, posted = rollup(), postings()
+    rebuild_gender_rollup()
+    assert rollup() == ingested
+    # the new credit is posted on those dates too
+    assert len(set(r[2] for r in posted if r[0] == spotify_id and r[3] == track.song_spotify_id)) > 1
+    rebuild_artist_postings()
+    assert postings() == posted
+
+    gender = db_query("SELECT gender FROM artist WHERE spotify_id=%s", params=(spotify_id,))[0][0]
+    refreshed = set_artist_gender(spotify_id, "n" if gender != "n" else "f")
+    assert "2023-01-01" in refreshed[RAP_CAVIAR_ID]
+    edited = rollup()
+    assert edited != ingested
+    rebuild_gender_rollup()
+    assert rollup() == edited
+    set_artist_gender(spotify_id, gender)
+    assert rollup() == ingested
+
+
+def test_export_fingerprint_follows_gender_edits():
+    spotify_id, gender, chart_date = db_query(
+        """
+        SELECT artist.spotify_id, artist.gender, MAX(chart.chart_date) FROM chart
+        INNER JOIN song ON chart.song_spotify_id=song.song_spotify_id
+        INNER JOIN artist ON song.artist_spotify_id=artist.spotify_id
+        WHERE chart.chart_id=%s GROUP BY artist.spotify_id, artist.gender LIMIT 1
+        """, params=(RAP_CAVIAR_ID,))[0]
+    before = data_fingerprints()
+    assert chart_date in before
+    set_artist_gender(spotify_id, "n" if gender != "n" else "f")
+    try:
+        assert data_fingerprints()[chart_date] != before[chart_date]
+    finally:
+        set_artist_gender(spotify_id, gender)
+    assert data_fingerprints() == before
+
+
+def test_deltas_follow_new_credits(test_chart):
+    def deltas():
+        return set(db_query("SELECT * FROM chart_delta"))
+
+    # a song of the stored 2023-01-01 chart that was added to the chart on an earlier date
+    track = next(t for t in test_chart.tracks if db_query(
+        """
+        SELECT COUNT(*) FROM chart_delta
+        WHERE item_type='track' AND item_id=%s AND change_type='added' AND chart_date<'2023-01-01'
+        """, params=(t.song_spotify_id,))[0][0])
+    credited = set(a.spotify_id for a in track.artists) | set(r[0] for r in db_query(
+        "SELECT artist_spotify_id FROM song WHERE song_spotify_id=%s", params=(track.song_spotify_id,)))
+    spotify_id, name = next(r for r in db_query("SELECT spotify_id, artist_name FROM artist") if r[0] not in credited)
+    add_chart_to_db(Chart("2023-01-01", [t for t in test_chart.tracks if t != track] + [
+        Track(track.song_name, track.song_spotify_id, track.artists + [create_artist(name, spotify_id)])]))
+    ingested = deltas()
+    # the earlier date's "added" row lists the new feature, without a rebuild
+    assert any(r[4] == track.song_spotify_id and r[1] < "2023-01-01" and name in (r[8] or "") for r in ingested)
+    rebuild_chart_deltas()
+    assert deltas() == ingested
+
+
+def test_failed_backfill_writes_nothing(tmp_path, monkeypatch):
+    shutil.copy(os.path.join(os.getcwd(), "tests/test_data/test_chart.json"), tmp_path / "2021-06-01.json")
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("crashed after the charts were written")
+
+    monkeypatch.setattr("rcg.src.backfill.refresh_artist_postings", crash)
+    with pytest.raises(RuntimeError):
+        backfill(str(tmp_path), max_workers=1)
+    # rolled back with the derived rows, so a re-run doesn't skip the date
+    assert db_query("SELECT COUNT(*) FROM chart WHERE chart_date='2021-06-01'")[0][0] == 0
+    assert db_query("SELECT COUNT(*) FROM chart_gender_daily WHERE chart_date='2021-06-01'")[0][0] == 0
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+from flask import Flask
+
+from rcg.src import shared_cache
+from rcg.src.shared_cache import FileBackend, SharedCache
+from rcg.web.conditional import conditional
+
+calls = []
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setenv("LATEST_CHART_DATE", "2022-12-31")
+    monkeypatch.setattr(shared_cache, "_SHARED_CACHE", SharedCache(FileBackend(str(tmp_path))))
+    calls.clear()
+    app = Flask(__name__)
+
+    @app.route("/page")
+    @app.route("/page/<chart_date>")
+    @conditional
+    def page(chart_date=None):
+        calls.append(chart_date)
+        return f"chart for {chart_date}"
+
+    yield app.test_client()
+
+
+def test_etag_and_cache_control(client):
+    past = client.get("/page/2022-12-30")
+    assert past.status_code == 200
+    assert past.headers["ETag"] and past.headers["Last-Modified"]
+    assert past.cache_control.max_age == int(os.getenv("HTTP_MAX_AGE", 30 * 24 * 3600))
+    latest = client.get("/page")
+    assert latest.get_data(as_text=True) == "chart for 2022-12-31"
+    assert latest.cache_control.max_age == int(os.getenv("HTTP_MAX_AGE_LATEST", 300))
+
+
+def test_not_modified_skips_the_view(client, monkeypatch, tmp_path):
+    first = client.get("/page/2022-12-30")
+    # another worker: its own SharedCache on the same storage, nothing rendered yet
+    monkeypatch.setattr(shared_cache, "_SHARED_CACHE", SharedCache(FileBackend(str(tmp_path))))
+    not_modified = client.get("/page/2022-12-30", headers={"If-None-Match": first.headers["ETag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == first.headers["ETag"]
+    since = client.get("/page/2022-12-30", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert since.status_code == 304
+    assert calls == ["2022-12-30"]
+    assert client.get("/page/2022-12-29", headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+
+
+def test_data_version_bump_renders_again(client):
+    etag = client.get("/page/2022-12-30").headers["ETag"]
+    shared_cache.get_shared_cache().bump_data_version()
+    changed = client.get("/page/2022-12-30", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(calls) == 2
+
+
+def test_body_etag_without_shared_cache(client, monkeypatch):
+    monkeypatch.setattr(shared_cache, "_SHARED_CACHE", SharedCache(None))
+    first = client.get("/page/2022-12-30")
+    assert "Last-Modified" not in first.headers
+    # the view runs, but an unchanged body is still a 304
+    assert client.get("/page/2022-12-30", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    assert len(calls) == 2
@@ -3,7 +3,7 @@ import os
 from flask_testing import TestCase
 
 from app import app
-from rcg.src.db import db_query
+from rcg.src.db import db_query, get_pool
 
 
 class TestFolio(TestCase):
@@ -31,3 +31,13 @@ def test_sql():
         """
     result = db_query(q)
     assert result[0][0] == "Bruno Mars"
+
+
+def test_pool_reuses_connections():
+    db_query("select 1")
+    created = get_pool().stats()['created']
+    for _ in range(3):
+        db_query("select 1")
+    stats = get_pool().stats()
+    assert stats['created'] == created
+    assert stats['checked_out'] == 0
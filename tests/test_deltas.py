@@ -0,0 +1,41 @@
+from rcg.src.deltas import compose_deltas, make_delta_rows
+
+MONDAY = ({"s1": ("One", "A", ""), "s2": ("Two", "B", "C")}, {"a": ("A", None, None), "b": ("B", None, None), "c": ("C", None, None)})
+TUESDAY = ({"s1": ("One", "A", ""), "s3": ("Three", "D", "")}, {"a": ("A", None, None), "d": ("D", None, None)})
+
+
+def test_delta_rows():
+    rows = make_delta_rows("x", "2023-01-02", "2023-01-01", TUESDAY, MONDAY)
+    changes = {(r[3], r[4], r[5]) for r in rows}
+    assert changes == {
+        ("track", "s3", "added"), ("track", "s2", "removed"),
+        ("artist", "d", "added"), ("artist", "b", "removed"), ("artist", "c", "removed")
+    }
+    assert ("x", "2023-01-02", "2023-01-01", "track", "s2", "removed", "Two", "B", "C") in rows
+
+
+def test_first_chart_adds_everything():
+    rows = make_delta_rows("x", "2023-01-01", None, MONDAY, ({}, {}))
+    assert len(rows) == 5 and all(r[5] == "added" for r in rows)
+
+
+def test_compose_window():
+    rows = [
+        ("track", "s1", "added", "One", "A", ""),
+        ("track", "s2", "removed", "Two", "B", ""),
+        ("track", "s2", "added", "Two", "B", ""),  # back by the end of the window: unchanged
+        ("track", "s3", "added", "Three", "C", ""),
+        ("track", "s3", "removed", "Three", "C", ""),  # came and went: unchanged
+        ("track", "s4", "removed", "Four", "D", ""),
+        ("track", "s4", "added", "Four", "D", ""),
+        ("track", "s4", "removed", "Four", "D", ""),
+        ("artist", "a", "added", "A", None, None)
+    ]
+    delta = compose_deltas(rows)
+    assert [t["song_spotify_id"] for t in delta["tracks"]["added"]] == ["s1"]
+    assert [t["song_spotify_id"] for t in delta["tracks"]["removed"]] == ["s4"]
+    assert delta["artists"] == {"added": [{"spotify_id": "a", "artist_name": "A"}], "removed": []}
+
+
+def test_compose_nothing():
+    assert compose_deltas([]) == {"tracks": {"added": [], "removed": []}, "artists": {"added": [], "removed": []}}
@@ -0,0 +1,52 @@
+import gzip
+import os
+
+from rcg.web.export import (load_manifest, pages_to_render, plan_pages,
+                            write_file)
+
+FINGERPRINTS = {"2022-12-30": "a", "2022-12-31": "b", "2023-01-01": "c"}
+
+
+def test_plan_pages():
+    pages = plan_pages(FINGERPRINTS, "2023-01-01", "code")
+    paths = [p.path for p in pages]
+    assert paths[0] == "index.html"
+    assert "2022-12-31/index.html" in paths
+    assert "report/2023-01-01/index.html" in paths
+    assert "bars/2022-12-30/normalized.svg" in paths
+    assert len(pages) == 1 + 4 * len(FINGERPRINTS)
+
+
+def test_changed_date_rerenders_its_pages_and_next_report():
+    before = plan_pages(FINGERPRINTS, "2023-01-01", "code")
+    after = plan_pages(dict(FINGERPRINTS, **{"2022-12-31": "b2"}), "2023-01-01", "code")
+    changed = {p.path for p, q in zip(before, after) if p.fingerprint != q.fingerprint}
+    assert changed == {
+        "2022-12-31/index.html",
+        "report/2022-12-31/index.html",
+        "report/2023-01-01/index.html",
+        "bars/2022-12-31/total.svg",
+        "bars/2022-12-31/normalized.svg"
+    }
+    # templates changing re-renders everything
+    assert all(p.fingerprint != q.fingerprint for p, q in zip(before, plan_pages(FINGERPRINTS, "2023-01-01", "new")))
+
+
+def test_pages_to_render(tmp_path):
+    pages = plan_pages(FINGERPRINTS, "2023-01-01", "code")
+    manifest = {p.path: p.fingerprint for p in pages}
+    assert pages_to_render(pages, manifest, str(tmp_path)) == pages  # no files yet
+    for p in pages:
+        write_file(os.path.join(tmp_path, p.path), b"page")
+    assert pages_to_render(pages, manifest, str(tmp_path)) == []
+    assert pages_to_render(pages, dict(manifest, **{"index.html": "old"}), str(tmp_path)) == pages[:1]
+
+
+def test_write_file_precompresses(tmp_path):
+    path = os.path.join(tmp_path, "a", "index.html")
+    write_file(path, b"<html></html>")
+    with open(path + ".gz", "rb") as f:
+        assert gzip.decompress(f.read()) == b"<html></html>"
+    write_file(os.path.join(tmp_path, "manifest.json"), b"{}", compress=False)
+    assert not os.path.exists(os.path.join(tmp_path, "manifest.json.gz"))
+    assert load_manifest(str(tmp_path)) == {}
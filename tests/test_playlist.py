@@ -0,0 +1,46 @@
+from rcg.src import PLAYLIST_FIELDS, iter_playlist_tracks
+
+
+def item(song_name, song_id, *artists):
+    return {"track": {"name": song_name, "id": song_id, "artists": [{"name": a, "id": a.lower()} for a in artists]}}
+
+
+class FakeSpotify:
+    """Two pages of playlist items, the first linking to the second."""
+
+    def __init__(self):
+        self.pages = [
+            {"items": [item("Rich Flex", "s1", "Drake", "21 Savage"), {"track": None}, {}], "next": "page2"},
+            {"items": [item("Superhero", "s2", "Metro Boomin"), {"track": {"name": "local", "id": None}}], "next": None}
+        ]
+        self.calls = []
+
+    def playlist_items(self, chart_id, **kwargs):
+        self.calls.append(("playlist_items", chart_id, kwargs))
+        return self.pages[0]
+
+    def next(self, page):
+        self.calls.append(("next", page["next"]))
+        return self.pages[1]
+
+
+def test_iter_playlist_tracks():
+    sp = FakeSpotify()
+    tracks = iter_playlist_tracks(sp, "playlist_id", page_size=2, expand_groups=False)
+    assert sp.calls == []
+    first = next(tracks)
+    assert (first.song_name, first.primary_artist_name, first.features) == ("Rich Flex", "Drake", "21 Savage")
+    # the second page isn't requested until the first has been used up
+    assert [c[0] for c in sp.calls] == ["playlist_items"]
+    assert [t.song_spotify_id for t in tracks] == ["s2"]
+    assert sp.calls == [
+        ("playlist_items", "playlist_id", {"fields": PLAYLIST_FIELDS, "limit": 2, "additional_types": ("track",)}),
+        ("next", "page2")
+    ]
+
+
+def test_iter_empty_playlist():
+    sp = FakeSpotify()
+    sp.pages[0] = {"items": [], "next": None}
+    assert list(iter_playlist_tracks(sp, "playlist_id", expand_groups=False)) == []
+    assert [c[0] for c in sp.calls] == ["playlist_items"]
@@ -0,0 +1,35 @@
+from rcg.src.postings import find_streaks, summarize_postings
+
+POSTINGS = [
+    ("2022-12-29", "s1", "One", 1),
+    ("2022-12-30", "s1", "One", 1),
+    ("2022-12-30", "s2", "Two (feat. A)", 0),
+    ("2022-12-31", "s1", "One", 1),
+    ("2023-01-02", "s2", "Two (feat. A)", 0)
+]
+
+
+def test_streaks():
+    assert find_streaks(["2022-12-30", "2022-12-31", "2023-01-01", "2023-01-03"]) == [
+        {"start": "2022-12-30", "end": "2023-01-01", "days": 3},
+        {"start": "2023-01-03", "end": "2023-01-03", "days": 1}
+    ]
+    assert find_streaks([]) == []
+
+
+def test_summarize_postings():
+    history = summarize_postings(POSTINGS)
+    assert (history["total_credits"], history["primary_credits"], history["featured_credits"]) == (5, 3, 2)
+    assert history["days_charted"] == 4
+    assert (history["first_charted"], history["last_charted"]) == ("2022-12-29", "2023-01-02")
+    assert history["longest_streak"] == {"start": "2022-12-29", "end": "2022-12-31", "days": 3}
+    assert history["dates"][1] == {"date": "2022-12-30", "songs": [
+        {"song_spotify_id": "s1", "song_name": "One", "primary": True},
+        {"song_spotify_id": "s2", "song_name": "Two (feat. A)", "primary": False}
+    ]}
+
+
+def test_no_postings():
+    history = summarize_postings([])
+    assert history["total_credits"] == 0
+    assert history["longest_streak"] is None
@@ -0,0 +1,45 @@
+from rcg.src import scheduler
+from rcg.src.track import Chart, Track, create_artist
+
+
+def make_chart(chart_id):
+    artist = create_artist(f"artist {chart_id}", f"artist_{chart_id}", True)
+    return Chart("2023-01-01", [Track(f"song {chart_id}", f"song_{chart_id}", [artist])], chart_id)
+
+
+def test_ingest_playlists(monkeypatch):
+    written = []
+
+    def load(chart_id):
+        if chart_id == "badFetch":
+            raise ValueError("playlist not found")
+        return make_chart(chart_id)
+
+    def write(chart):
+        if chart.chart_id == "badWrite":
+            raise RuntimeError("lock timeout")
+        written.append(chart.chart_id)
+
+    monkeypatch.setattr(scheduler, "load_spotify_chart", load)
+    monkeypatch.setattr(scheduler, "add_chart_to_db", write)
+    monkeypatch.setattr(scheduler, "find_missing_artists_in", lambda artists: sorted(a.spotify_id for a in artists))
+    monkeypatch.setattr(scheduler, "add_multiple_artists", lambda artists: None)
+
+    reports = scheduler.ingest_playlists(
+        ["spotify:playlist:first", "badFetch", "badWrite", "https://open.spotify.com/playlist/last?si=x"],
+        max_workers=2)
+    assert [r.chart_id for r in reports] == ["first", "badFetch", "badWrite", "last"]
+    assert [r.chart_date for r in reports] == ["2023-01-01", None, "2023-01-01", "2023-01-01"]
+    assert [r.tracks for r in reports] == [1, 0, 1, 1]
+    # one playlist failing to fetch or write doesn't stop the others
+    assert reports[0].error is None and reports[3].error is None
+    assert "playlist not found" in reports[1].error and reports[1].write_seconds == 0
+    assert "lock timeout" in reports[2].error
+    assert sorted(written) == ["first", "last"]
+
+
+def test_configured_playlists(monkeypatch):
+    monkeypatch.setenv("RCG_PLAYLISTS", "spotify:playlist:one, two,")
+    assert scheduler.configured_playlists() == ["one", "two"]
+    monkeypatch.delenv("RCG_PLAYLISTS")
+    assert scheduler.configured_playlists() == list(scheduler.PLAYLISTS.values())
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+import pytest
+
+from rcg.src.cache import chart_cache
+from rcg.src.shared_cache import FileBackend, SharedCache
+
+
+def test_get_or_compute_once(tmp_path):
+    cache = SharedCache(FileBackend(str(tmp_path)))
+    calls = []
+    for _ in range(3):
+        assert cache.get_or_compute("page", "2022-12-31", lambda: calls.append(1) or "html") == "html"
+    assert len(calls) == 1
+    # another worker with the same directory shares the entry
+    assert SharedCache(FileBackend(str(tmp_path))).get_or_compute("page", "2022-12-31", lambda: "other") == "html"
+
+
+def test_data_version_orphans_entries(tmp_path):
+    cache = SharedCache(FileBackend(str(tmp_path)))
+    cache.get_or_compute("page", "2022-12-31", lambda: "old")
+    cache.bump_data_version()
+    assert cache.data_version() == 1
+    assert cache.get_or_compute("page", "2022-12-31", lambda: "new") == "new"
+
+
+def test_expired_entries_are_recomputed(tmp_path):
+    cache = SharedCache(FileBackend(str(tmp_path)), ttl=-1)
+    cache.get_or_compute("page", "2022-12-31", lambda: "old")
+    assert cache.get_or_compute("page", "2022-12-31", lambda: "new") == "new"
+
+
+def test_one_computation_per_stampede(tmp_path):
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.3)
+        return "html"
+
+    # a backend per thread, as each gunicorn worker would have its own
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            SharedCache(FileBackend(str(tmp_path))).get_or_compute("page", "2022-12-31", slow)))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["html"] * 4
+    assert len(calls) == 1
+
+
+def test_disabled_cache_computes():
+    cache = SharedCache(None)
+    assert cache.get_or_compute("page", "2022-12-31", lambda: "html") == "html"
+    cache.bump_data_version()
+    assert cache.data_version() == 0
+
+
+class FailingSetBackend(FileBackend):
+    def set(self, key, value, ttl):
+        raise OSError("disk full")
+
+
+def test_failed_store_computes_once(tmp_path):
+    calls = []
+    cache = SharedCache(FailingSetBackend(str(tmp_path)))
+    assert cache.get_or_compute("page", "2022-12-31", lambda: calls.append(1) or "html") == "html"
+    assert len(calls) == 1
+
+
+def test_compute_errors_reach_the_caller(tmp_path):
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise OSError("template missing")
+
+    with pytest.raises(OSError):
+        SharedCache(FileBackend(str(tmp_path))).get_or_compute("page", "2022-12-31", broken)
+    assert len(calls) == 1
+
+
+def test_new_data_version_empties_chart_cache(tmp_path):
+    ingesting, serving = SharedCache(FileBackend(str(tmp_path))), SharedCache(FileBackend(str(tmp_path)))
+    serving.data_version()
+    chart_cache.set("2022-12-31", "chart", "loaded before the ingest")
+    ingesting.bump_data_version()
+    # the serving worker never saw the ingest's invalidate(), but doesn't render from what it loaded
+    page = serving.get_or_compute("page", "2022-12-31", lambda: chart_cache.get("2022-12-31", "chart"))
+    assert page is None
+
+
+def test_expired_files_are_removed(tmp_path):
+    cache = SharedCache(FileBackend(str(tmp_path)), ttl=-120)
+    cache.get_or_compute("page", "2022-12-31", lambda: "old")
+    assert cache.get_or_compute("page", "2022-12-31", lambda: "new") == "new"
+    # the read deleted the expired entry it found; the bump sweeps the rest, lock files included
+    cache.bump_data_version()
+    assert os.listdir(tmp_path / "locks") == []
+    assert sorted(os.listdir(tmp_path)) == sorted(["locks"] + [
+        os.path.basename(cache.backend._path(k)) for k in ["count:data_version", "data_changed_at"]])
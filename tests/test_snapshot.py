@@ -0,0 +1,66 @@
+import csv
+import os
+
+import pytest
+
+from rcg.config.config import RAP_CAVIAR_ID
+from rcg.src import load_chart
+from rcg.src.db import db_query
+from rcg.src.snapshot import (mark_snapshot_stale, snapshot_reader, to_sqlite,
+                              write_snapshot)
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), "test_data")
+
+
+def read_csv(table):
+    with open(os.path.join(TEST_DATA, f"{table}_df.csv"), newline="") as f:
+        rows = list(csv.reader(f))
+    return rows[0], rows[1:]
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    """
+    The test data as a snapshot file: the chart queries run with no db server.
+    """
+    path = os.path.join(tmp_path, "snapshot.sqlite3")
+    tables = {t: read_csv(t) for t in ["artist", "song", "group_table"]}
+    columns, rows = read_csv("chart")
+    tables["chart"] = (columns + ["chart_id"], [r + [RAP_CAVIAR_ID] for r in rows])
+    write_snapshot(path, tables)
+    monkeypatch.setenv("SNAPSHOT_PATH", path)
+    monkeypatch.setenv("SNAPSHOT_CHECK_SECONDS", "0")
+    return path
+
+
+def test_to_sqlite():
+    assert to_sqlite("SELECT song.primary FROM song WHERE a=%s", ("x",)) == 'SELECT song."primary" FROM song WHERE a=?'
+
+
+def test_reads_from_snapshot(snapshot):
+    assert db_query('select count(*) from chart where chart_date="2022-12-31"') == ((50,),)
+    assert db_query("select artist_name from artist where spotify_id=%s", params=("4kYSro6naA4h99UJvo89HB",)) == (("Cardi B",),)
+    assert len(load_chart.__wrapped__("2022-12-31").tracks) == 50
+
+
+def test_text_compares_like_mysql(snapshot):
+    # MySQL's default collations ignore case
+    assert db_query("select artist_name from artist where artist_name=%s", params=("cardi b",)) == (("Cardi B",),)
+    names = [r[0] for r in db_query("select artist_name from artist order by artist_name")]
+    assert names == sorted(names, key=str.lower)
+
+
+def test_only_covered_reads(snapshot):
+    reader = snapshot_reader()
+    assert reader.covers("SELECT * FROM chart INNER JOIN song ON chart.a=song.a")
+    assert not reader.covers("SELECT * FROM chart_gender_daily")  # not in this snapshot
+    assert not reader.covers("SELECT * FROM information_schema.tables WHERE table_name='chart'")
+    assert not reader.covers("DELETE FROM chart")
+
+
+def test_stale_after_write(snapshot):
+    mark_snapshot_stale()
+    assert not snapshot_reader().covers("SELECT * FROM chart")
+    write_snapshot(snapshot, {"chart": (["chart_date"], [("2023-01-01",)])})
+    assert snapshot_reader().covers("SELECT * FROM chart")
+    assert db_query("SELECT MAX(chart_date) FROM chart") == (("2023-01-01",),)
@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# only needed for ingest, table loading or trends, so a web worker shouldn't import them at startup
+LAZY_MODULES = ["pandas", "numpy", "sqlalchemy", "spotipy", "redis", "pylast", "wikipedia", "aiomysql"]
+
+STARTUP = """
+import json
+import sys
+
+import rcg.src.db
+
+def no_db(*args, **kwargs):
+    raise RuntimeError("db connection at startup")
+
+rcg.src.db.make_sql_connection = no_db
+from app import app
+imported = sorted(set(sys.modules) & set(json.loads(sys.argv[1])))
+response = app.test_client().get("/testo")
+print(json.dumps([imported, response.status_code]))
+"""
+
+
+def test_startup_is_lazy():
+    # a fresh interpreter (as a gunicorn worker) imports the app and serves a request with every db
+    # connection failing; timing is left to benchmarks/bench_startup.py
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP, json.dumps(LAZY_MODULES)], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
+    imported, status = json.loads(result.stdout.splitlines()[-1])
+    assert imported == []
+    assert status == 200
@@ -0,0 +1,38 @@
+import csv
+import io
+import json
+
+from rcg.src.streaming import format_csv, format_ndjson
+
+COLUMNS = ["chart_date", "song_name", "primary"]
+ROWS = [("2023-01-01", f"Song, {i}", i % 2 == 0) for i in range(1200)]
+
+
+def test_ndjson():
+    chunks = list(format_ndjson(COLUMNS, iter(ROWS)))
+    assert len(chunks) == 3  # 500 rows per chunk
+    lines = "".join(chunks).splitlines()
+    assert len(lines) == len(ROWS)
+    assert json.loads(lines[1]) == {"chart_date": "2023-01-01", "song_name": "Song, 1", "primary": False}
+
+
+def test_csv():
+    chunks = list(format_csv(COLUMNS, iter(ROWS)))
+    assert chunks[0] == "chart_date,song_name,primary\r\n"
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows[1] == ["2023-01-01", "Song, 0", "True"]
+    assert len(rows) == len(ROWS) + 1
+
+
+def test_rows_are_read_lazily():
+    consumed = []
+
+    def rows():
+        for row in ROWS:
+            consumed.append(row)
+            yield row
+    stream = format_csv(COLUMNS, rows(), chunk_rows=10)
+    next(stream)
+    assert consumed == []  # the header goes out before the query is read
+    next(stream)
+    assert len(consumed) == 10
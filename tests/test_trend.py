@@ -0,0 +1,42 @@
+from rcg.src.trend import make_daily_frame, summarize_trend
+
+ROWS = [
+    (f"2022-12-{day:02d}", gender, credits)
+    for day in range(1, 32)
+    for gender, credits in [("m", 60), ("f", 15), ("n", 5), (None, 20)]
+]
+
+
+def test_daily_points():
+    points = summarize_trend(make_daily_frame(ROWS), "2022-12-10", "2022-12-12")
+    assert [p["date"] for p in points] == ["2022-12-10", "2022-12-11", "2022-12-12"]
+    # unknown genders count towards the total, as in get_chart_stats
+    assert points[0]["m"] == {"Total": 60, "Normalized": 60}
+    assert points[0]["n"] == {"Total": 5, "Normalized": 5}
+
+
+def test_weekly_points_average_per_chart():
+    points = summarize_trend(make_daily_frame(ROWS), "2022-12-01", "2022-12-31", "weekly")
+    assert points[1]["date"] == "2022-12-05"
+    assert points[1]["days"] == 7
+    assert points[1]["f"] == {"Total": 15, "Normalized": 15}
+    assert sum(p["days"] for p in points) == 31
+
+
+def test_monthly_skips_empty_periods():
+    rows = ROWS + [("2023-02-01", "m", 10)]
+    points = summarize_trend(make_daily_frame(rows), "2022-12-01", "2023-02-28", "monthly")
+    assert [p["date"] for p in points] == ["2022-12-01", "2023-02-01"]
+    assert points[1]["m"]["Normalized"] == 100
+
+
+def test_downsampled_to_max_points():
+    points = summarize_trend(make_daily_frame(ROWS), "2022-12-01", "2022-12-31", max_points=10)
+    assert len(points) <= 10
+    assert sum(p["days"] for p in points) == 31
+    assert all(p["m"]["Total"] == 60 for p in points)
+
+
+def test_empty_range():
+    assert summarize_trend(make_daily_frame(ROWS), "2023-06-01", "2023-06-30") == []
+    assert summarize_trend(make_daily_frame([]), "2022-12-01", "2022-12-31", "weekly") == []